@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import signal
+from concurrent.futures import ThreadPoolExecutor
+
+
+# AutoScaler.run as an asyncio daemon: the three stages of a cycle are independent tasks connected by bounded queues,
+# so a slow container creation / removal or HaProxy restart does not stop the stats collection and the decisions
+#   collect -> every "cycleInterval" seconds the stats of the web servers are read (AutoScaler.readStats, in the
+#              executor). The stats queue holds one reading: a reading not decided yet is replaced by the newer one
+#   decide  -> scores and scaling plan on the event loop thread (AutoScaler.decide, no I/O). The drained web servers
+#              are marked right away and the web servers to add are counted as pending, so the next decisions take
+#              the actuations in flight into account
+#   actuate -> the Docker / HaProxy calls of the decisions (AutoScaler.actuate, in the executor), one after the other.
+#              An actuation which only pushes weights is skipped while another one is queued or running (the next
+#              decision has fresher weights)
+# On start the web servers left by a previous run are taken back (AutoScaler.reconcileWebServers), the initial
+# scenario is only deployed when there is none.
+class AutoScalerDaemon:
+    def __init__(self, autoScaler, cycleInterval, actuationQueueSize, maxWorkers, shutdownTimeout):
+        self.autoScaler = autoScaler
+        self.metrics = autoScaler.metrics
+        self.cycleInterval = cycleInterval
+        self.actuationQueueSize = actuationQueueSize
+        self.shutdownTimeout = shutdownTimeout
+        self.executor = ThreadPoolExecutor(max_workers=maxWorkers, thread_name_prefix="autoscaler")
+        # Created in run() (they belong to its event loop)
+        self.statsQueue = None
+        self.actuationQueue = None
+        self.stopEvent = None
+        self.isActuating = False
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.statsQueue = asyncio.Queue(maxsize=1)
+        self.actuationQueue = asyncio.Queue(maxsize=self.actuationQueueSize)
+        self.stopEvent = asyncio.Event()
+        for signalNumber in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signalNumber, self.stop)
+            except (NotImplementedError, RuntimeError, ValueError):
+                # Not the main thread (or no signal support), stop() is called by the owner
+                pass
+        await loop.run_in_executor(self.executor, self.startAutoScaler)
+        logging.info("**** STARTING THE AUTOSCALER DAEMON ****")
+        tasks = [asyncio.ensure_future(self.collectLoop()), asyncio.ensure_future(self.decideLoop()),
+                 asyncio.ensure_future(self.actuateLoop())]
+        await self.stopEvent.wait()
+        await self.shutdown(tasks)
+
+    def startAutoScaler(self):
+        numberOfWebServers = self.autoScaler.reconcileWebServers()
+        if numberOfWebServers > 0:
+            logging.info(str(numberOfWebServers) + " web server(s) taken back from the previous run")
+        else:
+            self.autoScaler.deployInitialScenario()
+
+    def stop(self):
+        if self.stopEvent is not None:
+            self.stopEvent.set()
+
+    async def collectLoop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            startTime = loop.time()
+            stopwatch = self.metrics.stopwatch("autoscaler_stage_seconds", "stage")
+            webServerObjArray = self.autoScaler.refreshWebServers()
+            try:
+                results = await loop.run_in_executor(self.executor, self.autoScaler.readStats, webServerObjArray)
+            except Exception as e:
+                logging.error("Could not read the stats: " + str(e))
+                results = None
+            stopwatch.lap("ingestion")
+            if results is not None:
+                if self.statsQueue.full():
+                    # The decision is slower than the collection, only the latest stats are decided on
+                    self.statsQueue.get_nowait()
+                    self.metrics.inc("autoscaler_dropped_stats_total")
+                self.statsQueue.put_nowait(results)
+            await asyncio.sleep(max(0.0, self.cycleInterval - (loop.time() - startTime)))
+
+    async def decideLoop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            results = await self.statsQueue.get()
+            stopwatch = self.metrics.stopwatch("autoscaler_stage_seconds", "stage")
+            try:
+                self.autoScaler.metricIngestor.apply(results)
+                actuation = self.autoScaler.decide(stopwatch)
+            except Exception as e:
+                logging.error("Decision failed: " + str(e))
+                continue
+            if not actuation.changesBalancer() and (self.isActuating or not self.actuationQueue.empty()):
+                self.metrics.inc("autoscaler_skipped_actuations_total")
+                continue
+            actuation.decidedAt = loop.time()
+            # Blocks the decisions only when "actuationQueueSize" balancer changes are already waiting
+            await self.actuationQueue.put(actuation)
+            self.metrics.setValue("autoscaler_queue_size", self.actuationQueue.qsize(), {'queue': "actuation"})
+
+    async def actuateLoop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            actuation = await self.actuationQueue.get()
+            self.isActuating = True
+            stopwatch = self.metrics.stopwatch("autoscaler_stage_seconds", "stage")
+            try:
+                await loop.run_in_executor(self.executor, self.autoScaler.actuate, actuation, stopwatch)
+            except Exception as e:
+                logging.error("Actuation failed: " + str(e))
+            finally:
+                self.isActuating = False
+                self.metrics.observe("autoscaler_actuation_lag_seconds", loop.time() - actuation.decidedAt)
+                self.metrics.setValue("autoscaler_queue_size", self.actuationQueue.qsize(), {'queue': "actuation"})
+                self.actuationQueue.task_done()
+
+    async def shutdown(self, tasks):
+        logging.info("**** STOPPING THE AUTOSCALER DAEMON ****")
+        collectTask, decideTask, actuateTask = tasks
+        # No new stats nor decisions, the actuations already decided are finished (their web servers are
+        # registered / drained, so the next start takes them back in a known state)
+        collectTask.cancel()
+        decideTask.cancel()
+        try:
+            await asyncio.wait_for(self.actuationQueue.join(), self.shutdownTimeout)
+        except asyncio.TimeoutError:
+            logging.warning(str(self.actuationQueue.qsize()) + " actuation(s) not done at shutdown")
+        actuateTask.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.get_running_loop().run_in_executor(self.executor, self.autoScaler.shutdown)
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,115 @@
+import heapq
+import threading
+
+
+# Every web server the autoscaler knows, by state:
+#   live     -> in the load balancer (deathFlag = False)
+#   draining -> out of the load balancer, container not removed yet (deathFlag = True, isDead = False)
+#   dead     -> container removed (isDead = True), kept until the next compact()
+# Web server n is named "<namePrefix><n>" and published on "portBase + n". The number of a dead web server goes back
+# to a free-list (lowest first) and is reused by the next allocate(), so names and ports stay in a small range and
+# the per cycle lists only hold the live and draining web servers, whatever the scaling history.
+# The registry is shared by the decision and the actuation stages of AutoScalerDaemon (different threads), every
+# method holds the lock.
+# With a FleetState, a web server gets its row when it is added and gives it back when it is dropped by compact()
+class BackendRegistry:
+    def __init__(self, namePrefix, portBase, fleetState=None):
+        self.namePrefix = namePrefix
+        self.portBase = portBase
+        self.fleetState = fleetState
+        # {'app1': WebServer} in insertion order
+        self.live = {}
+        self.draining = {}
+        self.dead = {}
+        # {'app1': 1}
+        self.numberByName = {}
+        self.freeNumbers = []
+        self.nextNumber = 1
+        self.lock = threading.RLock()
+
+    def allocate(self, isNameTaken=None):
+        # Output: (name, port) of the next web server
+        # isNameTaken(name) -> bool, e.g. the container of a previous web server with this name still exists
+        with self.lock:
+            skipped = []
+            try:
+                while True:
+                    if self.freeNumbers:
+                        number = heapq.heappop(self.freeNumbers)
+                    else:
+                        number = self.nextNumber
+                        self.nextNumber += 1
+                    name = self.namePrefix + str(number)
+                    if isNameTaken is not None and isNameTaken(name):
+                        skipped.append(number)
+                        continue
+                    return name, self.portBase + number
+            finally:
+                for number in skipped:
+                    heapq.heappush(self.freeNumbers, number)
+
+    def add(self, webServer):
+        # The number of a web server which was not allocated here (taken back from a previous run, see
+        # AutoScaler.reconcileWebServers) is taken out of the free numbers
+        number = int(webServer.name[len(self.namePrefix):])
+        with self.lock:
+            if number >= self.nextNumber:
+                for freeNumber in range(self.nextNumber, number):
+                    heapq.heappush(self.freeNumbers, freeNumber)
+                self.nextNumber = number + 1
+            elif number in self.freeNumbers:
+                self.freeNumbers.remove(number)
+                heapq.heapify(self.freeNumbers)
+            self.numberByName[webServer.name] = number
+            self.live[webServer.name] = webServer
+            if self.fleetState is not None:
+                self.fleetState.addRow(webServer)
+
+    def get(self, name):
+        with self.lock:
+            return self.live.get(name) or self.draining.get(name) or self.dead.get(name)
+
+    def markDraining(self, webServer):
+        with self.lock:
+            webServer.setDeathFlag(True)
+            if self.live.pop(webServer.name, None) is not None:
+                self.draining[webServer.name] = webServer
+
+    def markDead(self, webServer):
+        with self.lock:
+            webServer.setDeathFlag(True)
+            webServer.setIsDead(True)
+            self.live.pop(webServer.name, None)
+            self.draining.pop(webServer.name, None)
+            self.dead[webServer.name] = webServer
+
+    def compact(self):
+        # Web servers whose flags were changed outside of the registry (e.g. removed by the DrainManager thread)
+        # are moved to their set, then the dead ones are dropped and their numbers freed
+        # Output: the dropped web servers
+        with self.lock:
+            for webServer in [webServer for webServer in self.live.values() if webServer.getDeathFlag()]:
+                self.markDraining(webServer)
+            for webServer in [webServer for webServer in self.draining.values() if webServer.getIsDead()]:
+                self.markDead(webServer)
+            for name in self.dead:
+                heapq.heappush(self.freeNumbers, self.numberByName.pop(name))
+            droppedWebServers = list(self.dead.values())
+            if self.fleetState is not None:
+                for webServer in droppedWebServers:
+                    self.fleetState.removeRow(webServer)
+            self.dead = {}
+            return droppedWebServers
+
+    def webServers(self):
+        # Live then draining web servers (the list used by a control loop cycle)
+        with self.lock:
+            return list(self.live.values()) + list(self.draining.values())
+
+    def liveWebServers(self):
+        with self.lock:
+            return list(self.live.values())
+
+    def __len__(self):
+        with self.lock:
+            return len(self.live) + len(self.draining)
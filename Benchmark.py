@@ -0,0 +1,223 @@
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import Main
+from HaproxyRuntime import HaproxyRuntimeApi, HaproxyRuntimeModifier
+from Simulator import DiurnalProfile, FakeDockerClient, FakeHaproxyAdminSocket, FakeOsCommandRunner, RampProfile, \
+    SimClock, Simulator, SpikeProfile
+from WarmPool import WarmPoolManager
+
+# Benchmark of the autoscaler (Main.AutoScaler) against the simulator (Simulator.py), no Docker/HaProxy needed
+#   python Benchmark.py [scenario name ...]
+# For every scenario it reports:
+#   - control loop cycle time (real milliseconds of AutoScaler.runCycle) and the mean time of each stage
+#     (autoscaler_stage_seconds of AutoScaler.metrics, see Instrumentation.py)
+#   - reaction latency: simulated seconds from the load change to the first scale up decision, and to the first
+#     extra web server serving requests
+#   - over/under provisioning: simulated web-server-seconds above/below the number of web servers needed to keep
+#     every httpd under "targetUtilization"
+#   - dropped requests (sent to a booting container or with no server at all), HaProxy reloads, Docker API calls
+#   - drained web servers removed with no session left / at the drain timeout (DrainManager.py)
+#   - the highest number of containers seen on every Docker host (placement, see DockerHostPool)
+#   - predictive scale ups (Forecaster.py) and how far ahead of the reactive rule they fired: every scenario is
+#     also run with the reactive rule only (ForecastEnabled = False) and the first scale up decisions are compared
+
+# Simulated time runs "Speedup" times faster than the wall clock
+Speedup = 10
+BootSeconds = 5
+# Memory of every simulated Docker host, the "-3hosts" scenarios use 3 small hosts so the placement has to spread
+# the web servers (a container has a 1 GB memory limit)
+HostMemory = 16 * 1024 ** 3
+SmallHostMemory = 4 * 1024 ** 3
+# name: (traffic profile, duration in simulated seconds, number of Docker hosts, memory of every host)
+Scenarios = {
+    'ramp': (RampProfile(200, 3000, rampStart=20, rampDuration=120), 200, 1, HostMemory),
+    'spike': (SpikeProfile(200, 3000, spikeStart=30, spikeDuration=120), 200, 1, HostMemory),
+    'diurnal': (DiurnalProfile(1200, 1000, period=240), 240, 1, HostMemory),
+    'spike-3hosts': (SpikeProfile(200, 3000, spikeStart=30, spikeDuration=120), 200, 3, SmallHostMemory),
+}
+
+
+class BenchmarkResult:
+    def __init__(self, name):
+        self.name = name
+        self.cycleTimes = []
+        # {'ingestion': mean seconds}
+        self.stageMeans = {}
+        self.firstScaleUpDecision = None
+        self.firstExtraCapacity = None
+        self.simulator = None
+        self.numberOfRestarts = 0
+        self.numberOfApiCalls = 0
+        self.numberOfPredictiveScaleUps = 0
+        self.numberOfRemovedIdle = 0
+        self.numberOfRemovedTimeout = 0
+        self.leadTimes = []
+        self.reactiveOnly = None
+        # {'10.0.0.1': highest number of containers}
+        self.maxContainersByHost = {}
+
+    def percentile(self, p):
+        if not self.cycleTimes:
+            return 0
+        values = sorted(self.cycleTimes)
+        return values[min(len(values) - 1, int(len(values) * p))]
+
+    def report(self):
+        simulator = self.simulator
+        lines = ["---------------------------------------- " + self.name,
+                 "cycles                      " + str(len(self.cycleTimes)),
+                 "cycle time ms (p50/p95/max) " + "%.2f / %.2f / %.2f" % (
+                     self.percentile(0.5) * 1000, self.percentile(0.95) * 1000,
+                     max(self.cycleTimes or [0]) * 1000),
+                 "stage ms (mean)             " + " ".join(
+                     stage + "=" + "%.2f" % (mean * 1000) for stage, mean in self.stageMeans.items()),
+                 "reaction: scale up decision " + formatSeconds(self.firstScaleUpDecision),
+                 "reaction: extra capacity    " + formatSeconds(self.firstExtraCapacity),
+                 "over provisioned  (srv-s)   " + "%.1f" % simulator.overProvisionedSeconds,
+                 "under provisioned (srv-s)   " + "%.1f" % simulator.underProvisionedSeconds,
+                 "dropped requests            " + "%.0f of %.0f" % (simulator.droppedRequests,
+                                                                    simulator.offeredRequests),
+                 "HaProxy reloads             " + str(self.numberOfRestarts),
+                 "Docker API calls            " + str(self.numberOfApiCalls),
+                 "drained (idle / timeout)    " + str(self.numberOfRemovedIdle) + " / " +
+                 str(self.numberOfRemovedTimeout),
+                 "max containers per host     " + " ".join(
+                     hostAddress + "=" + str(count) for hostAddress, count in sorted(self.maxContainersByHost.items())),
+                 "predictive scale ups        " + str(self.numberOfPredictiveScaleUps),
+                 "predictive lead (mean)      " + formatSeconds(
+                     sum(self.leadTimes) / len(self.leadTimes) if self.leadTimes else None)]
+        if self.reactiveOnly is not None:
+            lead = None
+            if self.firstScaleUpDecision is not None and self.reactiveOnly.firstScaleUpDecision is not None:
+                lead = self.reactiveOnly.firstScaleUpDecision - self.firstScaleUpDecision
+            lines += ["reactive only: decision     " + formatSeconds(self.reactiveOnly.firstScaleUpDecision),
+                      "reactive only: over/under   " + "%.1f / %.1f" % (
+                          self.reactiveOnly.simulator.overProvisionedSeconds,
+                          self.reactiveOnly.simulator.underProvisionedSeconds),
+                      "first decision ahead by     " + formatSeconds(lead)]
+        return "\n".join(lines)
+
+
+def formatSeconds(seconds):
+    if seconds is None:
+        return "-"
+    return "%.1f s" % seconds
+
+
+def scaleConstantsToSimulation(clock):
+    # The control loop constants are in real seconds, the simulation runs "Speedup" times faster
+    Main.CycleInterval = clock.toRealSeconds(1)
+    Main.IngestionDeadline = clock.toRealSeconds(0.5)
+    Main.IngestionPollInterval = clock.toRealSeconds(0.05)
+    Main.StaleStatsAge = clock.toRealSeconds(3)
+    Main.MaxStatsAge = clock.toRealSeconds(10)
+    Main.WeightSyncMinInterval = clock.toRealSeconds(5)
+    Main.WarmPoolAdaptiveWindow = clock.toRealSeconds(300)
+    Main.ForecastHorizon = clock.toRealSeconds(BootSeconds)
+    Main.ForecastLeadWindow = clock.toRealSeconds(30)
+    Main.ScaleUpCooldown = clock.toRealSeconds(10)
+    Main.ScaleDownCooldown = clock.toRealSeconds(30)
+    Main.DrainTimeout = clock.toRealSeconds(60)
+    Main.DrainPollInterval = clock.toRealSeconds(1)
+
+
+def runScenario(name, profile, durationSeconds, numberOfHosts=1, hostMemory=HostMemory, forecastEnabled=True):
+    Main.ForecastEnabled = forecastEnabled
+    result = BenchmarkResult(name)
+    workFolder = tempfile.mkdtemp(prefix="autoscaler-bench-")
+    logsFolderPath = os.path.join(workFolder, "logs") + os.sep
+    os.makedirs(logsFolderPath)
+    configFilePath = os.path.join(workFolder, "haproxy.cfg")
+    socketPath = os.path.join(workFolder, "admin.sock")
+
+    clock = SimClock(Speedup)
+    scaleConstantsToSimulation(clock)
+    dockerClients = [FakeDockerClient(clock, BootSeconds, hostAddress="10.0.0." + str(i + 1), memoryTotal=hostMemory)
+                     for i in range(numberOfHosts)]
+    fakeHaproxy = FakeHaproxyAdminSocket(socketPath, Main.HaProxyBackendName)
+    fakeHaproxy.start()
+    simulator = Simulator(clock, dockerClients, fakeHaproxy, profile, logsFolderPath)
+    result.simulator = simulator
+
+    dockerUtils = Main.DockerHostPool([Main.DockerUtil(dockerClient, hostAddress=dockerClient.hostAddress)
+                                       for dockerClient in dockerClients],
+                                      Main.PlacementScheduler(Main.DockerHostMaxCpu, Main.DockerHostMaxMemory))
+    haproxyConfigModifier = Main.HaproxyConfigModifier(configFilePath)
+    haproxyRuntimeModifier = HaproxyRuntimeModifier(HaproxyRuntimeApi(socketPath), haproxyConfigModifier,
+                                                    Main.HaProxyInitConfigFile, Main.HaProxyBackendName,
+                                                    Main.HaProxyServerSlots)
+    osCommandRunner = FakeOsCommandRunner(fakeHaproxy, configFilePath)
+    warmPoolManager = WarmPoolManager(dockerUtils, "httpd_final", 1000000000, Main.ServerIpAddress,
+                                      Main.WarmPoolNamePrefix, Main.WarmPoolPortBase, Main.WarmPoolSize,
+                                      Main.WarmPoolMaxSize, Main.WarmPoolAdaptiveWindow,
+                                      bootTimeout=clock.toRealSeconds(BootSeconds * 4),
+                                      healthCheck=simulator.isReady, failureBackoff=clock.toRealSeconds(10))
+    metricIngestor = Main.MetricIngestor(logsFolderPath, Main.IngestionDeadline, Main.IngestionPollInterval,
+                                         Main.IngestionMaxWorkers, maxStatsAge=Main.MaxStatsAge,
+                                         staleStatsAge=Main.StaleStatsAge)
+    autoScaler = Main.AutoScaler(dockerUtils, osCommandRunner, haproxyConfigModifier, haproxyRuntimeModifier,
+                                 metricIngestor, warmPoolManager)
+    try:
+        autoScaler.deployInitialScenario(createSender=False)
+        # The soft reload does not wait, the traffic starts once the first web server has booted
+        firstWebServer = autoScaler.backendRegistry.webServers()[0]
+        while not simulator.isReady(firstWebServer.hostAddress, firstWebServer.mappedPort):
+            time.sleep(0.01)
+        simulator.start()
+        servingAtChange = None
+        while clock.now() < durationSeconds:
+            startTime = time.perf_counter()
+            fleetDecision = autoScaler.runCycle()
+            result.cycleTimes.append(time.perf_counter() - startTime)
+            if fleetDecision.predictiveScaleUp:
+                result.numberOfPredictiveScaleUps += 1
+            for dockerClient in dockerClients:
+                result.maxContainersByHost[dockerClient.hostAddress] = max(
+                    result.maxContainersByHost.get(dockerClient.hostAddress, 0), len(dockerClient.containersByName))
+            now = clock.now()
+            if now >= profile.changeTime:
+                if servingAtChange is None:
+                    servingAtChange = simulator.servingHistory[-1][1] if simulator.servingHistory else 1
+                if result.firstScaleUpDecision is None and fleetDecision.scaleUp:
+                    result.firstScaleUpDecision = now - profile.changeTime
+                if result.firstExtraCapacity is None and simulator.servingHistory and \
+                        simulator.servingHistory[-1][1] > servingAtChange:
+                    result.firstExtraCapacity = simulator.servingHistory[-1][0] - profile.changeTime
+            time.sleep(Main.CycleInterval)
+    finally:
+        simulator.stop()
+        autoScaler.drainManager.shutdown()
+        warmPoolManager.shutdown()
+        metricIngestor.shutdown()
+        dockerUtils.stopEventWatcher()
+        for dockerClient in dockerClients:
+            dockerClient.close()
+        fakeHaproxy.stop()
+        shutil.rmtree(workFolder, ignore_errors=True)
+    result.numberOfRestarts = osCommandRunner.numberOfRestarts
+    result.numberOfApiCalls = sum(dockerClient.numberOfApiCalls for dockerClient in dockerClients)
+    result.numberOfRemovedIdle = autoScaler.drainManager.numberOfRemovedIdle
+    result.numberOfRemovedTimeout = autoScaler.drainManager.numberOfRemovedTimeout
+    # Lead times are measured on the wall clock of the control loop
+    result.leadTimes = [leadTime * Speedup for leadTime in autoScaler.scoreForecaster.leadTimes]
+    for stage in ("ingestion", "scoring", "planning", "weights", "scale_up", "balancer"):
+        histogram = autoScaler.metrics.get("autoscaler_stage_seconds", {'stage': stage})
+        if histogram is not None:
+            result.stageMeans[stage] = histogram.mean()
+    return result
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.ERROR)
+    names = sys.argv[1:] or sorted(Scenarios)
+    for name in names:
+        profile, durationSeconds, numberOfHosts, hostMemory = Scenarios[name]
+        reactiveOnly = runScenario(name, profile, durationSeconds, numberOfHosts, hostMemory, forecastEnabled=False)
+        result = runScenario(name, profile, durationSeconds, numberOfHosts, hostMemory)
+        result.reactiveOnly = reactiveOnly
+        print(result.report())
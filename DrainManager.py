@@ -0,0 +1,105 @@
+import logging
+import threading
+import time
+
+from HaproxyConfig import HaproxyConfigError
+from HaproxyRuntime import HaproxyRuntimeError
+
+
+# Removal of the web servers taken out of the load balancer (SECTION 4) driven by HaProxy itself: the server is in
+# "drain" state (no new connection), its current sessions are read from "show stat" and the container is removed
+# as soon as no session is left, or after "timeout" seconds. Everything runs in a background thread, the control loop
+# only hands over the drained web servers and does not poll their log files anymore.
+class DrainManager:
+    def __init__(self, runtimeModifier, dockerUtil, metricIngestor, timeout, pollInterval):
+        self.runtimeModifier = runtimeModifier
+        self.dockerUtil = dockerUtil
+        self.metricIngestor = metricIngestor
+        self.timeout = timeout
+        self.pollInterval = pollInterval
+        # {'app3': (WebServer, time.monotonic() of the drain start)}
+        self.drainingWebServers = {}
+        self.numberOfRemovedIdle = 0
+        self.numberOfRemovedTimeout = 0
+        self.lock = threading.Lock()
+        self.wakeUpEvent = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.pollLoop, name="drain-manager", daemon=True)
+        self.thread.start()
+
+    def startDraining(self, webServerObjArray):
+        # The web servers are already in "drain" state in HaProxy (see HaproxyRuntimeModifier.applyChanges)
+        now = time.monotonic()
+        with self.lock:
+            for webServer in webServerObjArray:
+                if webServer.name not in self.drainingWebServers:
+                    self.drainingWebServers[webServer.name] = (webServer, now)
+        self.wakeUpEvent.set()
+
+    def isDraining(self, webServerName):
+        with self.lock:
+            return webServerName in self.drainingWebServers
+
+    def pollLoop(self):
+        while not self.stopped.is_set():
+            self.wakeUpEvent.wait(timeout=self.pollInterval)
+            self.wakeUpEvent.clear()
+            if self.stopped.is_set():
+                break
+            with self.lock:
+                draining = list(self.drainingWebServers.values())
+            if draining:
+                self.poll(draining)
+
+    def readSessions(self):
+        # Output: {'slot3': 2} current sessions + queued requests of every server of the backend,
+        # None if HaProxy could not be read
+        try:
+            rows = self.runtimeModifier.runtimeApi.showStat()
+        except HaproxyRuntimeError as e:
+            logging.error(e)
+            return None
+        sessions = {}
+        for row in rows:
+            if row.get("pxname") == self.runtimeModifier.backendName:
+                try:
+                    sessions[row.get("svname")] = int(row.get("scur") or 0) + int(row.get("qcur") or 0)
+                except ValueError:
+                    continue
+        return sessions
+
+    def poll(self, draining):
+        sessions = self.readSessions()
+        now = time.monotonic()
+        for webServer, drainStartTime in draining:
+            slotName = self.runtimeModifier.getSlotName(webServer.name)
+            if sessions is not None and (slotName is None or sessions.get(slotName, 0) == 0):
+                self.numberOfRemovedIdle += 1
+                self.finishDraining(webServer, "no session left")
+            elif now - drainStartTime >= self.timeout:
+                self.numberOfRemovedTimeout += 1
+                self.finishDraining(webServer, "drain timeout, " + str(
+                    sessions.get(slotName) if sessions is not None else "unknown") + " session(s) left")
+
+    def finishDraining(self, webServer, reason):
+        # Container physically removal
+        webServer.setIsDead(True)
+        try:
+            self.runtimeModifier.removeWebServer(webServer.name)
+        except (HaproxyConfigError, HaproxyRuntimeError) as e:
+            # The slot is freed in the local slots anyway (and in the config file unless HaProxy rejected it)
+            logging.error(e)
+        self.dockerUtil.removeCountainer(webServer.name)
+        self.metricIngestor.forget(webServer.name)
+        with self.lock:
+            self.drainingWebServers.pop(webServer.name, None)
+        logging.info("Web Server " + webServer.name + " has been removed (" + reason + ")")
+
+    def shutdown(self):
+        self.stopped.set()
+        self.wakeUpEvent.set()
+        if self.thread is not None:
+            self.thread.join()
@@ -0,0 +1,218 @@
+import heapq
+import threading
+
+import numpy as np
+
+# Lowest score used for the weights (1 / score)
+MinScore = 0.01
+# Arrays of the numbers per web server: [initial value, dtype]
+Fields = {
+    'cpu': [-1.0, float], 'memoryUsage': [-1.0, float], 'busyThreadsCount': [-1.0, float],
+    'processingReqTime': [-1.0, float],
+    # Input + output bytes per second
+    'networkRate': [0.0, float],
+    'score': [0.0, float], 'weight': [0.0, float], 'scaleUpFlag': [False, bool], 'scaleDownFlag': [False, bool],
+    'hasStats': [False, bool], 'deathFlag': [False, bool], 'isDead': [False, bool],
+}
+
+
+# Scores, flags and weights of all web servers computed in one batched pass (struct-of-arrays, one row per web
+# server). The arrays are where the numbers of a registered web server live: its FleetField attributes read and
+# write its row (see FleetState.addRow), so the ingestion writes the stats straight into the arrays and the decision
+# reads the results from there, nothing is copied between the objects and the arrays per cycle.
+# The results are the same as the per-object calculation of WebServer.calcucateScoreAndFlags + the loops of
+# SECTION 2 in Main.py, the web servers being taken in row order (the sums up to the rounding of np.sum, the scores
+# below MinScore are raised to it for the weights):
+#   score = X * ((memoryUsage + cpu) / 2) + Y * (busyThreadsCount / 4) + Z * (processingReqTime / maxProcessingTime)
+#           [+ N * (networkRate / maxNetworkRate * 100) + M * memoryUsage]   (optional terms, skipped when N / M = 0)
+class FleetDecision:
+    def __init__(self):
+        self.sumOfAllInvertedScore = 0
+        self.sumOfAllScores = 0
+        self.numberOfCurrentAliveWebServers = 0
+        self.numberOfScaleUpFlag = 0
+        self.numberOfScaleDownFlag = 0
+        self.highestWeight = -1
+        self.lowestScore = 9999
+        self.lowestScoreIndex = -1
+        self.lowestScoreWebServerName = ''
+        self.scaleUp = False
+        self.scaleDown = False
+        # True when the scale up comes from the forecast only (see Forecaster.py), with the projected average score
+        self.predictiveScaleUp = False
+        self.projectedAverageScore = None
+        # Rows of the web servers with death flag which can be removed physically (busyThreadsCount < 4)
+        self.removableIndexes = []
+
+
+class FleetField:
+    # Attribute of a WebServer kept in the array "name" of its FleetState row once it is registered, in the object
+    # itself before (and after removeRow)
+    def __init__(self, cast):
+        self.cast = cast
+
+    def __set_name__(self, owner, name):
+        self.name = name
+        self.localName = "_" + name
+
+    def __get__(self, webServer, owner):
+        if webServer is None:
+            return self
+        fleetState = webServer.fleetState
+        if fleetState is None:
+            return getattr(webServer, self.localName)
+        return self.cast(getattr(fleetState, self.name)[webServer.fleetRow])
+
+    def __set__(self, webServer, value):
+        fleetState = webServer.fleetState
+        if fleetState is None:
+            setattr(webServer, self.localName, value)
+            return
+        with fleetState.lock:
+            getattr(fleetState, self.name)[webServer.fleetRow] = value
+
+
+class FleetState:
+    # Rows are given by addRow and reused after removeRow (free-list, lowest first), "size" is the number of rows
+    # ever used. A removed row is marked dead so it is left out of every calculation
+    def __init__(self, capacity=64):
+        self.size = 0
+        self.capacity = capacity
+        # WebServer and name of every row (None -> free row)
+        self.webServers = []
+        self.names = []
+        self.freeRows = []
+        # Held by the writes and by evaluate, a resize swaps every array for a copy
+        self.lock = threading.RLock()
+        for field, (initialValue, dtype) in Fields.items():
+            setattr(self, field, np.full(capacity, initialValue, dtype=dtype))
+
+    def resize(self, size):
+        if size > self.capacity:
+            capacity = self.capacity
+            while capacity < size:
+                capacity *= 2
+            # Each array is replaced by a complete copy, a reader gets either the old or the new one
+            for field, (initialValue, dtype) in Fields.items():
+                array = np.full(capacity, initialValue, dtype=dtype)
+                array[:self.size] = getattr(self, field)[:self.size]
+                setattr(self, field, array)
+            self.capacity = capacity
+        self.size = size
+
+    def addRow(self, webServer):
+        # The current values of the web server are written to its row, from now on they live there
+        with self.lock:
+            if self.freeRows:
+                row = heapq.heappop(self.freeRows)
+            else:
+                row = self.size
+                self.resize(self.size + 1)
+                self.webServers.append(None)
+                self.names.append(None)
+            self.webServers[row] = webServer
+            self.names[row] = webServer.name
+            for field in Fields:
+                if field in ('networkRate', 'hasStats'):
+                    continue
+                getattr(self, field)[row] = getattr(webServer, field)
+            self.setStatus(row, max(webServer.inputRate, 0) + max(webServer.outPutRate, 0), webServer.hasStats())
+            webServer.fleetRow = row
+            webServer.fleetState = self
+            return row
+
+    def removeRow(self, webServer):
+        # The last values go back to the object, the row is freed
+        with self.lock:
+            if webServer.fleetState is not self:
+                return
+            row = webServer.fleetRow
+            values = {field: getattr(webServer, field) for field in Fields
+                      if field not in ('networkRate', 'hasStats')}
+            webServer.fleetState = None
+            webServer.fleetRow = None
+            for field, value in values.items():
+                setattr(webServer, field, value)
+            self.webServers[row] = None
+            self.names[row] = None
+            self.isDead[row] = True
+            self.hasStats[row] = False
+            heapq.heappush(self.freeRows, row)
+
+    def setStatus(self, row, networkRate, hasStats):
+        # The numbers of the row which are not a WebServer attribute
+        with self.lock:
+            self.networkRate[row] = networkRate
+            self.hasStats[row] = hasStats
+
+    def evaluate(self, X, Y, Z, maxProcessingTime, scaleUpThr, scaleDownThr, scaleUpAverageThr, N=0, M=0,
+                 maxNetworkRate=1):
+        decision = FleetDecision()
+        # No write between the masks and the results
+        with self.lock:
+            n = self.size
+            if n == 0:
+                return decision
+            # Web servers which get a score (the ones with death flag too, they are part of the inverted score sum)
+            scored = ~self.isDead[:n] & self.hasStats[:n]
+            # Web servers which are in the load balancer
+            active = scored & ~self.deathFlag[:n]
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                score = X * ((self.memoryUsage[:n] + self.cpu[:n]) / 2) + Y * (self.busyThreadsCount[:n] / 4) + Z * (
+                        self.processingReqTime[:n] / maxProcessingTime)
+                if N:
+                    score = score + N * (self.networkRate[:n] / maxNetworkRate * 100)
+                if M:
+                    score = score + M * self.memoryUsage[:n]
+                np.copyto(self.score[:n], score, where=scored)
+                scaleUpFlag = self.score[:n] > scaleUpThr
+                scaleDownFlag = ~scaleUpFlag & (self.score[:n] < scaleDownThr)
+                np.copyto(self.scaleUpFlag[:n], scaleUpFlag, where=scored)
+                np.copyto(self.scaleDownFlag[:n], scaleDownFlag, where=scored)
+
+                # An idle web server (score 0) is weighted as if its score was MinScore, the weights stay finite
+                invertedScore = 1 / np.maximum(self.score[:n], MinScore)
+                if scored.any():
+                    decision.sumOfAllInvertedScore = float(np.sum(invertedScore[scored]))
+                np.copyto(self.weight[:n], (invertedScore / decision.sumOfAllInvertedScore) * 100, where=active)
+
+            activeIndexes = np.flatnonzero(active)
+            decision.numberOfCurrentAliveWebServers = len(activeIndexes)
+            if len(activeIndexes) > 0:
+                activeScores = self.score[activeIndexes]
+                decision.sumOfAllScores = float(np.sum(activeScores))
+                decision.highestWeight = float(self.weight[activeIndexes].max())
+                decision.numberOfScaleUpFlag = int(self.scaleUpFlag[activeIndexes].sum())
+                decision.numberOfScaleDownFlag = int(self.scaleDownFlag[activeIndexes].sum())
+                # Drain candidate: the last web server with the lowest score (same tie breaking as the scalar loop)
+                lowestScore = activeScores.min()
+                if lowestScore <= 9999:
+                    position = len(activeScores) - 1 - int(np.argmax(activeScores[::-1] == lowestScore))
+                    decision.lowestScore = float(lowestScore)
+                    decision.lowestScoreIndex = int(activeIndexes[position])
+                    decision.lowestScoreWebServerName = self.names[decision.lowestScoreIndex]
+                alive = decision.numberOfCurrentAliveWebServers
+                decision.scaleUp = bool(decision.numberOfScaleUpFlag > (alive / 2) or
+                                        (decision.sumOfAllScores / alive) > scaleUpAverageThr)
+                decision.scaleDown = bool(decision.numberOfScaleDownFlag > alive / 2 and alive > 1 and
+                                          decision.lowestScoreWebServerName != '')
+
+            removable = ~self.isDead[:n] & self.deathFlag[:n] & (self.busyThreadsCount[:n] < 4)
+            decision.removableIndexes = np.flatnonzero(removable).tolist()
+        return decision
+
+    def lowestScoreIndexes(self, count):
+        # Drain candidates of a multi-step scale down: the rows of the "count" web servers in the load balancer with
+        # the lowest scores, lowest first (ties: the last one first, same as lowestScoreIndex)
+        n = self.size
+        activeIndexes = np.flatnonzero(~self.isDead[:n] & self.hasStats[:n] & ~self.deathFlag[:n])
+        order = np.lexsort((-activeIndexes, self.score[activeIndexes]))
+        return activeIndexes[order[:count]].tolist()
+
+    def activeWeights(self):
+        # {'app1': weight} of the web servers in the load balancer which have stats
+        n = self.size
+        rows = np.flatnonzero(~self.isDead[:n] & self.hasStats[:n] & ~self.deathFlag[:n]).tolist()
+        names = self.names
+        return dict(zip([names[row] for row in rows], self.weight[rows].tolist()))
@@ -0,0 +1,124 @@
+import logging
+
+
+# Holt linear trend (double exponential smoothing) of one series, O(1) state per series: level + trend per second.
+# Samples may come at irregular intervals, the trend is per second so the forecast horizon is in seconds too
+#   level = alpha * x + (1 - alpha) * (level + trend * dt)
+#   trend = beta * (level - previousLevel) / dt + (1 - beta) * trend
+#   forecast(h) = level + trend * h
+class HoltForecaster:
+    def __init__(self, alpha, beta):
+        self.alpha = alpha
+        self.beta = beta
+        self.level = None
+        self.trend = 0.0
+        self.lastTime = None
+        self.numberOfSamples = 0
+
+    def update(self, t, value):
+        self.numberOfSamples += 1
+        if self.level is None:
+            self.level = value
+            self.lastTime = t
+            return
+        dt = t - self.lastTime
+        if dt <= 0:
+            # Same timestamp (stale stats): only the level is corrected
+            self.level = self.alpha * value + (1 - self.alpha) * self.level
+            return
+        previousLevel = self.level
+        self.level = self.alpha * value + (1 - self.alpha) * (self.level + self.trend * dt)
+        self.trend = self.beta * (self.level - previousLevel) / dt + (1 - self.beta) * self.trend
+        self.lastTime = t
+
+    def forecast(self, horizon):
+        if self.level is None:
+            return None
+        return self.level + self.trend * horizon
+
+
+class ForecastDecision:
+    def __init__(self):
+        self.scaleUp = False
+        # Average score of the web servers in the load balancer in "horizon" seconds (booting ones not counted)
+        self.projectedAverageScore = None
+        self.numberOfProjectedScaleUpFlag = 0
+        # Seconds the predictive rule fired before the reactive one (set on the cycle where the reactive rule fires)
+        self.leadTime = None
+
+
+# Predictive scale up: the score of every web server in the load balancer and the average score of the fleet are
+# forecast "horizon" seconds ahead (the boot time of a new web server) and the SECTION 3 rule is applied to the
+# projected values, so the new web server is ready when the reactive rule would only have started it.
+# Web servers which are still booting (no stats yet) are counted as capacity: the projected scores are scaled by
+# active / (active + booting), otherwise every cycle of a ramp would start one more web server.
+class ScoreForecaster:
+    def __init__(self, alpha, beta, horizon, minSamples, leadWindow):
+        self.alpha = alpha
+        self.beta = beta
+        self.horizon = horizon
+        self.minSamples = minSamples
+        # A reactive scale up more than "leadWindow" seconds after the predictive one is not counted as its lead
+        self.leadWindow = leadWindow
+        self.averageScore = HoltForecaster(alpha, beta)
+        # {'app1': HoltForecaster}
+        self.scoresByWebServer = {}
+        self.predictiveFiredAt = None
+        self.leadTimes = []
+        self.numberOfPredictiveScaleUps = 0
+
+    def observe(self, now, webServerObjArray):
+        active = [webServer for webServer in webServerObjArray
+                  if not webServer.getIsDead() and not webServer.getDeathFlag() and webServer.hasStats()]
+        for webServer in active:
+            if webServer.getIsStale():
+                continue
+            forecaster = self.scoresByWebServer.get(webServer.name)
+            if forecaster is None:
+                forecaster = self.scoresByWebServer[webServer.name] = HoltForecaster(self.alpha, self.beta)
+            forecaster.update(now, webServer.score)
+        if active:
+            self.averageScore.update(now, sum(webServer.score for webServer in active) / len(active))
+        # Web servers out of the load balancer do not take part in the forecast anymore
+        activeNames = set(webServer.name for webServer in active)
+        for name in [name for name in self.scoresByWebServer if name not in activeNames]:
+            del self.scoresByWebServer[name]
+
+    def evaluate(self, now, webServerObjArray, scaleUpThr, scaleUpAverageThr, reactiveScaleUp):
+        decision = ForecastDecision()
+        numberOfActive = 0
+        numberOfBooting = 0
+        for webServer in webServerObjArray:
+            if webServer.getIsDead() or webServer.getDeathFlag():
+                continue
+            if webServer.hasStats():
+                numberOfActive += 1
+            elif webServer.isBooting():
+                numberOfBooting += 1
+        if numberOfActive > 0 and self.averageScore.numberOfSamples >= self.minSamples:
+            capacityRatio = numberOfActive / (numberOfActive + numberOfBooting)
+            decision.projectedAverageScore = self.averageScore.forecast(self.horizon)
+            for forecaster in self.scoresByWebServer.values():
+                if forecaster.numberOfSamples >= self.minSamples and \
+                        forecaster.forecast(self.horizon) * capacityRatio > scaleUpThr:
+                    decision.numberOfProjectedScaleUpFlag += 1
+            decision.scaleUp = (decision.numberOfProjectedScaleUpFlag > numberOfActive / 2 or
+                                decision.projectedAverageScore * capacityRatio > scaleUpAverageThr)
+
+        # Lead time report
+        if self.predictiveFiredAt is not None and now - self.predictiveFiredAt > self.leadWindow:
+            self.predictiveFiredAt = None
+        if reactiveScaleUp:
+            if self.predictiveFiredAt is not None:
+                decision.leadTime = now - self.predictiveFiredAt
+                self.leadTimes.append(decision.leadTime)
+                logging.info("Predictive scale up fired " + str(round(decision.leadTime, 2)) +
+                             " seconds ahead of the reactive rule")
+                self.predictiveFiredAt = None
+        elif decision.scaleUp:
+            self.numberOfPredictiveScaleUps += 1
+            if self.predictiveFiredAt is None:
+                self.predictiveFiredAt = now
+            logging.info("Predictive scale up, projected average score in " + str(self.horizon) + " seconds: " +
+                         str(round(decision.projectedAverageScore, 2)))
+        return decision
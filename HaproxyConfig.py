@@ -0,0 +1,101 @@
+import hashlib
+import logging
+import math
+
+# Rendering and loading of the HaProxy config file:
+#   HaproxyConfigRenderer -> the static part (global, defaults, frontend and backend header, HaProxyInitConfigFile)
+#                            is kept as it is, only the server lines of the backend are rendered
+#   HaproxyReloader       -> a new config is written next to the config file, checked by HaProxy ("haproxy -c")
+#                            and renamed over the config file (HaproxyConfigModifier), then HaProxy is soft reloaded
+#                            (the new process takes the listening sockets, the old one finishes its connections).
+#                            Nothing is written nor reloaded when the config is the one HaProxy already runs.
+#                            The config file written by HaproxyRuntimeModifier.persist goes through the same check
+#                            (writeConfig), without the reload
+
+
+class HaproxyConfigError(Exception):
+    pass
+
+
+def configHash(configStr):
+    return hashlib.sha1(configStr.encode("utf-8")).hexdigest()
+
+
+class HaproxyConfigRenderer:
+    def __init__(self, initConfigFileTxt):
+        self.initConfigFileTxt = initConfigFileTxt
+
+    def render(self, serverLines):
+        # Server lines need to have 4 spaces at the beginning and a new line at the end, like below
+        #    server web1.example.com  192.168.1.101:80 weight 10
+        return self.initConfigFileTxt + "".join(serverLines)
+
+    def renderWebServers(self, webServerObjArray):
+        # The web servers without death flag are the destinations
+        return self.render("    server " + webServer.name + "  " + webServer.hostAddress + ":" +
+                           str(webServer.mappedPort) + " weight " + str(math.ceil(webServer.weight)) + "\n"
+                           for webServer in webServerObjArray if not webServer.getDeathFlag())
+
+
+class HaproxyReloader:
+    # "validateCommand" + path of the new config file must exit with 0 for the config to be applied (None -> not
+    # checked), "reloadCommand" soft reloads HaProxy. "osCommandRunner.executeCommand" returns None on success or
+    # the exit status of the command
+    def __init__(self, configModifier, osCommandRunner, validateCommand, reloadCommand, metrics=None):
+        self.configModifier = configModifier
+        self.osCommandRunner = osCommandRunner
+        self.validateCommand = validateCommand
+        self.reloadCommand = reloadCommand
+        self.metrics = metrics
+        # Hash of the config HaProxy has loaded (None -> not known, the first apply always reloads)
+        self.appliedHash = None
+
+    def count(self, result):
+        if self.metrics is not None:
+            self.metrics.inc("autoscaler_haproxy_reloads_total", labels={'result': result})
+
+    def writeConfig(self, configStr):
+        # The config file is replaced by "configStr" once "validateCommand" accepts it, HaProxy is not reloaded
+        # Output: False if the config file already has this content (nothing is written)
+        # HaproxyConfigError if the config is rejected (the config file is not changed)
+        newHash = configHash(configStr)
+        with self.configModifier.lock:
+            if newHash == self.configModifier.configHash:
+                return False
+            tempPath = self.configModifier.writeTemporaryFile(configStr)
+            try:
+                if self.validateCommand is not None:
+                    exitStatus = self.osCommandRunner.executeCommand(self.validateCommand + tempPath)
+                    if exitStatus is not None:
+                        self.count("invalid")
+                        raise HaproxyConfigError("HaProxy rejected the new config (exit status " + str(exitStatus) +
+                                                 "), " + self.configModifier.filePath + " is not changed")
+                self.configModifier.replaceConfigFile(tempPath, newHash)
+                tempPath = None
+            finally:
+                if tempPath is not None:
+                    self.configModifier.discardTemporaryFile(tempPath)
+            return True
+
+    def apply(self, configStr):
+        # Output: True if HaProxy has been reloaded, False if it already runs this config
+        # HaproxyConfigError if the config is rejected by "validateCommand" (the config file is not changed)
+        newHash = configHash(configStr)
+        # The config file lock is held until the reload, so it is not rewritten (HaproxyRuntimeModifier.persist)
+        # between the check and the reload
+        with self.configModifier.lock:
+            if newHash == self.appliedHash and newHash == self.configModifier.configHash:
+                self.count("skipped")
+                return False
+            self.writeConfig(configStr)
+            exitStatus = self.osCommandRunner.executeCommand(self.reloadCommand)
+            if exitStatus is not None:
+                # HaProxy may still run the previous config, the next apply tries again
+                self.appliedHash = None
+                self.count("failed")
+                logging.error("HaProxy reload exited with " + str(exitStatus))
+                return False
+            self.appliedHash = newHash
+            self.count("reloaded")
+            logging.info("HaProxy is reloaded with the new config")
+            return True
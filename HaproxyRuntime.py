@@ -0,0 +1,308 @@
+import logging
+import math
+import socket
+import threading
+import time
+
+from HaproxyConfig import HaproxyConfigRenderer
+
+# HaProxy runtime API (stats socket declared in the "global" section of the config file, like below)
+#   stats socket /run/haproxy/admin.sock mode 660 level admin expose-fd listeners
+# Servers are changed through the socket without restarting HaProxy. The backend has a fixed number of
+# pre-provisioned server "slots" (disabled servers with a dummy address); adding a web server fills a free slot
+# (set addr + weight + state ready), removing it puts the slot back in maintenance. When all slots are used,
+# "add server" (HaProxy >= 2.4) is used. The config file is still rewritten after every change, only to keep the
+# same servers when HaProxy restarts.
+
+
+# HaProxy weights are integers between 1 and "MaxWeight"
+MaxWeight = 256
+
+
+class HaproxyRuntimeError(Exception):
+    pass
+
+
+def scaleWeight(weight, highestWeight):
+    # The weights of the decision are percentages (sum 100, a few % each with many web servers), only their ratios
+    # matter to HaProxy: the highest one is sent as MaxWeight so the integer weights keep the split
+    if highestWeight <= 0:
+        return 1
+    return min(MaxWeight, max(1, int(math.ceil(weight / highestWeight * MaxWeight))))
+
+
+class HaproxyRuntimeApi:
+    # Responses which mean the command has failed
+    ErrorMarkers = ("No such", "Require", "Unknown command", "not found", "Invalid", "Already exists", "error",
+                    "cannot", "Can't", "Only servers")
+
+    def __init__(self, socketPath, timeout=2):
+        self.socketPath = socketPath
+        self.timeout = timeout
+
+    def executeCommand(self, command, checkErrors=True):
+        # HaProxy answers one command per connection (non-interactive mode) and closes the connection
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socketPath)
+            sock.sendall((command + "\n").encode())
+            chunks = []
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        except OSError as e:
+            raise HaproxyRuntimeError("Could not run '" + command + "': " + str(e))
+        finally:
+            sock.close()
+        response = b"".join(chunks).decode("utf-8", "replace").strip()
+        if not checkErrors:
+            return response
+        for marker in self.ErrorMarkers:
+            if marker in response:
+                raise HaproxyRuntimeError("'" + command + "' failed: " + response)
+        return response
+
+    def executeCommands(self, commands):
+        # Several commands in one connection (separated by ";"), HaProxy runs them in order
+        if not commands:
+            return ""
+        return self.executeCommand(";".join(commands))
+
+    def setServerAddr(self, backend, server, ip, port):
+        return self.executeCommand("set server " + backend + "/" + server + " addr " + ip + " port " + str(port))
+
+    def setServerWeight(self, backend, server, weight):
+        return self.executeCommand("set server " + backend + "/" + server + " weight " + str(weight))
+
+    def setServerState(self, backend, server, state):
+        # state: ready | drain | maint
+        return self.executeCommand("set server " + backend + "/" + server + " state " + state)
+
+    def addServer(self, backend, server, ip, port, weight):
+        # Dynamic servers are created in maintenance mode
+        response = self.executeCommand(
+            "add server " + backend + "/" + server + " " + ip + ":" + str(port) + " weight " + str(weight))
+        self.executeCommand("enable server " + backend + "/" + server)
+        return response
+
+    def delServer(self, backend, server):
+        # A server has to be in maintenance before being deleted
+        self.setServerState(backend, server, "maint")
+        return self.executeCommand("del server " + backend + "/" + server)
+
+    def showServersState(self, backend):
+        # Sample Output
+        # 1
+        # # be_id be_name srv_id srv_name srv_addr srv_op_state srv_admin_state srv_uweight srv_iweight ...
+        # 3 My_Web_Servers 1 slot1 192.168.1.5 2 0 50 1 ...
+        # Output: {'slot1': {'be_id': '3', 'be_name': 'My_Web_Servers', 'srv_name': 'slot1', ...}}
+        return parseHeaderTable(self.executeCommand("show servers state " + backend, checkErrors=False), " ")
+
+    def showStat(self):
+        # Output: [{'pxname': 'My_Web_Servers', 'svname': 'slot1', 'scur': '0', 'status': 'UP', ...}]
+        return list(parseHeaderTable(self.executeCommand("show stat", checkErrors=False), ",", keyField=None))
+
+
+def parseHeaderTable(text, separator, keyField="srv_name"):
+    # Both "show servers state" and "show stat" start with a "# field1 field2 ..." header line
+    header = None
+    rows = [] if keyField is None else {}
+    for line in text.splitlines():
+        if line.startswith("#"):
+            header = [field for field in line[1:].strip().split(separator) if field != '']
+            continue
+        if header is None or line.strip() == '':
+            continue
+        values = line.split(separator)
+        row = dict(zip(header, values))
+        if keyField is None:
+            rows.append(row)
+        elif keyField in row:
+            rows[row[keyField]] = row
+    return rows
+
+
+class ServerSlot:
+    def __init__(self, slotName, dynamic=False):
+        self.slotName = slotName
+        self.dynamic = dynamic
+        self.webServerName = None
+        self.ip = None
+        self.port = None
+        self.weight = 1
+        # ready | drain | maint
+        self.state = "maint"
+
+    def isFree(self):
+        return self.webServerName is None
+
+    def configLine(self):
+        # Destination string needs to have 4 spaces at the beginning, like below
+        #    server slot1  192.168.1.101:80 weight 10
+        if self.isFree():
+            return "    server " + self.slotName + "  127.0.0.1:1 weight 1 disabled\n"
+        line = "    server " + self.slotName + "  " + self.ip + ":" + str(self.port) + " weight " + str(self.weight)
+        if self.state != "ready":
+            line += " disabled"
+        return line + "\n"
+
+
+class HaproxyRuntimeModifier:
+    # "configWriter" (HaproxyReloader) checks the persisted config with "haproxy -c" before it replaces the config
+    # file (HaproxyConfigError if rejected), None -> written as it is (tests, fake HaProxy)
+    def __init__(self, runtimeApi, configModifier, initConfigFileTxt, backendName, numberOfSlots, configWriter=None):
+        self.runtimeApi = runtimeApi
+        self.configModifier = configModifier
+        self.configWriter = configWriter
+        self.initConfigFileTxt = initConfigFileTxt
+        self.configRenderer = HaproxyConfigRenderer(initConfigFileTxt)
+        self.backendName = backendName
+        self.slots = [ServerSlot("slot" + str(i + 1)) for i in range(numberOfSlots)]
+        # {'app1': ServerSlot}
+        self.slotsByWebServer = {}
+        self.lock = threading.Lock()
+
+    def renderConfig(self):
+        return self.configRenderer.render(slot.configLine() for slot in self.slots)
+
+    def persist(self):
+        if self.configWriter is not None:
+            self.configWriter.writeConfig(self.renderConfig())
+        else:
+            self.configModifier.reWriteWholeConfigFile(self.renderConfig())
+
+    def assignSlot(self, webServerName, ip, port, weight, state):
+        # Only changes the local state (used before the very first HaProxy start and by the state reconciliation)
+        with self.lock:
+            slot = self.slotsByWebServer.get(webServerName)
+            if slot is None:
+                slot = next((s for s in self.slots if s.isFree()), None)
+                if slot is None:
+                    slot = ServerSlot(webServerName, dynamic=True)
+                    self.slots.append(slot)
+                slot.webServerName = webServerName
+                self.slotsByWebServer[webServerName] = slot
+            slot.ip, slot.port, slot.weight, slot.state = ip, port, weight, state
+            return slot
+
+    # The local slots are the desired state: they are updated (and persisted) even if the runtime command fails,
+    # in that case HaproxyRuntimeError is raised and the caller can restart HaProxy with the persisted config file
+    def applyChanges(self, added=(), drained=(), removed=()):
+        # One batch for all the changes of a cycle: one connection to the admin socket and one config file write.
+        # Input: added [(webServerName, ip, port, weight)], drained [webServerName], removed [webServerName]
+        # Removals come first so their slots can be reused by the added web servers
+        with self.lock:
+            commands = []
+            try:
+                for webServerName in removed:
+                    slot = self.slotsByWebServer.pop(webServerName, None)
+                    if slot is None:
+                        continue
+                    target = self.backendName + "/" + slot.slotName
+                    commands.append("set server " + target + " state maint")
+                    if slot.dynamic:
+                        self.slots.remove(slot)
+                        commands.append("del server " + target)
+                    else:
+                        slot.webServerName = None
+                        slot.ip, slot.port, slot.weight, slot.state = None, None, 1, "maint"
+                    logging.info(webServerName + " is removed from HaProxy (" + slot.slotName + ")")
+                for webServerName, ip, port, weight in added:
+                    if webServerName in self.slotsByWebServer:
+                        raise HaproxyRuntimeError(webServerName + " is already in the backend")
+                    slot = next((s for s in self.slots if s.isFree()), None)
+                    if slot is None:
+                        # No pre-provisioned slot left
+                        slot = ServerSlot(webServerName, dynamic=True)
+                        self.slots.append(slot)
+                    slot.webServerName = webServerName
+                    slot.ip, slot.port, slot.weight, slot.state = ip, port, weight, "ready"
+                    self.slotsByWebServer[webServerName] = slot
+                    target = self.backendName + "/" + slot.slotName
+                    if slot.dynamic:
+                        # Dynamic servers are created in maintenance mode
+                        commands.append("add server " + target + " " + ip + ":" + str(port) + " weight " +
+                                        str(weight))
+                        commands.append("enable server " + target)
+                    else:
+                        commands.append("set server " + target + " addr " + ip + " port " + str(port))
+                        commands.append("set server " + target + " weight " + str(weight))
+                        commands.append("set server " + target + " state ready")
+                    logging.info(webServerName + " is added to HaProxy (" + slot.slotName + ")")
+                for webServerName in drained:
+                    slot = self.slotsByWebServer[webServerName]
+                    slot.state = "drain"
+                    commands.append("set server " + self.backendName + "/" + slot.slotName + " state drain")
+                self.runtimeApi.executeCommands(commands)
+            finally:
+                self.persist()
+
+    def setWebServerWeight(self, webServerName, weight):
+        # Weights are not persisted after every change, they are recomputed at every cycle anyway
+        with self.lock:
+            slot = self.slotsByWebServer[webServerName]
+            slot.weight = weight
+            self.runtimeApi.setServerWeight(self.backendName, slot.slotName, weight)
+
+    def removeWebServer(self, webServerName):
+        self.applyChanges(removed=[webServerName])
+
+    def getSlotName(self, webServerName):
+        slot = self.slotsByWebServer.get(webServerName)
+        if slot is None:
+            return None
+        return slot.slotName
+
+
+class WeightSynchronizer:
+    # Pushes the weights computed at every cycle to HaProxy (no restart), scaled to 1..MaxWeight (see scaleWeight).
+    # Only the weights which differ from the one HaProxy currently has by at least "deadBand" (fraction of the
+    # current weight) are sent, and a server is not updated more often than once every "minInterval" seconds, so
+    # small score oscillations do not make the weights flap
+    def __init__(self, runtimeModifier, deadBand, minInterval):
+        self.runtimeModifier = runtimeModifier
+        self.deadBand = deadBand
+        self.minInterval = minInterval
+        # {'app1': time.monotonic() of the last push}
+        self.lastPushTime = {}
+
+    def sync(self, weights):
+        # Input: {'app1': 37.5, 'app2': 62.5} -> Output: number of weights sent to HaProxy
+        now = time.monotonic()
+        numberOfPushes = 0
+        highestWeight = max(weights.values(), default=0)
+        for webServerName, weight in weights.items():
+            slot = self.runtimeModifier.slotsByWebServer.get(webServerName)
+            if slot is None or slot.state != "ready":
+                continue
+            newWeight = scaleWeight(weight, highestWeight)
+            if abs(newWeight - slot.weight) < self.deadBand * slot.weight:
+                continue
+            if now - self.lastPushTime.get(webServerName, -self.minInterval) < self.minInterval:
+                continue
+            try:
+                self.runtimeModifier.setWebServerWeight(webServerName, newWeight)
+                self.lastPushTime[webServerName] = now
+                numberOfPushes += 1
+            except HaproxyRuntimeError as e:
+                logging.error(e)
+                self.refreshFromBalancer()
+        for webServerName in list(self.lastPushTime):
+            if webServerName not in weights:
+                del self.lastPushTime[webServerName]
+        return numberOfPushes
+
+    def refreshFromBalancer(self):
+        # Re-read the weights HaProxy really has (e.g. after a failed command or a restart)
+        try:
+            serversState = self.runtimeModifier.runtimeApi.showServersState(self.runtimeModifier.backendName)
+        except HaproxyRuntimeError as e:
+            logging.error(e)
+            return
+        for slot in self.runtimeModifier.slots:
+            state = serversState.get(slot.slotName)
+            if state is not None and state.get("srv_uweight", "").isdigit():
+                slot.weight = int(state["srv_uweight"])
@@ -0,0 +1,238 @@
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+
+# Metric history of every container, stored as fixed-width binary records in memory-mapped ring buffers
+# (replaces the ever growing "history_<container>" text files). Every container has two rings:
+#   <folder>/<container>.raw -> every sample, the oldest ones are overwritten after "rawCapacity" samples
+#   <folder>/<container>.ds  -> one averaged record every "downsampleSeconds", kept for "downsampleCapacity" records
+# A ring file is a 32 bytes header followed by "capacity" records:
+#   header -> magic (4s) | version (I) | record size (I) | capacity (I) | number of appended records (Q) |
+#             number of started appends (Q)
+#   record -> Timestamp, Cpu (%), Memory (bytes), MemoryUsage (%), InputTraffic (bytes), OutPutTraffic (bytes),
+#             BusyThreadsCount, ProcessingReqTime (ms), all float64
+# An append first bumps the number of started appends, then writes the record, then bumps the number of appended
+# records. Readers (other processes) only read up to the appended records, and once read they drop the records of
+# the slots a started append may have overwritten meanwhile (the oldest ones, see readRecords), so a half written
+# record is never returned.
+# A container name is reused by later containers (see BackendRegistry.py), "<folder>/<container>.id" holds the id of
+# the container the rings belong to and they are started over when another container registers the name.
+# The control loop (Main.py) does not read the history back, it is read by Replay.py and the dump below
+
+HistoryFields = ('Timestamp', 'Cpu', 'Memory', 'MemoryUsage', 'InputTraffic', 'OutPutTraffic', 'BusyThreadsCount',
+                 'ProcessingReqTime')
+HeaderStruct = struct.Struct('<4sIIIQQ')
+CounterStruct = struct.Struct('<Q')
+# Offsets of "number of appended records" and "number of started appends" in the header
+AppendedOffset = 16
+StartedOffset = 24
+RecordStruct = struct.Struct('<' + 'd' * len(HistoryFields))
+HistoryMagic = b'VHS1'
+HistoryVersion = 1
+
+
+class HistoryRing:
+    def __init__(self, filePath, capacity, writable):
+        self.filePath = filePath
+        self.writable = writable
+        self.file = None
+        self.map = None
+        if writable and not os.path.exists(filePath):
+            with open(filePath, 'wb') as fh:
+                fh.write(HeaderStruct.pack(HistoryMagic, HistoryVersion, RecordStruct.size, capacity, 0, 0))
+                fh.truncate(HeaderStruct.size + capacity * RecordStruct.size)
+        self.file = open(filePath, 'r+b' if writable else 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+        magic, version, recordSize, self.capacity, _, _ = HeaderStruct.unpack_from(self.map, 0)
+        if magic != HistoryMagic or version != HistoryVersion or recordSize != RecordStruct.size:
+            self.close()
+            raise ValueError(filePath + " is not a history ring file")
+
+    def count(self):
+        return CounterStruct.unpack_from(self.map, AppendedOffset)[0]
+
+    def append(self, record):
+        count = self.count()
+        CounterStruct.pack_into(self.map, StartedOffset, count + 1)
+        RecordStruct.pack_into(self.map, HeaderStruct.size + (count % self.capacity) * RecordStruct.size, *record)
+        CounterStruct.pack_into(self.map, AppendedOffset, count + 1)
+
+    def recordAt(self, firstIndex, i):
+        # i-th record (0 = oldest) of the ring, "firstIndex" being the absolute index of the oldest record
+        return RecordStruct.unpack_from(self.map,
+                                        HeaderStruct.size + ((firstIndex + i) % self.capacity) * RecordStruct.size)
+
+    def query(self, start, end):
+        # Records with start <= Timestamp < end, the oldest first (records are appended in time order so the
+        # range is found with two binary searches)
+        count = self.count()
+        size = min(count, self.capacity)
+        firstIndex = count - size
+        low = self.lowerBound(firstIndex, size, start)
+        high = self.lowerBound(firstIndex, size, end)
+        return self.readRecords(firstIndex, low, high)
+
+    def readRecords(self, firstIndex, low, high):
+        records = [self.recordAt(firstIndex, i) for i in range(low, high)]
+        # The append number n (1 = first) overwrites the record n - 1 - capacity, the records older than the last
+        # started append allows may be half written
+        oldestIndex = CounterStruct.unpack_from(self.map, StartedOffset)[0] - self.capacity
+        return records[max(0, min(oldestIndex - (firstIndex + low), len(records))):]
+
+    def lowerBound(self, firstIndex, size, timestamp):
+        low, high = 0, size
+        while low < high:
+            middle = (low + high) // 2
+            if RecordStruct.unpack_from(self.map, HeaderStruct.size + ((firstIndex + middle) % self.capacity) *
+                                        RecordStruct.size)[0] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def latest(self, numberOfRecords):
+        count = self.count()
+        size = min(count, self.capacity, numberOfRecords)
+        firstIndex = count - size
+        return self.readRecords(firstIndex, 0, size)
+
+    def flush(self):
+        if self.writable:
+            self.map.flush()
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class Downsampler:
+    # Averages the samples of one "downsampleSeconds" bucket, the record gets the bucket start as timestamp
+    def __init__(self, downsampleSeconds):
+        self.downsampleSeconds = downsampleSeconds
+        self.bucketStart = None
+        self.sums = [0.0] * (len(HistoryFields) - 1)
+        self.numberOfSamples = 0
+
+    def add(self, record):
+        # Output: the averaged record of the previous bucket when "record" starts a new one, None otherwise
+        bucketStart = record[0] - record[0] % self.downsampleSeconds
+        finished = None
+        if self.bucketStart is not None and bucketStart != self.bucketStart and self.numberOfSamples > 0:
+            finished = (self.bucketStart,) + tuple(value / self.numberOfSamples for value in self.sums)
+            self.sums = [0.0] * (len(HistoryFields) - 1)
+            self.numberOfSamples = 0
+        self.bucketStart = bucketStart
+        for i, value in enumerate(record[1:]):
+            self.sums[i] += value
+        self.numberOfSamples += 1
+        return finished
+
+
+class HistoryStore:
+    def __init__(self, folderPath, rawCapacity=86400, downsampleSeconds=60, downsampleCapacity=43200,
+                 writable=True):
+        self.folderPath = folderPath
+        self.rawCapacity = rawCapacity
+        self.downsampleSeconds = downsampleSeconds
+        self.downsampleCapacity = downsampleCapacity
+        self.writable = writable
+        # {('app1', 'raw'): HistoryRing}
+        self.rings = {}
+        self.downsamplers = {}
+        if writable and not os.path.exists(folderPath):
+            os.makedirs(folderPath)
+
+    def getRing(self, containerName, resolution):
+        key = (containerName, resolution)
+        ring = self.rings.get(key)
+        if ring is None:
+            filePath = os.path.join(self.folderPath, containerName + "." + resolution)
+            if not self.writable and not os.path.exists(filePath):
+                return None
+            capacity = self.rawCapacity if resolution == "raw" else self.downsampleCapacity
+            ring = HistoryRing(filePath, capacity, self.writable)
+            self.rings[key] = ring
+        return ring
+
+    def register(self, containerName, containerId):
+        # Called when a container with this name is seen, the rings of a previous container with the same name are
+        # removed (readers which have them open keep reading the old files)
+        idPath = os.path.join(self.folderPath, containerName + ".id")
+        previousId = None
+        if os.path.exists(idPath):
+            with open(idPath) as fh:
+                previousId = fh.read().strip()
+        if previousId == containerId:
+            return
+        for resolution in ("raw", "ds"):
+            ring = self.rings.pop((containerName, resolution), None)
+            if ring is not None:
+                ring.close()
+            filePath = os.path.join(self.folderPath, containerName + "." + resolution)
+            if os.path.exists(filePath):
+                os.remove(filePath)
+        self.downsamplers.pop(containerName, None)
+        with open(idPath, "w") as fh:
+            fh.write(containerId)
+
+    def append(self, containerName, timestamp, snapshot):
+        # snapshot: {'Cpu': 0.01, 'Memory': 1544192, 'MemoryUsage': 0.15, 'InputTraffic': 828, 'OutPutTraffic': 0,
+        #            'BusyThreadsCount': 1, 'ProcessingReqTime': 200}
+        record = (timestamp,) + tuple(float(snapshot[field]) for field in HistoryFields[1:])
+        self.getRing(containerName, "raw").append(record)
+        downsampler = self.downsamplers.get(containerName)
+        if downsampler is None:
+            downsampler = self.downsamplers[containerName] = Downsampler(self.downsampleSeconds)
+        finished = downsampler.add(record)
+        if finished is not None:
+            self.getRing(containerName, "ds").append(finished)
+
+    def query(self, containerName, start, end=None, resolution="raw"):
+        # Output: [(Timestamp, Cpu, Memory, ...)] see "HistoryFields", the oldest first
+        ring = self.getRing(containerName, resolution)
+        if ring is None:
+            return []
+        return ring.query(start, end if end is not None else float("inf"))
+
+    def latest(self, containerName, numberOfRecords, resolution="raw"):
+        ring = self.getRing(containerName, resolution)
+        if ring is None:
+            return []
+        return ring.latest(numberOfRecords)
+
+    def containers(self):
+        if not os.path.exists(self.folderPath):
+            return []
+        return sorted(set(fileName.rsplit(".", 1)[0] for fileName in os.listdir(self.folderPath)
+                          if fileName.endswith(".raw") or fileName.endswith(".ds")))
+
+    def flush(self):
+        for ring in self.rings.values():
+            ring.flush()
+
+    def close(self):
+        for ring in self.rings.values():
+            ring.close()
+        self.rings = {}
+
+
+# Dump the history of one container as CSV (for graphing), like below
+#   python HistoryStore.py /home/amir/containerAutoScalingScripts/logs/history/ app1 3600 [raw|ds]
+if __name__ == "__main__":
+    if len(sys.argv) < 4:
+        logging.error("Usage: HistoryStore.py <history folder> <container> <last N seconds> [raw|ds]")
+        sys.exit(1)
+    historyStore = HistoryStore(sys.argv[1], writable=False)
+    records = historyStore.query(sys.argv[2], time.time() - float(sys.argv[3]),
+                                 resolution=sys.argv[4] if len(sys.argv) > 4 else "raw")
+    print(",".join(HistoryFields))
+    for record in records:
+        print(",".join(str(value) for value in record))
+    historyStore.close()
@@ -0,0 +1,201 @@
+import bisect
+import http.server
+import logging
+import threading
+import time
+
+# Instrumentation of the control loop: counters, gauges and latency histograms kept in memory and exposed in the
+# Prometheus text format on "http://<host>:<port>/metrics" (MetricsServer)
+
+# Histogram buckets (seconds)
+LatencyBuckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # One count per bucket (value <= bucket) + the "+Inf" one, not cumulative
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+
+def formatLabels(labelKey, extra=()):
+    labels = labelKey + extra
+    if not labels:
+        return ''
+    return "{" + ",".join(name + '="' + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") +
+                          '"' for name, value in labels) + "}"
+
+
+def formatValue(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # {'autoscaler_cycle_seconds': ('histogram', 'Duration of a control loop cycle')}
+        self.descriptions = {}
+        # {'autoscaler_stage_seconds': {(('stage', 'ingestion'),): Histogram or number}}
+        self.families = {}
+
+    def describe(self, name, metricType, helpText):
+        self.descriptions[name] = (metricType, helpText)
+
+    def labelKey(self, labels):
+        return tuple(sorted(labels.items())) if labels else ()
+
+    def inc(self, name, amount=1, labels=None):
+        key = self.labelKey(labels)
+        with self.lock:
+            family = self.families.setdefault(name, {})
+            family[key] = family.get(key, 0) + amount
+
+    def setValue(self, name, value, labels=None):
+        # Gauges, and counters kept by another object (e.g. DrainManager.numberOfRemovedIdle)
+        key = self.labelKey(labels)
+        with self.lock:
+            self.families.setdefault(name, {})[key] = value
+
+    def clear(self, name):
+        # Per web server gauges are set again every cycle, the names of the removed web servers must go
+        with self.lock:
+            self.families.pop(name, None)
+
+    def observe(self, name, value, labels=None, buckets=LatencyBuckets):
+        key = self.labelKey(labels)
+        with self.lock:
+            family = self.families.setdefault(name, {})
+            histogram = family.get(key)
+            if histogram is None:
+                histogram = family[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def get(self, name, labels=None):
+        with self.lock:
+            return self.families.get(name, {}).get(self.labelKey(labels))
+
+    def stopwatch(self, name, labelName):
+        return Stopwatch(self, name, labelName)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name in sorted(self.families):
+                metricType, helpText = self.descriptions.get(name, ('untyped', ''))
+                if helpText:
+                    lines.append("# HELP " + name + " " + helpText)
+                lines.append("# TYPE " + name + " " + metricType)
+                for key, value in sorted(self.families[name].items()):
+                    if isinstance(value, Histogram):
+                        cumulative = 0
+                        for bucket, count in zip(value.buckets + (float("inf"),), value.counts):
+                            cumulative += count
+                            lines.append(name + "_bucket" + formatLabels(key, (('le', formatValue(bucket)),)) + " " +
+                                         str(cumulative))
+                        lines.append(name + "_sum" + formatLabels(key) + " " + repr(value.sum))
+                        lines.append(name + "_count" + formatLabels(key) + " " + str(value.count))
+                    else:
+                        lines.append(name + formatLabels(key) + " " + formatValue(value))
+        return "\n".join(lines) + "\n"
+
+
+class Stopwatch:
+    # Times consecutive stages of one run: lap("ingestion") records the time since the previous lap (or the start)
+    def __init__(self, metrics, name, labelName):
+        self.metrics = metrics
+        self.name = name
+        self.labelName = labelName
+        self.startTime = self.lastTime = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.metrics.observe(self.name, now - self.lastTime, {self.labelName: stage})
+        self.lastTime = now
+
+    def elapsed(self):
+        return time.perf_counter() - self.startTime
+
+
+class InstrumentedProxy:
+    # Stands for "target" (e.g. a DockerUtil) and times every call of "methodNames" in the histogram "name"
+    # (label method=<method name> + "labels"), failed calls are counted in "<name without _seconds>_errors_total".
+    # Every other attribute is read from the target
+    def __init__(self, target, metrics, name, methodNames, labels=None):
+        self.instrumentedTarget = target
+        self.instrumentedMetrics = metrics
+        self.instrumentedName = name
+        self.instrumentedMethodNames = set(methodNames)
+        self.instrumentedLabels = labels or {}
+
+    def __getattr__(self, attribute):
+        value = getattr(self.instrumentedTarget, attribute)
+        if attribute not in self.instrumentedMethodNames:
+            return value
+        metrics = self.instrumentedMetrics
+        name = self.instrumentedName
+        labels = dict(self.instrumentedLabels, method=attribute)
+
+        def timed(*args, **kwargs):
+            startTime = time.perf_counter()
+            try:
+                return value(*args, **kwargs)
+            except Exception:
+                metrics.inc(name.replace("_seconds", "") + "_errors_total", labels=labels)
+                raise
+            finally:
+                metrics.observe(name, time.perf_counter() - startTime, labels)
+
+        return timed
+
+
+class MetricsServer:
+    # GET /metrics in a background thread, for a local Prometheus (or curl)
+    def __init__(self, metrics, host, port):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self.httpServer = None
+        self.thread = None
+
+    def start(self):
+        metrics = self.metrics
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpServer = http.server.ThreadingHTTPServer((self.host, self.port), Handler)
+        self.httpServer.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpServer.serve_forever, name="metrics-server", daemon=True)
+        self.thread.start()
+        logging.info("Metrics are served on http://" + self.host + ":" + str(self.httpServer.server_address[1]) +
+                     "/metrics")
+
+    def stop(self):
+        if self.httpServer is not None:
+            self.httpServer.shutdown()
+            self.httpServer.server_close()
+            self.httpServer = None
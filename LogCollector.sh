@@ -2,6 +2,8 @@
 
 # Commands
 # Running Apache web server(httpd) -> sudo docker run -dit --name app1 -p 8080:80 httpd_final
+# NOTE: StatsCollector.py writes the same log files in-process (streaming docker stats + keep-alive server-status)
+# and can be used instead of this script on hosts with many containers
 
 
 # Modify these parameters before running
@@ -98,7 +100,7 @@ do
             echo "InputTraffic $inputTraffic" >> $DIR$historyFileName
             echo "OutPutTraffic $outputTraffic" >> $DIR$historyFileName
             echo "BusyThreadsCount $busyThreadsCount" >> $DIR$historyFileName
-            echo "ProcessingReqTime $processingReqTime" >> $DIR$container
+            echo "ProcessingReqTime $processingReqTime" >> $DIR$historyFileName
 
         fi
     done
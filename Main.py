@@ -1,14 +1,26 @@
-import json
+import asyncio
 import logging
-import math
 import os
+import tempfile
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from itertools import islice
-from os import listdir
-from os.path import isfile, join
 
 # LOGGING CONFIGURATION
-import docker
+from FleetState import FleetField, FleetState
+from AutoScalerDaemon import AutoScalerDaemon
+from BackendRegistry import BackendRegistry
+from DrainManager import DrainManager
+from Forecaster import ScoreForecaster
+from ScalingPolicy import ScalingPolicy
+from ServerStatusScraper import ServerStatusScraper
+from MetricSnapshot import parseStatsLines
+from Instrumentation import InstrumentedProxy, Metrics, MetricsServer
+from HaproxyConfig import HaproxyConfigError, HaproxyConfigRenderer, HaproxyReloader, configHash
+from HaproxyRuntime import HaproxyRuntimeApi, HaproxyRuntimeError, HaproxyRuntimeModifier, MaxWeight, \
+    WeightSynchronizer
+from WarmPool import WarmPoolManager
 
 logging.basicConfig(format='%(asctime)s - %(message)s', datefmt='%d-%b-%y %H:%M:%S')
 logging.getLogger().setLevel(logging.INFO)
@@ -17,13 +29,113 @@ logging.getLogger().setLevel(logging.INFO)
 ServerIpAddress = "192.168.1.5"
 DockerApiUrlPort = "tcp://192.168.1.5:2375"
 WebServersLogsFolderPath = "/home/amir/containerAutoScalingScripts/logs/"
+# Web server n is named "<WebServerNamePrefix><n>" and published on "WebServerPortBase + n", the numbers of the
+# removed web servers are reused (see BackendRegistry.py)
+WebServerNamePrefix = "app"
+WebServerPortBase = 8010
+# Docker hosts: [(Docker API url, IP address HaProxy uses to reach the containers of that host)]. New web servers are
+# placed on the least loaded host (see PlacementScheduler), a host is full above "DockerHostMaxCpu" of its cpus or
+# "DockerHostMaxMemory" of its memory (memory limits of its containers). Every host keeps up to "DockerMaxPoolSize"
+# connections to its Docker API
+DockerHosts = [(DockerApiUrlPort, ServerIpAddress)]
+DockerMaxPoolSize = 10
+DockerHostMaxCpu = 0.9
+DockerHostMaxMemory = 0.9
+# Docker container states in which the container is not running but still holds its name
+StoppedContainerStates = ('created', 'exited', 'dead')
 ScaleUpThreshold = 40
 ScaleDownThreshold = 10
 ScaleUpAverageThreshold = 40
 Coefficient_X = 2
 Coefficient_Y = 1
 Coefficient_Z = 1
+# Optional score terms: network throughput (input + output bytes per second, in % of "MaxNetworkRate") and memory
+# pressure (MemoryUsage %), 0 -> not part of the score
+Coefficient_N = 0
+Coefficient_M = 0
+MaxNetworkRate = 12500000
+# Warm pool: "WarmPoolSize" standby web servers are kept started (out of HaProxy) so scaling up only promotes one,
+# the pool grows up to "WarmPoolMaxSize" when it was used in the last "WarmPoolAdaptiveWindow" seconds
+WarmPoolSize = 1
+WarmPoolMaxSize = 3
+WarmPoolAdaptiveWindow = 300
+WarmPoolNamePrefix = "standby"
+WarmPoolPortBase = 8500
+# Metric ingestion (SECTION 1): all backends are read in parallel, each one gets "IngestionDeadline" seconds to
+# produce a complete log file before its last known value is reused and marked as stale
+IngestionDeadline = 0.5
+IngestionPollInterval = 0.05
+IngestionMaxWorkers = 32
+# The age of the stats is the age of the log file (mtime). Stats older than "StaleStatsAge" seconds are stale (a few
+# writes of LogCollector.sh / StatsCollector.py missed), a web server whose stats are older than "MaxStatsAge"
+# seconds (e.g. its container crashed or its collector hung) is left out of the scores, weights and scaling vote
+# until it reports again
+StaleStatsAge = 3
+MaxStatsAge = 10
+# Busy workers and processing time are read by the autoscaler itself from "/server-status?auto" of every web server
+# (published port, keep-alive connection) in the same pass, the log file values are only used if the page can not be
+# read in "ServerStatusTimeout" seconds or before the "IngestionDeadline" of the web server (no retry)
+ServerStatusScrapeEnabled = True
+ServerStatusTimeout = 0.3
+CycleInterval = 1
 HaProxyConfigFilePath = "/etc/haproxy/haproxy.cfg"
+# A new config is checked with "HaProxyValidateCommand <new file>" before it replaces the config file (set
+# "HaProxyValidateConfig" to False to skip it), then HaProxy is soft reloaded with "HaProxyReloadCommand": the new
+# process takes the listening sockets and the old one finishes its connections. HaProxy is not reloaded when the
+# config did not change (see HaproxyConfig.py)
+# The reload goes through the service manager (the distro unit does the -sf handover). Without one, HaProxy can be
+# reloaded directly, the listening sockets are taken over through the admin socket ("expose-fd listeners"):
+#   "haproxy -f /etc/haproxy/haproxy.cfg -p /run/haproxy.pid -x /run/haproxy/admin.sock -sf $(cat /run/haproxy.pid)"
+HaProxyValidateConfig = True
+HaProxyValidateCommand = "haproxy -c -q -f "
+HaProxyReloadCommand = "service haproxy reload"
+# Runtime API: servers are added/drained/removed through the admin socket (no restart), the backend is written with
+# "HaProxyServerSlots" pre-provisioned server slots. Set "HaProxyUseRuntimeApi" to False to reload HaProxy instead
+HaProxyUseRuntimeApi = True
+HaProxyAdminSocketPath = "/run/haproxy/admin.sock"
+HaProxyBackendName = "My_Web_Servers"
+HaProxyServerSlots = 10
+# Weights computed at every cycle are pushed to HaProxy (scaled to 1..256) when they changed by at least
+# "WeightSyncDeadBand" of the current weight (0.1 -> 10%), at most once every "WeightSyncMinInterval" seconds per web
+# server
+WeightSyncDeadBand = 0.1
+WeightSyncMinInterval = 5
+# Runtime API only: a drained web server (SECTION 4) is removed when HaProxy reports no session left for it, or after
+# "DrainTimeout" seconds, HaProxy is polled every "DrainPollInterval" seconds (see DrainManager.py)
+DrainTimeout = 60
+DrainPollInterval = 1
+# Predictive scale up (see Forecaster.py): the scores are forecast "ForecastHorizon" seconds ahead (boot time of a
+# new web server) with a Holt linear trend, the SECTION 3 rule is applied to the projected scores too
+ForecastEnabled = True
+ForecastAlpha = 0.5
+ForecastBeta = 0.3
+ForecastHorizon = 5
+ForecastMinSamples = 3
+ForecastLeadWindow = 30
+# Scaling policy (see ScalingPolicy.py): a scale up adds as many web servers as needed to bring the average score
+# down to "ScalingTargetScore" (at most "ScalingMaxStep" per cycle, created concurrently), a scale down removes as
+# many as the others can take while staying "ScalingHysteresisBand" under ScaleUpAverageThreshold.
+# No scale up within "ScaleUpCooldown" seconds of the previous one, no scale down within "ScaleDownCooldown" seconds
+# of any scaling
+ScalingTargetScore = 35
+ScalingHysteresisBand = 10
+ScalingMaxStep = 5
+ScalingMinWebServers = 1
+ScalingMaxWebServers = 50
+ScaleUpCooldown = 10
+ScaleDownCooldown = 30
+# Instrumentation: stage timings, decisions, scale events and staleness of the control loop, Docker / HaProxy call
+# timings, served in the Prometheus text format on http://MetricsHost:MetricsPort/metrics (see Instrumentation.py)
+MetricsEnabled = True
+MetricsHost = "127.0.0.1"
+MetricsPort = 9101
+# Daemon (see AutoScalerDaemon.py): stats collection, decisions and actuations are independent asyncio tasks, the
+# decisions wait in a queue of "DaemonActuationQueueSize" actuations, the blocking Docker / HaProxy / log file calls
+# run on "DaemonMaxWorkers" threads and the actuations already decided get "DaemonShutdownTimeout" seconds to finish
+# on SIGINT / SIGTERM
+DaemonActuationQueueSize = 8
+DaemonMaxWorkers = 8
+DaemonShutdownTimeout = 30
 HaProxyInitConfigFile = """
 global
 	log /dev/log	local0
@@ -81,14 +193,121 @@ backend My_Web_Servers
 
 
 class DockerUtil:
-    def __init__(self, dockerClient):
+    # Keeps a {name: container} index of the running containers so existence checks do not need any API call, and
+    # a {name: container id} index of the stopped ones (created / crashed containers still hold their name).
+    # The indexes are filled once with "containers.list(all=True)" and kept up to date by a thread which follows the
+    # Docker events stream (start -> running, create/die -> stopped, destroy -> removed). If the stream breaks, the
+    # indexes are rebuilt and the stream is reopened
+    def __init__(self, dockerClient, watchEvents=True, hostAddress=None):
         self.dockerClient = dockerClient
+        # IP address of the host in the HaProxy server lines
+        self.hostAddress = hostAddress if hostAddress is not None else ServerIpAddress
+        # (number of cpus, total memory) of the host, read once
+        self.hostCapacity = None
+        self.containersByName = {}
+        self.stoppedContainerIds = {}
+        self.inventoryLock = threading.Lock()
+        self.eventStream = None
+        self.eventWatcherThread = None
+        self.stopWatching = threading.Event()
+        if watchEvents:
+            self.startEventWatcher()
+        else:
+            self.refreshInventory()
+
+    def refreshInventory(self):
+        containers = self.dockerClient.containers.list(all=True)
+        with self.inventoryLock:
+            self.containersByName = {container.name: container for container in containers
+                                     if container.status not in StoppedContainerStates}
+            self.stoppedContainerIds = {container.name: container.id for container in containers
+                                        if container.status in StoppedContainerStates}
+
+    def startEventWatcher(self):
+        # The stream is opened before the initial listing so no event between the two can be missed
+        # (replayed events are harmless since add/remove are idempotent)
+        self.eventStream = self.dockerClient.events(decode=True, filters={'type': 'container'})
+        self.refreshInventory()
+        self.eventWatcherThread = threading.Thread(target=self.watchEvents, name="docker-events", daemon=True)
+        self.eventWatcherThread.start()
+
+    def stopEventWatcher(self):
+        self.stopWatching.set()
+        if self.eventStream is not None:
+            self.eventStream.close()
+
+    def watchEvents(self):
+        while not self.stopWatching.is_set():
+            try:
+                for event in self.eventStream:
+                    self.handleEvent(event)
+            except Exception as e:
+                if self.stopWatching.is_set():
+                    return
+                logging.error("Docker events stream failed: " + str(e))
+            if self.stopWatching.is_set():
+                return
+            time.sleep(1)
+            try:
+                self.eventStream = self.dockerClient.events(decode=True, filters={'type': 'container'})
+                self.refreshInventory()
+            except Exception as e:
+                logging.error(e)
+
+    # Sample event
+    # {'status': 'start', 'id': 'e230251af571...', 'Type': 'container', 'Action': 'start',
+    #  'Actor': {'ID': 'e230251af571...', 'Attributes': {'image': 'httpd_final', 'name': 'app1'}}, ...}
+    def handleEvent(self, event):
+        action = event.get('Action', event.get('status'))
+        actor = event.get('Actor', {})
+        name = actor.get('Attributes', {}).get('name')
+        if name is None:
+            return
+        if action == 'start':
+            try:
+                container = self.dockerClient.containers.get(actor.get('ID', name))
+            except Exception as e:
+                logging.error(e)
+                return
+            with self.inventoryLock:
+                self.containersByName[name] = container
+                self.stoppedContainerIds.pop(name, None)
+        elif action == 'create':
+            # Late event of a container this object has created and already indexed as running
+            with self.inventoryLock:
+                if name not in self.containersByName:
+                    self.stoppedContainerIds[name] = actor.get('ID', name)
+        elif action == 'die':
+            with self.inventoryLock:
+                self.containersByName.pop(name, None)
+                self.stoppedContainerIds[name] = actor.get('ID', name)
+        elif action == 'destroy':
+            with self.inventoryLock:
+                self.containersByName.pop(name, None)
+                self.stoppedContainerIds.pop(name, None)
+        elif action == 'rename':
+            # 'oldName' is reported with a leading "/"
+            oldName = actor.get('Attributes', {}).get('oldName', '').lstrip('/')
+            with self.inventoryLock:
+                container = self.containersByName.pop(oldName, None)
+                if container is not None:
+                    self.containersByName[name] = container
+                containerId = self.stoppedContainerIds.pop(oldName, None)
+                if containerId is not None:
+                    self.stoppedContainerIds[name] = containerId
+
+    def getContainer(self, containerName):
+        with self.inventoryLock:
+            return self.containersByName.get(containerName)
 
     def createContainer(self, image, name, memory, command, ports):
         if not self.ifContainerExist(name):
             try:
                 container = self.dockerClient.containers.run(image=image, name=name, mem_limit=memory, ports=ports,
                                                              command=command, detach=True)
+                with self.inventoryLock:
+                    self.containersByName[name] = container
+                    self.stoppedContainerIds.pop(name, None)
                 logging.info("Container has successfully created")
                 return container
             except Exception as e:
@@ -97,61 +316,250 @@ class DockerUtil:
         else:
             logging.error("Container has already existed, duplicated name")
 
+    def hasStoppedContainer(self, containerName):
+        with self.inventoryLock:
+            return containerName in self.stoppedContainerIds
+
+    def findStoppedContainer(self, containerName):
+        # Only calls the API when the index has a stopped container with this name
+        with self.inventoryLock:
+            containerId = self.stoppedContainerIds.get(containerName)
+        if containerId is None:
+            return None
+        try:
+            return self.dockerClient.containers.get(containerId)
+        except Exception as e:
+            logging.error(e)
+            return None
+
     def removeCountainer(self, containerName):
-        if self.ifContainerExist(containerName):
+        container = self.getContainer(containerName) or self.findStoppedContainer(containerName)
+        if container is not None:
             try:
-                container = self.dockerClient.containers.get(containerName)
                 container.remove(force=True)
+                with self.inventoryLock:
+                    self.containersByName.pop(containerName, None)
+                    self.stoppedContainerIds.pop(containerName, None)
                 logging.info("Container has been successfully deleted")
+                return True
             except Exception as e:
                 logging.error(e)
         else:
             logging.error("Container does not exist")
+        return False
 
-    # Sample Output
-    # {'read': '2020-08-28T16:55:21.279921925Z', 'preread': '2020-08-28T16:55:20.280187763Z', 'pids_stats': {'current': 1}, 'blkio_stats': {'io_service_bytes_recursive': [], 'io_serviced_recursive': [], 'io_queue_recursive': [], 'io_service_time_recursive': [], 'io_wait_time_recursive': [], 'io_merged_recursive': [], 'io_time_recursive': [], 'sectors_recursive': []}, 'num_procs': 0, 'storage_stats': {}, 'cpu_stats': {'cpu_usage': {'total_usage': 31387993, 'percpu_usage': [29253741, 2134252], 'usage_in_kernelmode': 10000000, 'usage_in_usermode': 20000000}, 'system_cpu_usage': 17094090000000, 'online_cpus': 2, 'throttling_data': {'periods': 0, 'throttled_periods': 0, 'throttled_time': 0}}, 'precpu_stats': {'cpu_usage': {'total_usage': 31387993, 'percpu_usage': [29253741, 2134252], 'usage_in_kernelmode': 10000000, 'usage_in_usermode': 20000000}, 'system_cpu_usage': 17092100000000, 'online_cpus': 2, 'throttling_data': {'periods': 0, 'throttled_periods': 0, 'throttled_time': 0}}, 'memory_stats': {'usage': 1544192, 'max_usage': 3375104, 'stats': {'active_anon': 98304, 'active_file': 0, 'cache': 0, 'dirty': 0, 'hierarchical_memory_limit': 999997440, 'hierarchical_memsw_limit': 0, 'inactive_anon': 0, 'inactive_file': 0, 'mapped_file': 0, 'pgfault': 698, 'pgmajfault': 0, 'pgpgin': 504, 'pgpgout': 480, 'rss': 98304, 'rss_huge': 0, 'total_active_anon': 98304, 'total_active_file': 0, 'total_cache': 0, 'total_dirty': 0, 'total_inactive_anon': 0, 'total_inactive_file': 0, 'total_mapped_file': 0, 'total_pgfault': 698, 'total_pgmajfault': 0, 'total_pgpgin': 504, 'total_pgpgout': 480, 'total_rss': 98304, 'total_rss_huge': 0, 'total_unevictable': 0, 'total_writeback': 0, 'unevictable': 0, 'writeback': 0}, 'limit': 999997440}, 'name': '/amir', 'id': '3d84761d3455d356c4e681e21cd185c01e2e494b8a04ffa6735245d88be0343a', 'networks': {'eth0': {'rx_bytes': 828, 'rx_packets': 10, 'rx_errors': 0, 'rx_dropped': 0, 'tx_bytes': 0, 'tx_packets': 0, 'tx_errors': 0, 'tx_dropped': 0}}}
-    def containerAllStats(self, containerName):
-        if self.ifContainerExist(containerName):
+    def renameContainer(self, containerName, newName):
+        container = self.getContainer(containerName)
+        if container is not None:
             try:
-                container = self.dockerClient.containers.get(containerName)
-                return container.stats(stream=False)
+                container.rename(newName)
+                with self.inventoryLock:
+                    self.containersByName.pop(containerName, None)
+                    self.containersByName[newName] = container
+                return True
             except Exception as e:
                 logging.error(e)
         else:
             logging.error("Container does not exist")
+        return False
 
-    def containerCpuUsage(self, containerName):
-        if self.ifContainerExist(containerName):
+    # Sample Output
+    # {'read': '2020-08-28T16:55:21.279921925Z', 'preread': '2020-08-28T16:55:20.280187763Z', 'pids_stats': {'current': 1}, 'blkio_stats': {'io_service_bytes_recursive': [], 'io_serviced_recursive': [], 'io_queue_recursive': [], 'io_service_time_recursive': [], 'io_wait_time_recursive': [], 'io_merged_recursive': [], 'io_time_recursive': [], 'sectors_recursive': []}, 'num_procs': 0, 'storage_stats': {}, 'cpu_stats': {'cpu_usage': {'total_usage': 31387993, 'percpu_usage': [29253741, 2134252], 'usage_in_kernelmode': 10000000, 'usage_in_usermode': 20000000}, 'system_cpu_usage': 17094090000000, 'online_cpus': 2, 'throttling_data': {'periods': 0, 'throttled_periods': 0, 'throttled_time': 0}}, 'precpu_stats': {'cpu_usage': {'total_usage': 31387993, 'percpu_usage': [29253741, 2134252], 'usage_in_kernelmode': 10000000, 'usage_in_usermode': 20000000}, 'system_cpu_usage': 17092100000000, 'online_cpus': 2, 'throttling_data': {'periods': 0, 'throttled_periods': 0, 'throttled_time': 0}}, 'memory_stats': {'usage': 1544192, 'max_usage': 3375104, 'stats': {'active_anon': 98304, 'active_file': 0, 'cache': 0, 'dirty': 0, 'hierarchical_memory_limit': 999997440, 'hierarchical_memsw_limit': 0, 'inactive_anon': 0, 'inactive_file': 0, 'mapped_file': 0, 'pgfault': 698, 'pgmajfault': 0, 'pgpgin': 504, 'pgpgout': 480, 'rss': 98304, 'rss_huge': 0, 'total_active_anon': 98304, 'total_active_file': 0, 'total_cache': 0, 'total_dirty': 0, 'total_inactive_anon': 0, 'total_inactive_file': 0, 'total_mapped_file': 0, 'total_pgfault': 698, 'total_pgmajfault': 0, 'total_pgpgin': 504, 'total_pgpgout': 480, 'total_rss': 98304, 'total_rss_huge': 0, 'total_unevictable': 0, 'total_writeback': 0, 'unevictable': 0, 'writeback': 0}, 'limit': 999997440}, 'name': '/amir', 'id': '3d84761d3455d356c4e681e21cd185c01e2e494b8a04ffa6735245d88be0343a', 'networks': {'eth0': {'rx_bytes': 828, 'rx_packets': 10, 'rx_errors': 0, 'rx_dropped': 0, 'tx_bytes': 0, 'tx_packets': 0, 'tx_errors': 0, 'tx_dropped': 0}}}
+    def containerAllStats(self, containerName):
+        container = self.getContainer(containerName)
+        if container is not None:
             try:
-                jsonData = json.loads(json.dumps(self.containerAllStats(containerName)))
-                cpuDelta = jsonData["cpu_stats"]["cpu_usage"]["total_usage"] - jsonData["precpu_stats"]["cpu_usage"][
-                    "total_usage"]
-                systemDelta = jsonData["cpu_stats"]["system_cpu_usage"] - jsonData["precpu_stats"]["system_cpu_usage"]
-                return cpuDelta / systemDelta * 100
+                return container.stats(stream=False)
             except Exception as e:
                 logging.error(e)
         else:
             logging.error("Container does not exist")
 
-    def containerMemoryUsage(self, containerName):
-        if self.ifContainerExist(containerName):
+    def getHostAddress(self, containerName):
+        return self.hostAddress
+
+    def getHostCapacity(self):
+        if self.hostCapacity is None:
+            info = self.dockerClient.info()
+            self.hostCapacity = (info.get("NCPU", 1), info.get("MemTotal", 0))
+        return self.hostCapacity
+
+    def allContainersList(self):
+        with self.inventoryLock:
+            return list(self.containersByName.values())
+
+    def ifContainerExist(self, containerName):
+        with self.inventoryLock:
+            return containerName in self.containersByName
+
+    def isNameTaken(self, containerName):
+        # Running or stopped container with this name (Docker refuses a new container with the same name)
+        with self.inventoryLock:
+            return containerName in self.containersByName or containerName in self.stoppedContainerIds
+
+
+def containerHostPort(container, containerPort="80/tcp"):
+    # Host port published for "containerPort", None if it is not published
+    bindings = ((container.attrs.get("HostConfig") or {}).get("PortBindings") or {}).get(containerPort)
+    if not bindings:
+        bindings = ((container.attrs.get("NetworkSettings") or {}).get("Ports") or {}).get(containerPort)
+    if not bindings or not bindings[0].get("HostPort", "").isdigit():
+        return None
+    return int(bindings[0]["HostPort"])
+
+
+def containerMemoryLimit(container):
+    # "mem_limit" of the container in bytes (0 -> no limit)
+    return (container.attrs.get("HostConfig") or {}).get("Memory") or 0
+
+
+class HostLoad:
+    # Load of one Docker host used for the placement: cpu = sum of the cpu usage (%, 100 = one cpu) of its web
+    # servers, memory = sum of the memory limits of its containers
+    def __init__(self, dockerUtil, numberOfCpus, memoryTotal):
+        self.dockerUtil = dockerUtil
+        self.numberOfCpus = numberOfCpus
+        self.memoryTotal = memoryTotal
+        self.cpuUsage = 0.0
+        self.memoryReserved = 0
+        self.numberOfContainers = 0
+
+    def cpuFraction(self):
+        return self.cpuUsage / (self.numberOfCpus * 100)
+
+    def memoryFraction(self, extraMemory=0):
+        if self.memoryTotal <= 0:
+            return 0.0
+        return (self.memoryReserved + extraMemory) / self.memoryTotal
+
+
+class PlacementScheduler:
+    def __init__(self, maxCpuFraction, maxMemoryFraction):
+        self.maxCpuFraction = maxCpuFraction
+        self.maxMemoryFraction = maxMemoryFraction
+
+    def chooseHost(self, hostLoads, memory):
+        # Output: the HostLoad with the lowest max(cpu, memory) fraction which can take a container of "memory"
+        # bytes (fewest containers on a tie), None if every host is full
+        candidates = [hostLoad for hostLoad in hostLoads
+                      if hostLoad.cpuFraction() < self.maxCpuFraction and
+                      hostLoad.memoryFraction(memory) <= self.maxMemoryFraction]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda hostLoad: (max(hostLoad.cpuFraction(), hostLoad.memoryFraction(memory)),
+                                                     hostLoad.numberOfContainers))
+
+
+class DockerHostPool:
+    # Several Docker hosts behind the DockerUtil interface: a container is found on the host which runs it (the
+    # names are unique over the pool), a new container goes to the host chosen by the PlacementScheduler.
+    # The cpu usage of the web servers comes from the control loop (updateContainerLoad), the containers being
+    # created are counted on their host until they show up in its index, so concurrent creations are spread
+    def __init__(self, dockerUtils, placementScheduler):
+        self.dockerUtils = dockerUtils
+        self.placementScheduler = placementScheduler
+        # {'app3': cpu usage (%)}
+        self.cpuUsageByContainer = {}
+        # {'app3': (DockerUtil, memory)} containers being created
+        self.pendingContainers = {}
+        self.placementLock = threading.Lock()
+
+    def findHost(self, containerName):
+        for dockerUtil in self.dockerUtils:
+            if dockerUtil.ifContainerExist(containerName):
+                return dockerUtil
+        return None
+
+    def hostLoads(self):
+        hostLoads = []
+        for dockerUtil in self.dockerUtils:
             try:
-                jsonData = json.loads(json.dumps(self.containerAllStats(containerName)))
-                # Return as MB
-                return (jsonData["memory_stats"]["usage"] / 1024) / 1024
+                numberOfCpus, memoryTotal = dockerUtil.getHostCapacity()
             except Exception as e:
-                logging.error(e)
-        else:
+                # The host is not reachable, no container is placed on it
+                logging.error("Docker host " + dockerUtil.hostAddress + " is not available: " + str(e))
+                continue
+            hostLoad = HostLoad(dockerUtil, numberOfCpus, memoryTotal)
+            for container in dockerUtil.allContainersList():
+                hostLoad.cpuUsage += max(0.0, self.cpuUsageByContainer.get(container.name, 0.0))
+                hostLoad.memoryReserved += containerMemoryLimit(container)
+                hostLoad.numberOfContainers += 1
+            hostLoads.append(hostLoad)
+        for host, memory in self.pendingContainers.values():
+            for hostLoad in hostLoads:
+                if hostLoad.dockerUtil is host:
+                    hostLoad.memoryReserved += memory
+                    hostLoad.numberOfContainers += 1
+        return hostLoads
+
+    def updateContainerLoad(self, webServerObjArray):
+        self.cpuUsageByContainer = {webServer.name: webServer.cpu for webServer in webServerObjArray
+                                    if not webServer.getIsDead() and webServer.hasStats()}
+
+    def createContainer(self, image, name, memory, command, ports):
+        with self.placementLock:
+            if self.ifContainerExist(name):
+                logging.error("Container has already existed, duplicated name")
+                return None
+            hostLoad = self.placementScheduler.chooseHost(self.hostLoads(), memory)
+            if hostLoad is None:
+                logging.error("No Docker host can take the container " + name)
+                return None
+            host = hostLoad.dockerUtil
+            self.pendingContainers[name] = (host, memory)
+        try:
+            logging.info("Container " + name + " is placed on " + host.hostAddress)
+            return host.createContainer(image, name, memory, command, ports)
+        finally:
+            with self.placementLock:
+                self.pendingContainers.pop(name, None)
+
+    def removeCountainer(self, containerName):
+        host = self.findHost(containerName)
+        if host is not None:
+            return host.removeCountainer(containerName)
+        # Not running, a stopped container with this name can be on any host
+        for dockerUtil in self.dockerUtils:
+            if dockerUtil.hasStoppedContainer(containerName):
+                return dockerUtil.removeCountainer(containerName)
+        logging.error("Container does not exist")
+        return False
+
+    def renameContainer(self, containerName, newName):
+        host = self.findHost(containerName)
+        if host is None:
             logging.error("Container does not exist")
+            return False
+        return host.renameContainer(containerName, newName)
+
+    def getContainer(self, containerName):
+        host = self.findHost(containerName)
+        return host.getContainer(containerName) if host is not None else None
+
+    def getHostAddress(self, containerName):
+        host = self.findHost(containerName)
+        return host.hostAddress if host is not None else None
+
+    def containerAllStats(self, containerName):
+        host = self.findHost(containerName)
+        return host.containerAllStats(containerName) if host is not None else None
 
     def allContainersList(self):
-        return self.dockerClient.containers.list()
+        containers = []
+        for dockerUtil in self.dockerUtils:
+            containers.extend(dockerUtil.allContainersList())
+        return containers
 
     def ifContainerExist(self, containerName):
-        for container in self.dockerClient.containers.list():
-            if containerName == container.name:
-                return True
-        return False
+        return containerName in self.pendingContainers or self.findHost(containerName) is not None
+
+    def isNameTaken(self, containerName):
+        return containerName in self.pendingContainers or any(dockerUtil.isNameTaken(containerName)
+                                                              for dockerUtil in self.dockerUtils)
+
+    def stopEventWatcher(self):
+        for dockerUtil in self.dockerUtils:
+            dockerUtil.stopEventWatcher()
 
 
 class FileReader:
@@ -173,60 +581,272 @@ class FileReader:
             return []
 
 
+class MetricIngestor:
+    # Reads the latest snapshot of every web server concurrently. All the reads of a cycle share one deadline, if a
+    # log file is not complete in time the last known value is used and the web server is marked as stale, so
+    # one stalled log file can not block the whole decision cycle. A web server whose read of a previous cycle is
+    # still running is not read again (the queue of the workers can not grow cycle after cycle)
+    # With a ServerStatusScraper the server-status values of the web server replace the ones of its log file
+    # Stats are stale when their sample (mtime of the log file) is older than "staleStatsAge" seconds, and are not
+    # used anymore when it is older than "maxStatsAge" seconds (None -> no limit)
+    def __init__(self, logsFolderPath, deadline, pollInterval, maxWorkers, serverStatusScraper=None,
+                 maxStatsAge=None, staleStatsAge=None):
+        self.logsFolderPath = logsFolderPath
+        self.deadline = deadline
+        self.pollInterval = pollInterval
+        self.maxStatsAge = maxStatsAge
+        self.staleStatsAge = staleStatsAge
+        self.executor = ThreadPoolExecutor(max_workers=maxWorkers)
+        self.serverStatusScraper = serverStatusScraper
+        # {'app1': (sample time, MetricSnapshot)}
+        self.lastKnownStats = {}
+        # {'app1': time.time() of the removal} the names are reused (BackendRegistry), a log file which was not
+        # written after the removal of the previous web server with the same name belongs to that one
+        self.forgottenAt = {}
+        # {'app1': Future} the last read submitted for every web server
+        self.inFlight = {}
+
+    def readLatestStats(self, name, stopTime=None):
+        fileReader = FileReader(self.logsFolderPath + name)
+        if stopTime is None:
+            stopTime = time.monotonic() + self.deadline
+        while True:
+            try:
+                sampleTime = os.path.getmtime(self.logsFolderPath + name)
+            except OSError:
+                sampleTime = None
+            if name in self.forgottenAt and (sampleTime is None or sampleTime <= self.forgottenAt[name]):
+                return None
+            stats = parseStatsLines(fileReader.readNumberOfLines(7), sampleTime)
+            if stats is not None:
+                return stats
+            if time.monotonic() + self.pollInterval > stopTime:
+                return None
+            time.sleep(self.pollInterval)
+
+    def readWebServer(self, webServer, stopTime=None):
+        # Output: (stats, ServerStatus or None)
+        # The server-status page is only read in the time left before the deadline, the log file values are kept
+        # if it can not be read in time
+        if stopTime is None:
+            stopTime = time.monotonic() + self.deadline
+        stats = self.readLatestStats(webServer.name, stopTime)
+        serverStatus = None
+        if stats is not None and self.serverStatusScraper is not None:
+            serverStatus = self.serverStatusScraper.fetch(webServer.name, webServer.hostAddress, webServer.mappedPort,
+                                                          stopTime - time.monotonic())
+            if serverStatus is not None:
+                stats.busyThreadsCount = serverStatus.busyWorkers
+                stats.processingReqTime = serverStatus.processingReqTime()
+        return stats, serverStatus
+
+    def collect(self, webServerObjArray, skipDeathFlag=False):
+        self.apply(self.read(webServerObjArray, skipDeathFlag))
+
+    def read(self, webServerObjArray, skipDeathFlag=False):
+        # Output: {WebServer: (stats, ServerStatus) or None}, the WebServer objects are not changed (see apply)
+        # The deadline is set when the reads are submitted, a read which waited for a worker only gets the time left
+        stopTime = time.monotonic() + self.deadline
+        futures = {}
+        for webServer in webServerObjArray:
+            if not webServer.getIsDead() and not (skipDeathFlag and webServer.getDeathFlag()):
+                future = self.inFlight.get(webServer.name)
+                if future is not None and not future.done():
+                    # Still reading for a previous cycle (it gives up at its own deadline)
+                    futures[webServer] = None
+                    continue
+                future = self.executor.submit(self.readWebServer, webServer, stopTime)
+                self.inFlight[webServer.name] = future
+                futures[webServer] = future
+        # Workers give up by themselves at the deadline, the small margin only covers the scheduling delay
+        wait([future for future in futures.values() if future is not None],
+             timeout=max(stopTime - time.monotonic(), 0) + self.pollInterval)
+        results = {}
+        for webServer, future in futures.items():
+            if future is None or not future.done():
+                if future is not None:
+                    # Not started yet -> never started, already running -> not submitted again until it ends
+                    future.cancel()
+                results[webServer] = None
+            else:
+                results[webServer] = future.result() if future.exception() is None else None
+        return results
+
+    def apply(self, results):
+        now = time.time()
+        for webServer, result in results.items():
+            if webServer.getIsDead():
+                # Removed while its stats were read
+                continue
+            stats, serverStatus = result if result is not None else (None, None)
+            if stats is not None:
+                if stats.sampleTime is None:
+                    # The log file was replaced between its read and its mtime, the sample is taken as a new one
+                    stats.sampleTime = now
+                if webServer.name in self.lastKnownStats:
+                    stats.deriveRates(self.lastKnownStats[webServer.name][1])
+                self.lastKnownStats[webServer.name] = (stats.sampleTime, stats)
+                webServer.setStatus(stats)
+                if serverStatus is not None:
+                    webServer.setServerStatus(serverStatus)
+                self.setAge(webServer, stats.sampleTime, now, False)
+            elif webServer.name in self.lastKnownStats:
+                sampleTime, stats = self.lastKnownStats[webServer.name]
+                webServer.setStatus(stats)
+                self.setAge(webServer, sampleTime, now, True)
+            else:
+                webServer.setStale(True, None)
+                logging.warning("No stats available yet for " + webServer.name)
+
+    def setAge(self, webServer, sampleTime, now, readFailed):
+        # The age of the stats is the age of the sample (mtime of the log file), not of the last read: a complete log
+        # file which is not rewritten anymore (LogCollector.sh / StatsCollector.py hung) gets stale then expired
+        age = now - sampleTime
+        if self.maxStatsAge is not None and age > self.maxStatsAge:
+            webServer.setStale(True, sampleTime, expired=True)
+            logging.warning("Stats of " + webServer.name + " are older than " + str(self.maxStatsAge) +
+                            " seconds, the web server is left out of the decision")
+        elif readFailed:
+            webServer.setStale(True, sampleTime)
+            logging.warning("Stats of " + webServer.name + " are stale, using the last known value")
+        elif self.staleStatsAge is not None and age > self.staleStatsAge:
+            webServer.setStale(True, sampleTime)
+            logging.warning("Log file of " + webServer.name + " has not been written for " + str(round(age, 1)) +
+                            " seconds, its stats are stale")
+        else:
+            webServer.setStale(False, sampleTime)
+
+    def forget(self, name):
+        self.lastKnownStats.pop(name, None)
+        self.inFlight.pop(name, None)
+        self.forgottenAt[name] = time.time()
+        if self.serverStatusScraper is not None:
+            self.serverStatusScraper.forget(name)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+        if self.serverStatusScraper is not None:
+            self.serverStatusScraper.shutdown()
+
+
 class HaproxyConfigModifier:
+    # The config file is never changed in place: the new content is written to a temporary file in the same folder,
+    # flushed to the disk and renamed over the config file, so HaProxy reads either the old or the new config
     def __init__(self, filePath):
         self.filePath = filePath
-
-    def addNewDestination(self, destinationString):
-        with open(self.filePath, "a") as myfile:
-            # Destination string needs to have 4 spaces at the beginning, like below
-            #    server web1.example.com  192.168.1.101:80
-            myfile.write(destinationString)
-
-    def removeTheNewestDestination(self):
-        # Based on the answer from https://stackoverflow.com/questions/1877999/delete-final-line-in-file-with-python
-        with open(self.filePath, "r+") as file:
-            file.seek(0, os.SEEK_END)
-            pos = file.tell() - 1
-            while pos > 0 and file.read(1) != "\n":
-                pos -= 1
-                file.seek(pos, os.SEEK_SET)
-            if pos > 0:
-                file.seek(pos, os.SEEK_SET)
-                file.truncate()
+        # Hash of the content written by this object (None -> not written yet), see HaproxyConfig.configHash
+        self.configHash = None
+        self.lock = threading.RLock()
+
+    def writeTemporaryFile(self, configStr):
+        # Output: path of the temporary file (same folder as the config file, same permissions)
+        directory, fileName = os.path.split(os.path.abspath(self.filePath))
+        fd, tempPath = tempfile.mkstemp(prefix="." + fileName + ".", suffix=".tmp", dir=directory)
+        try:
+            try:
+                os.fchmod(fd, os.stat(self.filePath).st_mode & 0o7777)
+            except FileNotFoundError:
+                os.fchmod(fd, 0o644)
+            with os.fdopen(fd, "w") as file:
+                file.write(configStr)
+                file.flush()
+                os.fsync(file.fileno())
+        except Exception:
+            self.discardTemporaryFile(tempPath)
+            raise
+        return tempPath
+
+    def replaceConfigFile(self, tempPath, newHash):
+        with self.lock:
+            os.replace(tempPath, self.filePath)
+            self.configHash = newHash
+        # The rename itself is only durable once the folder is flushed
+        try:
+            directoryFd = os.open(os.path.dirname(os.path.abspath(self.filePath)), os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(directoryFd)
+        except OSError:
+            pass
+        finally:
+            os.close(directoryFd)
+
+    def discardTemporaryFile(self, tempPath):
+        try:
+            os.remove(tempPath)
+        except FileNotFoundError:
+            pass
 
     def reWriteWholeConfigFile(self, configStr):
-        # Remove all texts (clean the file)
-        with open(self.filePath, 'w'): pass
-
-        with open(self.filePath, 'w+') as fh:
-            fh.write(configStr)
+        # Output: False if the config file already has this content (nothing is written)
+        newHash = configHash(configStr)
+        with self.lock:
+            if newHash == self.configHash:
+                return False
+            self.replaceConfigFile(self.writeTemporaryFile(configStr), newHash)
+            return True
 
 
 class OsCommandRunner:
     def executeCommand(self, command):
+        # Output: None on success, the exit status of the command otherwise
         com = os.popen(command)
         logging.info("----------- Executing Command: " + command + " -----------")
         logging.info(com.read())
-        logging.info(com.close())
+        exitStatus = com.close()
+        logging.info(exitStatus)
         logging.info("----------------------------------------------------------")
+        return exitStatus
 
 
 class WebServer:
-    def __init__(self, name, mappedPort, weight):
+    # Numbers used by the batched decision, they live in the FleetState row of the web server once it is registered
+    # (BackendRegistry.add -> FleetState.addRow), so the ingestion writes them straight into the arrays
+    cpu = FleetField(float)
+    memoryUsage = FleetField(float)
+    busyThreadsCount = FleetField(int)
+    processingReqTime = FleetField(float)
+    score = FleetField(float)
+    weight = FleetField(float)
+    scaleUpFlag = FleetField(bool)
+    scaleDownFlag = FleetField(bool)
+    deathFlag = FleetField(bool)
+    isDead = FleetField(bool)
+
+    def __init__(self, name, mappedPort, weight, hostAddress=None):
+        # Not registered yet (see FleetState.addRow)
+        self.fleetState = None
+        self.fleetRow = None
         self.name = name
+        # IP address of the Docker host which runs the container
+        self.hostAddress = hostAddress if hostAddress is not None else ServerIpAddress
         self.weight = weight
         self.mappedPort = mappedPort
+        # Numbers of the latest MetricSnapshot (memory and traffic in bytes, rates in bytes per second)
         self.cpu = -1
         self.memory = -1
         self.memoryUsage = -1
         self.inputTraffic = -1
         self.outPutTraffic = -1
+        self.inputRate = -1
+        self.outPutRate = -1
         self.busyThreadsCount = -1
         self.processingReqTime = -1
+        # Only set when the server-status page is read directly (see ServerStatusScraper.py)
+        self.idleWorkers = -1
+        self.reqPerSec = -1
+        self.bytesPerSec = -1
+        self.scoreboardCounts = {}
         self.score = 0
         self.scaleUpFlag = False
         self.scaleDownFlag = False
+        # isStale = True --> the last ingestion cycle could not read fresh stats, the values are the last known ones
+        # (statsTimestamp is the time of the sample, the mtime of the log file, None if no stats have ever been read)
+        # isExpired = True --> the last known values are older than MaxStatsAge, not used by the decision
+        self.isStale = True
+        self.isExpired = False
+        self.statsTimestamp = None
 
         # Situations:
         # deathFlag = false  isDead = false --> webServer is alive and active (as a active destination in LB config)
@@ -235,14 +855,25 @@ class WebServer:
         self.deathFlag = False
         self.isDead = False
 
-    def setStatus(self, cpu, memory, memoryUsage, inputTraffic, outPutTraffic, busyThreadsCount, processingReqTime):
-        self.cpu = cpu
-        self.memory = memory
-        self.memoryUsage = memoryUsage
-        self.inputTraffic = inputTraffic
-        self.outPutTraffic = outPutTraffic
-        self.busyThreadsCount = busyThreadsCount
-        self.processingReqTime = processingReqTime
+    def setStatus(self, snapshot):
+        self.cpu = snapshot.cpu
+        self.memory = snapshot.memory
+        self.memoryUsage = snapshot.memoryUsage
+        self.inputTraffic = snapshot.inputTraffic
+        self.outPutTraffic = snapshot.outPutTraffic
+        self.inputRate = snapshot.inputRate
+        self.outPutRate = snapshot.outPutRate
+        self.busyThreadsCount = snapshot.busyThreadsCount
+        self.processingReqTime = snapshot.processingReqTime
+        self.updateFleetRow()
+
+    def setServerStatus(self, serverStatus):
+        self.busyThreadsCount = serverStatus.busyWorkers
+        self.processingReqTime = serverStatus.processingReqTime()
+        self.idleWorkers = serverStatus.idleWorkers
+        self.reqPerSec = serverStatus.reqPerSec
+        self.bytesPerSec = serverStatus.bytesPerSec
+        self.scoreboardCounts = serverStatus.scoreboardCounts
 
     def isStatusSet(self):
         if (self.cpu > -1 and self.memory > -1 and self.memoryUsage > -1 and self.inputTraffic > -1 and
@@ -250,9 +881,17 @@ class WebServer:
             return True
         return False
 
-    def calcucateScoreAndFlags(self, X, Y, Z, maxProcessingTime, scaleUpThr, scaleDownThr):
+    # Reference formula of the per web server score and flags, the loop uses the batched FleetState.evaluate which
+    # must give the same results (tests/test_fleet_state.py)
+    # N (network throughput, in % of maxNetworkRate) and M (memory pressure) are optional, 0 -> original score
+    def calcucateScoreAndFlags(self, X, Y, Z, maxProcessingTime, scaleUpThr, scaleDownThr, N=0, M=0,
+                               maxNetworkRate=1):
         self.score = X * ((self.memoryUsage + self.cpu) / 2) + Y * (self.busyThreadsCount / 4) + Z * (
                 self.processingReqTime / maxProcessingTime)
+        if N:
+            self.score += N * ((self.inputRate + self.outPutRate) / maxNetworkRate * 100)
+        if M:
+            self.score += M * self.memoryUsage
         if self.score > scaleUpThr:
             self.scaleUpFlag = True
             self.scaleDownFlag = False
@@ -264,6 +903,32 @@ class WebServer:
             self.scaleDownFlag = False
         return self.score
 
+    def setStale(self, flag, statsTimestamp, expired=False):
+        self.isStale = flag
+        self.isExpired = expired
+        self.statsTimestamp = statsTimestamp
+        self.updateFleetRow()
+
+    def updateFleetRow(self):
+        # The numbers of the FleetState row which are not attributes of the web server
+        if self.fleetState is not None:
+            self.fleetState.setStatus(self.fleetRow, max(self.inputRate, 0) + max(self.outPutRate, 0),
+                                      self.hasStats())
+
+    def getIsStale(self):
+        return self.isStale
+
+    def getIsExpired(self):
+        return self.isExpired
+
+    def hasStats(self):
+        # Stats the decision can use
+        return self.statsTimestamp is not None and not self.isExpired
+
+    def isBooting(self):
+        # No stats have ever been read
+        return self.statsTimestamp is None
+
     def setWeight(self, weight):
         self.weight = weight
 
@@ -289,13 +954,33 @@ class WebServer:
         return self.isDead
 
 
-def createConfigFileBasedOnAliveCountainer(webServerObjArray, haproxyInitConfigFileTxt):
-    tempStr = ''
-    for webServer in webServerObjArray:
-        if not webServer.getDeathFlag():
-            tempStr += "    server " + webServer.name + "  " + ServerIpAddress + ':' + str(
-                webServer.mappedPort) + " weight " + str(math.ceil(webServer.weight)) + "\n"
-    return haproxyInitConfigFileTxt + tempStr
+def describeMetrics(metrics):
+    metrics.describe("autoscaler_cycle_seconds", "histogram", "Duration of a control loop cycle")
+    metrics.describe("autoscaler_stage_seconds", "histogram", "Duration of a stage of the control loop cycle")
+    metrics.describe("autoscaler_decisions_total", "counter", "Scaling votes of the cycles by outcome")
+    metrics.describe("autoscaler_scale_events_total", "counter", "Applied scale ups / scale downs")
+    metrics.describe("autoscaler_scaled_web_servers_total", "counter", "Web servers added / taken out")
+    metrics.describe("autoscaler_drained_web_servers_total", "counter", "Drained web servers removed by the "
+                                                                         "DrainManager")
+    metrics.describe("autoscaler_web_servers", "gauge", "Web servers by state")
+    metrics.describe("autoscaler_average_score", "gauge", "Average score of the web servers in the load balancer")
+    metrics.describe("autoscaler_web_server_score", "gauge", "Score of the web server")
+    metrics.describe("autoscaler_web_server_stale", "gauge", "1 if the last stats of the web server could not be "
+                                                             "read in time")
+    metrics.describe("autoscaler_web_server_stats_age_seconds", "gauge", "Age of the stats used for the web server")
+    metrics.describe("autoscaler_docker_call_seconds", "histogram", "Duration of the Docker API calls")
+    metrics.describe("autoscaler_docker_call_errors_total", "counter", "Failed Docker API calls")
+    metrics.describe("autoscaler_haproxy_call_seconds", "histogram", "Duration of the HaProxy config / runtime "
+                                                                     "API / reload calls")
+    metrics.describe("autoscaler_haproxy_call_errors_total", "counter", "Failed HaProxy calls")
+    metrics.describe("autoscaler_haproxy_reloads_total", "counter", "HaProxy config applies by result (reloaded, "
+                                                                    "skipped when unchanged, invalid, failed)")
+    metrics.describe("autoscaler_queue_size", "gauge", "Items waiting in the daemon queues")
+    metrics.describe("autoscaler_dropped_stats_total", "counter", "Stats replaced by newer ones before a decision")
+    metrics.describe("autoscaler_skipped_actuations_total", "counter", "Weight only actuations skipped while "
+                                                                      "another actuation was in flight")
+    metrics.describe("autoscaler_actuation_lag_seconds", "histogram", "Time from a decision to the end of its "
+                                                                      "actuation")
 
 
 def checkMajority(arrayToCheck, numberofWebServers):
@@ -311,201 +996,513 @@ def checkMajority(arrayToCheck, numberofWebServers):
         return False
 
 
-if __name__ == "__main__":
-
-    newlyWebServerList = {}
-    initialScenarioContainerList = {}
-    # numberOfWebServers = 1  # There is already 1 web server for initial scenario
-    AllWebServersOBJ = []
-    # Objects
-    client = docker.DockerClient(base_url=DockerApiUrlPort)
-    dockerUtils = DockerUtil(client)
-    osCommandRunner = OsCommandRunner()
-    haproxyConfigModifier = HaproxyConfigModifier(HaProxyConfigFilePath)
-    # ----------------------------------------------------------------------------------------------------------------
-    # ----------------------------------------------------------------------------------------------------------------
-    # Create Initial Scenario
-    # Create Sender Httperf
-    # 100000000 -> ~~ 100 Meg (Need to be converted to 1024)
-    senderContainer = dockerUtils.createContainer("bvnf6", "sender", 1000000000, command="tail -f /dev/null", ports={
-        # Container Port : Host Port
-        '80': 8000
-    })
-    # Create web server
-    webServerContainre = dockerUtils.createContainer("httpd_final", "app" + str(1), 1000000000,
-                                                     command='', ports={
-            # Container Port : Host Port
-            '80': 8010 + 1
-        })
-
-    AllWebServersOBJ.append(WebServer("app1", 8010 + 1, 1))
-    # Edit the haProxy config file and add the destination
-    # Destination string needs to have 4 spaces at the beginning, like below
-    #    server web1.example.com  192.168.1.101:80 weight 10
-    haproxyConfigModifier.reWriteWholeConfigFile(
-        createConfigFileBasedOnAliveCountainer(AllWebServersOBJ, HaProxyInitConfigFile))
-    time.sleep(2)
-    # Restarting the HaProxy service
-    osCommandRunner.executeCommand("service haproxy restart")
-    time.sleep(1)
-    osCommandRunner.executeCommand("service haproxy status | grep Active")
-
-    if senderContainer.id:
-        initialScenarioContainerList["sender"] = senderContainer.id
-    if webServerContainre.id:
-        initialScenarioContainerList["app1"] = webServerContainre.id
-
-    if initialScenarioContainerList.get("sender") and initialScenarioContainerList.get("app1"):
-        logging.info("Initial scenario is deployed")
-    else:
+class Actuation:
+    # What a decision (AutoScaler.decide) leaves to AutoScaler.actuate
+    def __init__(self, fleetDecision):
+        self.fleetDecision = fleetDecision
+        self.scalingPlan = None
+        # Web servers whose container is removed (SECTION 2 without the runtime API)
+        self.removedWebServers = []
+        # {'app1': 37.5} weights to push to HaProxy, None without the runtime API
+        self.weights = None
+        # Web servers to create (SECTION 3) and their weight
+        self.numberToAdd = 0
+        self.weight = -1
+        # Web servers taken out of the load balancer (SECTION 4)
+        self.drainedWebServers = []
+        # Event loop time of the decision (AutoScalerDaemon)
+        self.decidedAt = None
+
+    def changesBalancer(self):
+        return bool(self.removedWebServers or self.numberToAdd or self.drainedWebServers)
+
+
+class AutoScaler:
+    # The control loop: SECTION 1 (stats) -> SECTION 2 (scores, weights, physical removal) -> SECTION 3 (scale up)
+    # -> SECTION 4 (scale down). Docker, HaProxy and the stats source are passed in, so the same loop runs against
+    # the real services (see "__main__") or against fakes (see Simulator.py). "dockerUtils" is a DockerHostPool
+    def __init__(self, dockerUtils, osCommandRunner, haproxyConfigModifier, haproxyRuntimeModifier, metricIngestor,
+                 warmPoolManager, metrics=None):
+        # Live, draining and dead web servers, "AllWebServersOBJ" is the list of the live and draining ones taken at
+        # the beginning of every cycle. Every registered web server has a FleetState row (FleetState.webServers)
+        self.fleetState = FleetState()
+        self.backendRegistry = BackendRegistry(WebServerNamePrefix, WebServerPortBase, self.fleetState)
+        self.AllWebServersOBJ = []
+        self.dockerUtils = dockerUtils
+        self.osCommandRunner = osCommandRunner
+        self.haproxyConfigModifier = haproxyConfigModifier
+        self.haproxyRuntimeModifier = haproxyRuntimeModifier
+        self.metricIngestor = metricIngestor
+        self.warmPoolManager = warmPoolManager
+        self.weightSynchronizer = WeightSynchronizer(haproxyRuntimeModifier, WeightSyncDeadBand,
+                                                     WeightSyncMinInterval)
+        self.scalingPolicy = ScalingPolicy(ScalingTargetScore, ScaleUpAverageThreshold, ScalingHysteresisBand,
+                                           ScalingMaxStep, ScalingMinWebServers, ScalingMaxWebServers,
+                                           ScaleUpCooldown, ScaleDownCooldown)
+        self.scalingExecutor = ThreadPoolExecutor(max_workers=ScalingMaxStep)
+        self.drainManager = DrainManager(haproxyRuntimeModifier, dockerUtils, metricIngestor, DrainTimeout,
+                                         DrainPollInterval)
+        self.scoreForecaster = ScoreForecaster(ForecastAlpha, ForecastBeta, ForecastHorizon, ForecastMinSamples,
+                                               ForecastLeadWindow)
+        self.metrics = metrics if metrics is not None else Metrics()
+        describeMetrics(self.metrics)
+        self.haproxyConfigRenderer = HaproxyConfigRenderer(HaProxyInitConfigFile)
+        self.haproxyReloader = HaproxyReloader(haproxyConfigModifier, osCommandRunner,
+                                               HaProxyValidateCommand if HaProxyValidateConfig else None,
+                                               HaProxyReloadCommand, self.metrics)
+        # The config file persisted by the runtime API changes is checked the same way (not reloaded)
+        haproxyRuntimeModifier.configWriter = self.haproxyReloader
+        # Web servers decided but not registered yet (their actuation is queued or running), counted as booting by
+        # the next decisions. The lock also covers the registration, so a decision never counts them twice
+        self.numberOfPendingWebServers = 0
+        self.pendingLock = threading.Lock()
+
+    def deployInitialScenario(self, createSender=True):
+        initialScenarioContainerList = {}
+        # Create Sender Httperf
+        # 100000000 -> ~~ 100 Meg (Need to be converted to 1024)
+        if createSender:
+            senderContainer = self.dockerUtils.createContainer("bvnf6", "sender", 1000000000,
+                                                               command="tail -f /dev/null", ports={
+                    # Container Port : Host Port
+                    '80': 8000
+                })
+            if senderContainer is not None and senderContainer.id:
+                initialScenarioContainerList["sender"] = senderContainer.id
+        # Create web server
+        webServerName, webServerPort = self.backendRegistry.allocate()
+        webServerContainre = self.dockerUtils.createContainer("httpd_final", webServerName, 1000000000,
+                                                              command='', ports={
+                # Container Port : Host Port
+                '80': webServerPort
+            })
+        if webServerContainre is not None and webServerContainre.id:
+            initialScenarioContainerList[webServerName] = webServerContainre.id
+
+        self.backendRegistry.add(WebServer(webServerName, webServerPort, 1,
+                                           self.dockerUtils.getHostAddress(webServerName)))
+        self.AllWebServersOBJ = self.backendRegistry.webServers()
+        # Edit the haProxy config file and add the destination
+        # Destination string needs to have 4 spaces at the beginning, like below
+        #    server web1.example.com  192.168.1.101:80 weight 10
+        # This is the only reload when the runtime API is used (it loads the server slots)
+        if HaProxyUseRuntimeApi:
+            self.haproxyRuntimeModifier.assignSlot(webServerName, self.AllWebServersOBJ[0].hostAddress, webServerPort,
+                                                   1, "ready")
+            configStr = self.haproxyRuntimeModifier.renderConfig()
+        else:
+            configStr = self.haproxyConfigRenderer.renderWebServers(self.AllWebServersOBJ)
+        self.haproxyReloader.apply(configStr)
+
+        if initialScenarioContainerList.get(webServerName) and (initialScenarioContainerList.get("sender") or
+                                                         not createSender):
+            logging.info("Initial scenario is deployed")
+            # Standby web servers are started in the background
+            self.warmPoolManager.start()
+            if HaProxyUseRuntimeApi:
+                self.drainManager.start()
+            return True
         logging.error("Could not create initial scenario")
-    # ----------------------------------------------------------------------------------------------------------------
-    # ----------------------------------------------------------------------------------------------------------------
-
-    forceToCreate = True
-    # Main Loop
-    logging.info(" ")
-    logging.info("**** STARTING THE MAIN LOOP ****")
-    logging.info(" ")
-    while True:
-        sumOfAllInvertedScore = 0
-        for webServer in AllWebServersOBJ:
-            readAllStats = False
-            # ******* SECTION 1 *******
-            # Check weather web server is still alive and Loop until all status are available
-            # We still check the web server's status even if it has death flag since in order to remove the
-            # container we need to check the "busy" Thread = 1 after checking this thread, the script sets
-            # the "isDead" flag and removes the container physically at section "#******* SECTION 2 *******#"
-            if not webServer.getIsDead():
-                while not readAllStats:
-                    fileReader = FileReader(WebServersLogsFolderPath + webServer.name)
-                    temp = []
-                    # {'Cpu': '0.01', 'Memory': '12.58MiB', 'MemoryUsage': '0.21', 'InputTraffic': '1.82kB', 'OutPutTraffic': '9.1kB', 'BusyThreadsCount': '1', 'ProcessingReqTime': '200'}
-                    stats = fileReader.readNumberOfLines(7)
-                    for data in stats:
-                        temp.append(((data.split())[1]).replace("%", ""))
-                    if len(temp) == 7:
-                        readAllStats = True
-                        # cpu, memory, memoryUsage, inputTraffic, outPutTraffic, busyThreadsCount, processingReqTime
-                        webServer.setStatus(float(temp[0]), temp[1], float(temp[2]), temp[3], temp[4], int(temp[5]), int(temp[6]))
-                        webServer.calcucateScoreAndFlags(Coefficient_X, Coefficient_Y, Coefficient_Z,
-                                                         500, ScaleUpThreshold, ScaleDownThreshold)
-                        # Sum Up all inverted score for calculation the weight of the web server in the next step
-                        sumOfAllInvertedScore += 1 / webServer.score
-
-                        print("--------------------------")
-                        print(webServer.name + " score is: " + str(webServer.score))
-                        print(webServer.name + " death flag is: " + str(webServer.getDeathFlag()))
-                        print(temp)
-                        print("sumOfAllInvertedScore  " + str(sumOfAllInvertedScore))
-                        print("--------------------------")
-                        time.sleep(1)
+        return False
 
+    def createWebServers(self, count, weight):
+        # Standby containers are promoted first, the missing containers are created concurrently (slow path)
+        # The "count" web servers were counted as pending by the decision, they are registered (booting) in one go
+        newWebServers = []
+        containersToCreate = []
+        warmPoolEmpty = False
+        try:
+            for _ in range(count):
+                # Name and port of a removed web server are reused, unless its container is still there
+                newWebServerName, newWebServerPort = self.backendRegistry.allocate(self.dockerUtils.isNameTaken)
+                promotedPort = None
+                if not warmPoolEmpty:
+                    promotedPort = self.warmPoolManager.promote(newWebServerName)
+                    warmPoolEmpty = promotedPort is None
+                if promotedPort is None:
+                    containersToCreate.append((newWebServerName, newWebServerPort))
+                else:
+                    newWebServerPort = promotedPort
+                newWebServers.append(WebServer(newWebServerName, newWebServerPort, weight))
+        finally:
+            with self.pendingLock:
+                for webServer in newWebServers:
+                    self.backendRegistry.add(webServer)
+                self.numberOfPendingWebServers -= count
+        futures = [self.scalingExecutor.submit(self.dockerUtils.createContainer, "httpd_final", name, 1000000000,
+                                               command='', ports={
+                # Container Port : Host Port
+                '80': port
+            }) for name, port in containersToCreate]
+        wait(futures)
+        createdWebServers = []
+        for webServer in newWebServers:
+            # The host is known once the container is created (placement) or promoted
+            hostAddress = self.dockerUtils.getHostAddress(webServer.name)
+            if hostAddress is None:
+                # Not created (e.g. every Docker host is full)
+                self.backendRegistry.markDead(webServer)
+                logging.error("Web Server " + webServer.name + " could not be created")
+                continue
+            webServer.hostAddress = hostAddress
+            createdWebServers.append(webServer)
+            logging.info("Web Server " + webServer.name + " has been added (" + webServer.hostAddress + ")")
+        return createdWebServers
+
+    def applyBalancerChanges(self, removedWebServers, addedWebServers, drainedWebServers):
+        # All the HaProxy changes of the cycle at once: one runtime API batch, or one reload
+        if not (removedWebServers or addedWebServers or drainedWebServers):
+            return
+        try:
+            if HaProxyUseRuntimeApi:
+                try:
+                    self.haproxyRuntimeModifier.applyChanges(
+                        # A new web server gets the highest weight of its decision (see createWebServers), that is
+                        # the highest HaProxy weight on the scale of WeightSynchronizer
+                        added=[(webServer.name, webServer.hostAddress, webServer.mappedPort, MaxWeight)
+                               for webServer in addedWebServers],
+                        drained=[webServer.name for webServer in drainedWebServers],
+                        removed=[webServer.name for webServer in removedWebServers])
+                except HaproxyRuntimeError as e:
+                    logging.error(e)
+                    if addedWebServers or drainedWebServers:
+                        self.haproxyReloader.apply(self.haproxyRuntimeModifier.renderConfig())
+            elif addedWebServers or drainedWebServers:
+                logging.info("Modify and Reload HaProxy")
+                # Edit the haProxy config file: the alive web servers without death flag are the destinations
+                # Destination string needs to have 4 spaces at the beginning, like below
+                #    server web1.example.com  192.168.1.101:80 weight 10
+                self.haproxyReloader.apply(
+                    self.haproxyConfigRenderer.renderWebServers(self.backendRegistry.webServers()))
+        except HaproxyConfigError as e:
+            # HaProxy keeps running its current config (counted as "invalid" by the HaproxyReloader), the next
+            # change renders the whole config again
+            logging.error(e)
+
+    def run(self):
+        logging.info(" ")
+        logging.info("**** STARTING THE MAIN LOOP ****")
+        logging.info(" ")
+        while True:
+            self.runCycle()
+            time.sleep(CycleInterval)
+
+    def runCycle(self):
+        # One cycle of the synchronous loop: SECTION 1, the decision (SECTION 2, 3 and 4) and its actuation in a row.
+        # AutoScalerDaemon runs the same three stages as independent tasks
+        stopwatch = self.metrics.stopwatch("autoscaler_stage_seconds", "stage")
+        self.collectStats()
+        stopwatch.lap("ingestion")
+        actuation = self.decide(stopwatch)
+        self.actuate(actuation, stopwatch)
+        self.metrics.observe("autoscaler_cycle_seconds", stopwatch.elapsed())
+        return actuation.fleetDecision
+
+    def refreshWebServers(self):
+        # The dead web servers are dropped from the registry first, so the cycle only goes over the live and
+        # draining ones. The port of a promoted standby container goes back to the warm pool
+        for webServer in self.backendRegistry.compact():
+            self.warmPoolManager.releasePort(webServer.mappedPort)
+        self.AllWebServersOBJ = self.backendRegistry.webServers()
+        return self.AllWebServersOBJ
+
+    def collectStats(self):
+        # ******* SECTION 1 *******
+        # Read the latest stats of every web server which is still alive, in parallel
+        # Without the runtime API we still check the web server's status even if it has death flag since in order
+        # to remove the container we need to check the "busy" Thread = 1 after checking this thread, the script sets
+        # the "isDead" flag and removes the container physically at section "#******* SECTION 2 *******#"
+        # With the runtime API the drained web servers are followed by the DrainManager (HaProxy sessions)
+        # A web server whose log file could not be read before the deadline keeps its last known stats (isStale)
+        self.metricIngestor.apply(self.readStats(self.refreshWebServers()))
+
+    def readStats(self, webServerObjArray):
+        # Blocking part of SECTION 1 (see MetricIngestor.read), the results are applied with MetricIngestor.apply
+        return self.metricIngestor.read(webServerObjArray, skipDeathFlag=HaProxyUseRuntimeApi)
+
+    def decide(self, stopwatch):
+        # SECTION 2, 3 and 4 on the latest stats, without any Docker / HaProxy call: the registry is updated (drained
+        # and removed web servers) and the calls are left to actuate()
+        with self.pendingLock:
+            self.refreshWebServers()
+            numberOfPending = self.numberOfPendingWebServers
+        # Host load for the placement of the next web servers
+        self.dockerUtils.updateContainerLoad(self.AllWebServersOBJ)
+        # Scores, flags and weights of all web servers are calculated in one batched pass on the rows written by the
+        # ingestion (see FleetState.py)
+        fleetDecision = self.fleetState.evaluate(Coefficient_X, Coefficient_Y, Coefficient_Z, 500, ScaleUpThreshold,
+                                                 ScaleDownThreshold, ScaleUpAverageThreshold, Coefficient_N,
+                                                 Coefficient_M, MaxNetworkRate)
+        # Predictive scale up: same rule on the scores projected at now + boot time
+        if ForecastEnabled:
+            now = time.monotonic()
+            self.scoreForecaster.observe(now, self.AllWebServersOBJ)
+            forecastDecision = self.scoreForecaster.evaluate(now, self.AllWebServersOBJ, ScaleUpThreshold,
+                                                             ScaleUpAverageThreshold, fleetDecision.scaleUp)
+            if forecastDecision.scaleUp and not fleetDecision.scaleUp:
+                fleetDecision.scaleUp = True
+                fleetDecision.predictiveScaleUp = True
+                fleetDecision.projectedAverageScore = forecastDecision.projectedAverageScore
+        stopwatch.lap("scoring")
+        actuation = Actuation(fleetDecision)
 
         # ******* SECTION 2 *******
         # Count the "scaleDown/scaleUp" FLAGs from webServer OBJs & Calculate average of all scores
+        # (computed by "fleetState.evaluate" above, a web server takes part in the decision once its first stats are
+        # read)
         # ALSO physical removal of the container happens here ( container death flag = True &
         # busyThread < 3 (meaning all requests have been processed) )
         # At section "#******* SECTION 4 *******#" the container will be marked as a "To Be Removed" and
         # it will be removed from HaProxy config file and score calculation HOWEVER physical removal will happens here
-        numberOfScaleDownFlag = 0
-        numberOfScaleUpFlag = 0
-        numberOfCurrentAliveWebServers = 0
-        sumOfAllScores = 0
-        allWebServersScoreAvg = 0
-        # highestWeight = ((1 / AllWebServersOBJ[0].score) / sumOfAllInvertedScore) * 100
-        # lowestScore = AllWebServersOBJ[0].score
-        # lowestScoreWebServerName = AllWebServersOBJ[0].name
-        highestWeight = -1
-        lowestScore = 9999
-        lowestScoreWebServerName = ''
-        for objServer in AllWebServersOBJ:
-            if not objServer.getIsDead():
-                if not objServer.getDeathFlag():
-                    # Set the weight of web server
-                    objServer.setWeight(
-                        ((1 / objServer.score) / sumOfAllInvertedScore) * 100
-                    )
-                    numberOfCurrentAliveWebServers = numberOfCurrentAliveWebServers + 1
-                    sumOfAllScores = sumOfAllScores + objServer.score
-                    if lowestScore >= objServer.score:
-                        lowestScore = objServer.score
-                        lowestScoreWebServerName = objServer.name
-                    if objServer.getWeight() >= highestWeight:
-                        highestWeight = objServer.weight
-                    if objServer.scaleUpFlag:
-                        numberOfScaleUpFlag = numberOfScaleUpFlag + 1
-                    elif objServer.scaleDownFlag:
-                        numberOfScaleDownFlag = numberOfScaleDownFlag + 1
-                else:
-                    # Container physically removal
-                    if int(objServer.busyThreadsCount) < 4:
-                        objServer.setIsDead(True)
-                        dockerUtils.removeCountainer(objServer.name)
-                        print("~~~~~~~~~~~~~~~~~~~~~ REMOVAL ~~~~~~~~~~~~~~~~~~~~~")
-                        logging.info("Web Server " + objServer.name + " has been removed")
-                        print("~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~")
-
-        print("sumOfAllInvertedScore " + str(sumOfAllInvertedScore))
-        print("highestWeight " + str(highestWeight))
-        print("lowestScoreWebServerName " + str(lowestScoreWebServerName))
-        print("lowestScore " + str(lowestScore))
-        print("numberOfScaleDownFlag " + str(numberOfScaleDownFlag))
-        print("numberOfScaleUpFlag " + str(numberOfScaleUpFlag))
-        print("numberOfCurrentAliveWebServers " + str(numberOfCurrentAliveWebServers))
-        print("AllWebServersCount " + str(len(AllWebServersOBJ)))
-        print("sumOfAllScores " + str(sumOfAllScores))
-        print("sumOfAllScores / numberOfCurrentAliveWebServers: " + str(sumOfAllScores / numberOfCurrentAliveWebServers))
+        # (only when HaProxy is reloaded, with the runtime API the DrainManager removes the container)
+        sumOfAllInvertedScore = fleetDecision.sumOfAllInvertedScore
+        numberOfScaleDownFlag = fleetDecision.numberOfScaleDownFlag
+        numberOfScaleUpFlag = fleetDecision.numberOfScaleUpFlag
+        numberOfCurrentAliveWebServers = fleetDecision.numberOfCurrentAliveWebServers
+        sumOfAllScores = fleetDecision.sumOfAllScores
+        highestWeight = fleetDecision.highestWeight
+        lowestScore = fleetDecision.lowestScore
+        lowestScoreWebServerName = fleetDecision.lowestScoreWebServerName
+        for index in ([] if HaProxyUseRuntimeApi else fleetDecision.removableIndexes):
+            # Container physically removal (by actuate)
+            objServer = self.fleetState.webServers[index]
+            self.backendRegistry.markDead(objServer)
+            actuation.removedWebServers.append(objServer)
+
+        # Keep HaProxy on the weights computed above (between scale events too)
+        if HaProxyUseRuntimeApi:
+            actuation.weights = self.fleetState.activeWeights()
+
+        if numberOfCurrentAliveWebServers == 0:
+            logging.warning("No web server has reported its stats yet")
+            self.recordDecisionMetrics(fleetDecision, None)
+            return actuation
+
+        logging.debug("sumOfAllInvertedScore " + str(sumOfAllInvertedScore) + ", highestWeight " + str(highestWeight) +
+                      ", lowestScore " + str(lowestScore) + " (" + str(lowestScoreWebServerName) + ")" +
+                      ", scaleUp/scaleDown flags " + str(numberOfScaleUpFlag) + "/" + str(numberOfScaleDownFlag) +
+                      ", alive " + str(numberOfCurrentAliveWebServers) + " of " + str(len(self.AllWebServersOBJ)) +
+                      ", average score " + str(sumOfAllScores / numberOfCurrentAliveWebServers))
+
+        # How many web servers to add / remove (see ScalingPolicy.py), the web servers which are still booting (or
+        # not even created yet) are counted as capacity which is already on its way
+        numberOfBooting = numberOfPending + sum(1 for objServer in self.AllWebServersOBJ
+                                                if not objServer.getIsDead() and not objServer.getDeathFlag() and
+                                                objServer.isBooting())
+        averageScore = sumOfAllScores / numberOfCurrentAliveWebServers
+        if fleetDecision.predictiveScaleUp:
+            averageScore = fleetDecision.projectedAverageScore
+        scalingPlan = self.scalingPolicy.plan(time.monotonic(), fleetDecision, averageScore, numberOfBooting)
+        actuation.scalingPlan = scalingPlan
 
         # ******* SECTION 3 *******
-        # Scaling UP
-        if numberOfScaleUpFlag > (numberOfCurrentAliveWebServers / 2) or (
-                sumOfAllScores / numberOfCurrentAliveWebServers) > ScaleUpAverageThreshold:
-            AllWebServersOBJ.append(
-                WebServer(("app" + str(len(AllWebServersOBJ) + 1)), 8010 + len(AllWebServersOBJ) + 1, highestWeight))
-
-            webServerContainre = dockerUtils.createContainer("httpd_final", "app" + str(len(AllWebServersOBJ)),
-                                                             1000000000,
-                                                             command='', ports={
-                    # Container Port : Host Port
-                    '80': 8010 + len(AllWebServersOBJ)
-                })
-            logging.info("Web Server " + ("app" + str(len(AllWebServersOBJ))) + " has been added")
-            logging.info("Modify and Restart HaProxy")
-
-            # Edit the haProxy config file and add the destination
-            # Destination string needs to have 4 spaces at the beginning, like below
-            #    server web1.example.com  192.168.1.101:80 weight 10
-            haproxyConfigModifier.reWriteWholeConfigFile(
-                createConfigFileBasedOnAliveCountainer(AllWebServersOBJ, HaProxyInitConfigFile))
-
-            # Restarting the HaProxy service
-            osCommandRunner.executeCommand("service haproxy restart")
-            time.sleep(1)
-            osCommandRunner.executeCommand("service haproxy status | grep Active")
+        # Scaling UP (the web servers are created by actuate)
+        if scalingPlan.numberToAdd > 0:
+            logging.info("Scaling up by " + str(scalingPlan.numberToAdd) + " web server(s)")
+            with self.pendingLock:
+                self.numberOfPendingWebServers += scalingPlan.numberToAdd
+            actuation.numberToAdd = scalingPlan.numberToAdd
+            actuation.weight = highestWeight
 
         # ******* SECTION 4 *******
         # Scaling Down
-        if numberOfScaleDownFlag > numberOfCurrentAliveWebServers / 2:
-            if numberOfCurrentAliveWebServers > 1:
-                if lowestScoreWebServerName != '':
-                    for webs in AllWebServersOBJ:
-                        if not webs.getIsDead():
-                            if webs.name == lowestScoreWebServerName:
-                                webs.setDeathFlag(True)
-                                # Removing the web server from HaProxy config file by setting "setDeathFlag(True)"
-                                haproxyConfigModifier.reWriteWholeConfigFile(
-                                    createConfigFileBasedOnAliveCountainer(AllWebServersOBJ, HaProxyInitConfigFile))
-                                # Restarting the HaProxy service
-                                osCommandRunner.executeCommand("service haproxy restart")
-                                time.sleep(1)
-                                osCommandRunner.executeCommand("service haproxy status | grep Active")
-
-
-        print("########################################################################################################################")
-        print("########################################################################################################################")
-        print("########################################################################################################################")
-
+        if scalingPlan.numberToRemove > 0:
+            logging.info("Scaling down by " + str(scalingPlan.numberToRemove) + " web server(s)")
+            # The web servers with the lowest scores are taken out of the load balancer, they are removed
+            # physically at SECTION 2 once their requests are processed
+            for index in self.fleetState.lowestScoreIndexes(scalingPlan.numberToRemove):
+                webs = self.fleetState.webServers[index]
+                self.backendRegistry.markDraining(webs)
+                actuation.drainedWebServers.append(webs)
+        stopwatch.lap("planning")
+        self.recordDecisionMetrics(fleetDecision, scalingPlan)
+        return actuation
+
+    def actuate(self, actuation, stopwatch):
+        # The Docker and HaProxy calls of a decision. Output: the web servers which have been added
+        addedWebServers = []
+        numberToAdd = actuation.numberToAdd
+        try:
+            for objServer in actuation.removedWebServers:
+                self.dockerUtils.removeCountainer(objServer.name)
+                self.metricIngestor.forget(objServer.name)
+                logging.info("Web Server " + objServer.name + " has been removed")
+            if actuation.weights is not None:
+                self.weightSynchronizer.sync(actuation.weights)
+            stopwatch.lap("weights")
+
+            if numberToAdd > 0:
+                # createWebServers takes the pending web servers over
+                numberToAdd = 0
+                addedWebServers = self.createWebServers(actuation.numberToAdd, actuation.weight)
+            stopwatch.lap("scale_up")
+        finally:
+            if numberToAdd > 0:
+                with self.pendingLock:
+                    self.numberOfPendingWebServers -= numberToAdd
+
+        # The HaProxy changes of the decision (removed, added and drained web servers) are applied in one batch
+        try:
+            self.applyBalancerChanges(actuation.removedWebServers, addedWebServers, actuation.drainedWebServers)
+        finally:
+            if HaProxyUseRuntimeApi:
+                # Removed asynchronously once HaProxy has no session left for them (they are already marked
+                # draining, whatever happened to the HaProxy changes)
+                self.drainManager.startDraining(actuation.drainedWebServers)
+        stopwatch.lap("balancer")
+
+        if addedWebServers:
+            self.metrics.inc("autoscaler_scale_events_total", labels={'direction': "up"})
+            self.metrics.inc("autoscaler_scaled_web_servers_total", len(addedWebServers), {'direction': "up"})
+        if actuation.drainedWebServers:
+            self.metrics.inc("autoscaler_scale_events_total", labels={'direction': "down"})
+            self.metrics.inc("autoscaler_scaled_web_servers_total", len(actuation.drainedWebServers),
+                             {'direction': "down"})
+        return addedWebServers
+
+    def reconcileWebServers(self):
+        # Output: number of web servers taken back
+        # Web server containers left by a previous run ("<WebServerNamePrefix><n>") are registered again instead of
+        # deploying the initial scenario: they are put in HaProxy (one reload, like deployInitialScenario) and get
+        # their first stats at the next cycles, the scores decide whether some of them are drained
+        adoptedWebServers = []
+        for container in self.dockerUtils.allContainersList():
+            suffix = container.name[len(WebServerNamePrefix):]
+            if not container.name.startswith(WebServerNamePrefix) or not suffix.isdigit():
+                continue
+            port = containerHostPort(container)
+            if port is None:
+                logging.error("Web Server container " + container.name + " has no published port, not taken back")
+                continue
+            adoptedWebServers.append(WebServer(container.name, port, 1,
+                                               self.dockerUtils.getHostAddress(container.name)))
+        if not adoptedWebServers:
+            return 0
+        adoptedWebServers.sort(key=lambda webServer: int(webServer.name[len(WebServerNamePrefix):]))
+        for webServer in adoptedWebServers:
+            self.backendRegistry.add(webServer)
+            # Promoted from the warm pool in the previous run
+            self.warmPoolManager.reservePort(webServer.mappedPort)
+            if HaProxyUseRuntimeApi:
+                self.haproxyRuntimeModifier.assignSlot(webServer.name, webServer.hostAddress, webServer.mappedPort,
+                                                       1, "ready")
+            logging.info("Web Server " + webServer.name + " has been taken back (" + webServer.hostAddress + ":" +
+                         str(webServer.mappedPort) + ")")
+        self.AllWebServersOBJ = self.backendRegistry.webServers()
+        if HaProxyUseRuntimeApi:
+            configStr = self.haproxyRuntimeModifier.renderConfig()
+        else:
+            configStr = self.haproxyConfigRenderer.renderWebServers(self.AllWebServersOBJ)
+        self.haproxyReloader.apply(configStr)
+        self.warmPoolManager.start()
+        if HaProxyUseRuntimeApi:
+            self.drainManager.start()
+        return len(adoptedWebServers)
+
+    def shutdown(self):
+        # The web server containers are kept (taken back by reconcileWebServers at the next start)
+        self.drainManager.shutdown()
+        self.warmPoolManager.shutdown()
+        self.metricIngestor.shutdown()
+        self.scalingExecutor.shutdown(wait=False)
+        self.dockerUtils.stopEventWatcher()
+
+    def recordDecisionMetrics(self, fleetDecision, scalingPlan):
+        # Replaces the per cycle prints: the outcome of the vote, the state of every web server
+        if fleetDecision.scaleUp:
+            vote = "up"
+            reason = "predictive" if fleetDecision.predictiveScaleUp else "reactive"
+        elif fleetDecision.scaleDown:
+            vote = "down"
+            reason = "reactive"
+        else:
+            vote = "none"
+            reason = "no_stats" if scalingPlan is None else "none"
+        if scalingPlan is not None and scalingPlan.blockedBy is not None:
+            reason = scalingPlan.blockedBy
+        self.metrics.inc("autoscaler_decisions_total", labels={'vote': vote, 'reason': reason})
+
+        now = time.time()
+        numberByState = {'live': 0, 'booting': 0, 'draining': 0, 'stale': 0, 'expired': 0}
+        for name in ("autoscaler_web_server_score", "autoscaler_web_server_stale",
+                     "autoscaler_web_server_stats_age_seconds"):
+            self.metrics.clear(name)
+        for webServer in self.AllWebServersOBJ:
+            if webServer.getIsDead():
+                continue
+            if webServer.getDeathFlag():
+                numberByState['draining'] += 1
+                continue
+            if webServer.isBooting():
+                numberByState['booting'] += 1
+                continue
+            labels = {'web_server': webServer.name}
+            if webServer.getIsExpired():
+                # Left out of the decision, only its stats age is reported
+                numberByState['expired'] += 1
+                self.metrics.setValue("autoscaler_web_server_stale", 1, labels)
+                self.metrics.setValue("autoscaler_web_server_stats_age_seconds", now - webServer.statsTimestamp,
+                                      labels)
+                continue
+            numberByState['live'] += 1
+            if webServer.getIsStale():
+                numberByState['stale'] += 1
+            self.metrics.setValue("autoscaler_web_server_score", webServer.score, labels)
+            self.metrics.setValue("autoscaler_web_server_stale", 1 if webServer.getIsStale() else 0, labels)
+            self.metrics.setValue("autoscaler_web_server_stats_age_seconds", now - webServer.statsTimestamp, labels)
+        numberByState['pending'] = self.numberOfPendingWebServers
+        for state, number in numberByState.items():
+            self.metrics.setValue("autoscaler_web_servers", number, {'state': state})
+        if fleetDecision.numberOfCurrentAliveWebServers > 0:
+            self.metrics.setValue("autoscaler_average_score",
+                                  fleetDecision.sumOfAllScores / fleetDecision.numberOfCurrentAliveWebServers)
+        self.metrics.setValue("autoscaler_drained_web_servers_total", self.drainManager.numberOfRemovedIdle,
+                              {'reason': "idle"})
+        self.metrics.setValue("autoscaler_drained_web_servers_total", self.drainManager.numberOfRemovedTimeout,
+                              {'reason': "timeout"})
 
 
+if __name__ == "__main__":
+    # Only needed by the live loop, so the classes above can be used without the docker SDK (e.g. Replay.py)
+    import docker
 
+    # Objects
+    # The Docker and HaProxy calls are timed by InstrumentedProxy objects standing for the real ones
+    metrics = Metrics()
+    hostDockerUtils = []
+    for dockerApiUrl, hostAddress in DockerHosts:
+        client = docker.DockerClient(base_url=dockerApiUrl, max_pool_size=DockerMaxPoolSize)
+        hostDockerUtils.append(InstrumentedProxy(DockerUtil(client, hostAddress=hostAddress), metrics,
+                                                 "autoscaler_docker_call_seconds",
+                                                 ["createContainer", "removeCountainer", "renameContainer",
+                                                  "containerAllStats", "getHostCapacity"], {'host': hostAddress}))
+    dockerUtils = DockerHostPool(hostDockerUtils, PlacementScheduler(DockerHostMaxCpu, DockerHostMaxMemory))
+    haproxyConfigModifier = InstrumentedProxy(HaproxyConfigModifier(HaProxyConfigFilePath), metrics,
+                                              "autoscaler_haproxy_call_seconds",
+                                              ["reWriteWholeConfigFile"], {'target': "config_file"})
+    haproxyRuntimeApi = InstrumentedProxy(HaproxyRuntimeApi(HaProxyAdminSocketPath), metrics,
+                                          "autoscaler_haproxy_call_seconds",
+                                          ["executeCommand", "executeCommands", "setServerAddr", "setServerWeight",
+                                           "setServerState", "addServer", "delServer", "showServersState",
+                                           "showStat"], {'target': "runtime_api"})
+    osCommandRunner = InstrumentedProxy(OsCommandRunner(), metrics, "autoscaler_haproxy_call_seconds",
+                                        ["executeCommand"], {'target': "reload"})
+    haproxyRuntimeModifier = HaproxyRuntimeModifier(haproxyRuntimeApi, haproxyConfigModifier,
+                                                    HaProxyInitConfigFile, HaProxyBackendName, HaProxyServerSlots)
+    if MetricsEnabled:
+        MetricsServer(metrics, MetricsHost, MetricsPort).start()
+    autoScaler = AutoScaler(dockerUtils, osCommandRunner, haproxyConfigModifier, haproxyRuntimeModifier,
+                            MetricIngestor(WebServersLogsFolderPath, IngestionDeadline, IngestionPollInterval,
+                                           IngestionMaxWorkers,
+                                           ServerStatusScraper(ServerStatusTimeout)
+                                           if ServerStatusScrapeEnabled else None, MaxStatsAge, StaleStatsAge),
+                            WarmPoolManager(dockerUtils, "httpd_final", 1000000000, ServerIpAddress,
+                                            WarmPoolNamePrefix, WarmPoolPortBase, WarmPoolSize, WarmPoolMaxSize,
+                                            WarmPoolAdaptiveWindow),
+                            metrics)
+    # ----------------------------------------------------------------------------------------------------------------
+    # Take back the web servers of a previous run or create the initial scenario, then run the collect / decide /
+    # actuate tasks until SIGINT / SIGTERM
+    autoScalerDaemon = AutoScalerDaemon(autoScaler, CycleInterval, DaemonActuationQueueSize, DaemonMaxWorkers,
+                                        DaemonShutdownTimeout)
+    asyncio.run(autoScalerDaemon.run())
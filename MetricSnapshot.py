@@ -0,0 +1,76 @@
+# Unit suffixes written by the docker CLI / LogCollector.sh (go-units), binary and decimal -> bytes
+UnitMultipliers = {
+    'B': 1.0,
+    'kB': 1e3, 'KB': 1e3, 'MB': 1e6, 'GB': 1e9, 'TB': 1e12, 'PB': 1e15,
+    'KiB': 1024.0, 'MiB': 1024.0 ** 2, 'GiB': 1024.0 ** 3, 'TiB': 1024.0 ** 4, 'PiB': 1024.0 ** 5,
+}
+
+
+def parseSize(text):
+    # "12.58MiB" -> 13191086.08, "1.82kB" -> 1820.0, "0B" -> 0.0, "1820" -> 1820.0
+    # ValueError if the number or the unit is not valid
+    end = len(text)
+    while end > 0 and text[end - 1].isalpha():
+        end -= 1
+    multiplier = UnitMultipliers.get(text[end:] or 'B')
+    if multiplier is None:
+        raise ValueError("Unknown unit: " + text)
+    return float(text[:end]) * multiplier
+
+
+# One sample of a web server, every field is a number:
+#   cpu, memoryUsage (%), memory (bytes), inputTraffic / outPutTraffic (bytes received / sent since the container
+#   start), inputRate / outPutRate (bytes per second, see deriveRates), busyThreadsCount, processingReqTime (ms)
+# "sampleTime" is the time the sample was written (mtime of the log file), used for the rates
+class MetricSnapshot:
+    __slots__ = ('cpu', 'memory', 'memoryUsage', 'inputTraffic', 'outPutTraffic', 'inputRate', 'outPutRate',
+                 'busyThreadsCount', 'processingReqTime', 'sampleTime')
+
+    def __init__(self, cpu, memory, memoryUsage, inputTraffic, outPutTraffic, busyThreadsCount, processingReqTime,
+                 sampleTime=None):
+        self.cpu = cpu
+        self.memory = memory
+        self.memoryUsage = memoryUsage
+        self.inputTraffic = inputTraffic
+        self.outPutTraffic = outPutTraffic
+        self.inputRate = 0.0
+        self.outPutRate = 0.0
+        self.busyThreadsCount = busyThreadsCount
+        self.processingReqTime = processingReqTime
+        self.sampleTime = sampleTime
+
+    def deriveRates(self, previous):
+        # Rates from the counters of the previous sample of the same web server. The same sample read twice keeps
+        # the previous rates, counters going back (container restarted) give 0
+        if previous is None or self.sampleTime is None or previous.sampleTime is None:
+            return
+        dt = self.sampleTime - previous.sampleTime
+        if dt <= 0:
+            self.inputRate = previous.inputRate
+            self.outPutRate = previous.outPutRate
+            return
+        self.inputRate = max(self.inputTraffic - previous.inputTraffic, 0) / dt
+        self.outPutRate = max(self.outPutTraffic - previous.outPutTraffic, 0) / dt
+
+    def networkRate(self):
+        return self.inputRate + self.outPutRate
+
+
+def parseStatsLines(lines, sampleTime=None):
+    # Input: 7 lines of the log file written by LogCollector.sh, like below
+    #   ['Cpu 0.01%', 'Memory 12.58MiB', 'MemoryUsage 0.21%', 'InputTraffic 1.82kB', 'OutPutTraffic 9.1kB',
+    #    'BusyThreadsCount 1', 'ProcessingReqTime 200']
+    # Output: MetricSnapshot or None if the file is incomplete (LogCollector.sh is in the middle of writing it)
+    if len(lines) != 7:
+        return None
+    temp = []
+    for data in lines:
+        fields = data.split()
+        if len(fields) < 2:
+            return None
+        temp.append(fields[1])
+    try:
+        return MetricSnapshot(float(temp[0].rstrip("%")), parseSize(temp[1]), float(temp[2].rstrip("%")),
+                              parseSize(temp[3]), parseSize(temp[4]), int(temp[5]), int(temp[6]), sampleTime)
+    except ValueError:
+        return None
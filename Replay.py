@@ -0,0 +1,323 @@
+import itertools
+import logging
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import Main
+from FleetState import FleetState
+from Forecaster import ScoreForecaster
+from HistoryStore import HistoryFields, HistoryStore
+from MetricSnapshot import MetricSnapshot
+from ScalingPolicy import ScalingPolicy
+
+# Offline replay of recorded metrics through the scoring/scaling logic of Main.py (WebServer + FleetState, which is
+# SECTION 2 and the SECTION 3/4 rules) without Docker and HaProxy, used to tune the thresholds and coefficients.
+#   python Replay.py <history folder of HistoryStore | history_<container> text files ...>
+#
+# Load model: at every step the recorded containers are merged into one fleet load. Cpu and BusyThreadsCount are
+# summed over the recorded containers and split evenly over the simulated web servers which are in the load
+# balancer; ProcessingReqTime (recorded average) is scaled by the same ratio (recorded / simulated web servers);
+# MemoryUsage is the recorded average (mostly the httpd baseline).
+# A new web server takes part in the decision "BootSeconds" after the scale up. A web server with death flag gets
+# no new load, so it is removed at the next step (same as the busyThreadsCount < 4 rule).
+# The number of web servers added / removed by a scaling vote comes from ScalingPolicy (the cooldowns and the target
+# score are read from the parameter set when it has them, from Main.py otherwise).
+# With "ForecastEnabled" (parameter set or Main.py) the predictive scale up of the live loop is replayed as well: the
+# ScoreForecaster follows the scores in replay time and its projected average score drives the ScalingPolicy when it
+# fires before the reactive rule (same as AutoScaler.decide).
+
+StepSeconds = 1
+BootSeconds = 5
+ContainerGoneSteps = 30
+MaxProcessingTime = 500
+# Reference used for "overThresholdSeconds", fixed so the parameter sets can be compared with each other
+ReferenceCoefficients = (Main.Coefficient_X, Main.Coefficient_Y, Main.Coefficient_Z)
+ReferenceAverageThreshold = Main.ScaleUpAverageThreshold
+# Grid search space (every combination is replayed)
+ParameterGrid = {
+    'ScaleUpThreshold': [30, 40, 50],
+    'ScaleDownThreshold': [5, 10, 15],
+    'ScaleUpAverageThreshold': [30, 40, 50],
+    'Coefficient_X': [1, 2],
+    'Coefficient_Y': [1],
+    'Coefficient_Z': [1],
+    'ForecastAlpha': [0.3, 0.5],
+    'ForecastBeta': [0.1, 0.3],
+}
+# Random search: number of random parameter sets drawn from ParameterGrid ranges (0 -> grid search)
+RandomSamples = 0
+# Ranking: container-seconds + OverThresholdPenalty * seconds over the reference threshold
+OverThresholdPenalty = 10
+
+
+def parseTextHistoryFile(filePath):
+    # Input: history file written by LogCollector.sh, blocks like below
+    #   ---------------------------------------- Sat Aug 29 16:55:21 UTC 2020
+    #   Cpu 0.01%
+    #   Memory 12.58MiB
+    #   MemoryUsage 0.21%
+    #   InputTraffic 1.82kB
+    #   OutPutTraffic 9.1kB
+    #   BusyThreadsCount 1
+    #   ProcessingReqTime 200   (missing in files written before the LogCollector.sh fix -> 0)
+    # Output: [(timestamp, cpu, memoryUsage, busyThreadsCount, processingReqTime)]
+    samples = []
+    timestamp = None
+    values = {}
+
+    def flush():
+        if timestamp is not None and 'Cpu' in values and 'MemoryUsage' in values and 'BusyThreadsCount' in values:
+            samples.append((timestamp, values['Cpu'], values['MemoryUsage'], values['BusyThreadsCount'],
+                            values.get('ProcessingReqTime', 0.0)))
+
+    with open(filePath) as file:
+        for line in file:
+            if line.startswith("----"):
+                flush()
+                timestamp = parseDate(line.strip("- \n"))
+                values = {}
+                continue
+            fields = line.split()
+            if len(fields) == 2 and fields[0] in ('Cpu', 'MemoryUsage', 'BusyThreadsCount', 'ProcessingReqTime'):
+                try:
+                    values[fields[0]] = float(fields[1].replace("%", ""))
+                except ValueError:
+                    pass
+    flush()
+    return samples
+
+
+def parseDate(text):
+    # "date" output, e.g. "Sat Aug 29 16:55:21 UTC 2020" (the time zone is ignored)
+    fields = text.split()
+    if len(fields) == 6:
+        fields.pop(4)
+    try:
+        return time.mktime(time.strptime(" ".join(fields), "%a %b %d %H:%M:%S %Y"))
+    except ValueError:
+        return None
+
+
+def loadHistoryStore(folderPath):
+    historyStore = HistoryStore(folderPath, writable=False)
+    samplesByContainer = {}
+    fieldIndexes = [HistoryFields.index(field) for field in
+                    ('Timestamp', 'Cpu', 'MemoryUsage', 'BusyThreadsCount', 'ProcessingReqTime')]
+    for containerName in historyStore.containers():
+        samplesByContainer[containerName] = [tuple(record[i] for i in fieldIndexes)
+                                             for record in historyStore.query(containerName, 0)]
+    historyStore.close()
+    return samplesByContainer
+
+
+def buildTimeline(samplesByContainer, stepSeconds):
+    # Output: [(numberOfRecordedContainers, sumOfCpu, averageMemoryUsage, sumOfBusyThreads, averageProcessingTime)]
+    # one entry per step, every container keeps its last sample until the next one
+    allTimestamps = [sample[0] for samples in samplesByContainer.values() for sample in samples
+                     if sample[0] is not None]
+    if not allTimestamps:
+        return []
+    startTime = min(allTimestamps)
+    numberOfSteps = int((max(allTimestamps) - startTime) // stepSeconds) + 1
+    perStep = [dict() for _ in range(numberOfSteps)]
+    for containerName, samples in samplesByContainer.items():
+        for sample in samples:
+            if sample[0] is not None:
+                perStep[int((sample[0] - startTime) // stepSeconds)][containerName] = sample[1:]
+    timeline = []
+    current = {}
+    lastSeenStep = {}
+    for step, stepSamples in enumerate(perStep):
+        current.update(stepSamples)
+        for containerName in stepSamples:
+            lastSeenStep[containerName] = step
+        # A container which did not report for "ContainerGoneSteps" steps is considered removed
+        for containerName in [name for name, seen in lastSeenStep.items() if step - seen > ContainerGoneSteps]:
+            del current[containerName]
+            del lastSeenStep[containerName]
+        if not current:
+            timeline.append((0, 0.0, 0.0, 0.0, 0.0))
+            continue
+        values = list(current.values())
+        n = len(values)
+        timeline.append((n, sum(v[0] for v in values), sum(v[1] for v in values) / n, sum(v[2] for v in values),
+                         sum(v[3] for v in values) / n))
+    return timeline
+
+
+class ReplayResult:
+    def __init__(self, parameters):
+        self.parameters = parameters
+        self.containerSeconds = 0
+        self.overThresholdSeconds = 0
+        self.numberOfScaleUps = 0
+        self.numberOfScaleDowns = 0
+        self.numberOfPredictiveScaleUps = 0
+        self.maxWebServers = 0
+
+    def cost(self):
+        return self.containerSeconds + OverThresholdPenalty * self.overThresholdSeconds
+
+    def __str__(self):
+        return (" ".join(k + "=" + str(v) for k, v in sorted(self.parameters.items())) +
+                " | containerSeconds=" + str(self.containerSeconds) +
+                " overThresholdSeconds=" + str(self.overThresholdSeconds) +
+                " scaleEvents=" + str(self.numberOfScaleUps + self.numberOfScaleDowns) +
+                " (up " + str(self.numberOfScaleUps) + ", down " + str(self.numberOfScaleDowns) +
+                ", predictive " + str(self.numberOfPredictiveScaleUps) + ")" +
+                " maxWebServers=" + str(self.maxWebServers))
+
+
+def replay(timeline, parameters, stepSeconds=StepSeconds, bootSeconds=BootSeconds):
+    result = ReplayResult(parameters)
+    # Every web server gets its FleetState row when it is created (rows are never freed here: row = position)
+    fleetState = FleetState()
+    webServers = [Main.WebServer("app1", 8010 + 1, 1)]
+    fleetState.addRow(webServers[0])
+    readyAtStep = [0]
+    bootSteps = int(bootSeconds // stepSeconds)
+    scalingPolicy = ScalingPolicy(parameters.get('ScalingTargetScore', Main.ScalingTargetScore),
+                                  parameters['ScaleUpAverageThreshold'],
+                                  parameters.get('ScalingHysteresisBand', Main.ScalingHysteresisBand),
+                                  Main.ScalingMaxStep, Main.ScalingMinWebServers, Main.ScalingMaxWebServers,
+                                  parameters.get('ScaleUpCooldown', Main.ScaleUpCooldown),
+                                  parameters.get('ScaleDownCooldown', Main.ScaleDownCooldown))
+    scoreForecaster = None
+    if parameters.get('ForecastEnabled', Main.ForecastEnabled):
+        scoreForecaster = ScoreForecaster(parameters.get('ForecastAlpha', Main.ForecastAlpha),
+                                          parameters.get('ForecastBeta', Main.ForecastBeta),
+                                          parameters.get('ForecastHorizon', Main.ForecastHorizon),
+                                          parameters.get('ForecastMinSamples', Main.ForecastMinSamples),
+                                          parameters.get('ForecastLeadWindow', Main.ForecastLeadWindow))
+    for step, (recordedCount, sumOfCpu, memoryUsage, sumOfBusyThreads, processingReqTime) in enumerate(timeline):
+        inBalancer = [i for i, webServer in enumerate(webServers)
+                      if not webServer.getIsDead() and not webServer.getDeathFlag() and readyAtStep[i] <= step]
+        inBalancerSet = set(inBalancer)
+        # Load split (see the load model above)
+        ratio = recordedCount / len(inBalancer) if inBalancer else 0
+        for i, webServer in enumerate(webServers):
+            if webServer.getIsDead() or readyAtStep[i] > step:
+                continue
+            if i in inBalancerSet:
+                webServer.setStatus(MetricSnapshot(sumOfCpu / len(inBalancer), 0, memoryUsage, 0, 0,
+                                                   int(round(sumOfBusyThreads / len(inBalancer))),
+                                                   int(round(processingReqTime * ratio))))
+            else:
+                webServer.setStatus(MetricSnapshot(0.0, 0, memoryUsage, 0, 0, 0, 0))
+            webServer.setStale(False, step)
+
+        decision = fleetState.evaluate(parameters['Coefficient_X'], parameters['Coefficient_Y'],
+                                       parameters['Coefficient_Z'], MaxProcessingTime,
+                                       parameters['ScaleUpThreshold'], parameters['ScaleDownThreshold'],
+                                       parameters['ScaleUpAverageThreshold'],
+                                       M=parameters.get('Coefficient_M', Main.Coefficient_M))
+        # Predictive scale up: same rule on the scores projected at now + boot time
+        if scoreForecaster is not None:
+            now = step * stepSeconds
+            scoreForecaster.observe(now, webServers)
+            forecastDecision = scoreForecaster.evaluate(now, webServers, parameters['ScaleUpThreshold'],
+                                                        parameters['ScaleUpAverageThreshold'], decision.scaleUp)
+            if forecastDecision.scaleUp and not decision.scaleUp:
+                decision.scaleUp = True
+                decision.predictiveScaleUp = True
+                decision.projectedAverageScore = forecastDecision.projectedAverageScore
+
+        numberOfContainers = sum(1 for webServer in webServers if not webServer.getIsDead())
+        result.containerSeconds += numberOfContainers * stepSeconds
+        result.maxWebServers = max(result.maxWebServers, numberOfContainers)
+        if inBalancer:
+            referenceScore = sum(ReferenceCoefficients[0] * ((webServers[i].memoryUsage + webServers[i].cpu) / 2) +
+                                 ReferenceCoefficients[1] * (webServers[i].busyThreadsCount / 4) +
+                                 ReferenceCoefficients[2] * (webServers[i].processingReqTime / MaxProcessingTime)
+                                 for i in inBalancer) / len(inBalancer)
+            if referenceScore > ReferenceAverageThreshold:
+                result.overThresholdSeconds += stepSeconds
+
+        # SECTION 2: physical removal
+        for index in decision.removableIndexes:
+            fleetState.webServers[index].setIsDead(True)
+        if decision.numberOfCurrentAliveWebServers == 0:
+            continue
+        numberOfBooting = sum(1 for i, webServer in enumerate(webServers)
+                              if not webServer.getIsDead() and readyAtStep[i] > step)
+        averageScore = decision.sumOfAllScores / decision.numberOfCurrentAliveWebServers
+        if decision.predictiveScaleUp:
+            averageScore = decision.projectedAverageScore
+        scalingPlan = scalingPolicy.plan(step * stepSeconds, decision, averageScore, numberOfBooting)
+        if decision.predictiveScaleUp and scalingPlan.numberToAdd > 0:
+            result.numberOfPredictiveScaleUps += 1
+        # SECTION 3
+        for _ in range(scalingPlan.numberToAdd):
+            webServers.append(Main.WebServer("app" + str(len(webServers) + 1), 8010 + len(webServers) + 1,
+                                             decision.highestWeight))
+            fleetState.addRow(webServers[-1])
+            readyAtStep.append(step + 1 + bootSteps)
+            result.numberOfScaleUps += 1
+        # SECTION 4
+        for index in fleetState.lowestScoreIndexes(scalingPlan.numberToRemove):
+            fleetState.webServers[index].setDeathFlag(True)
+            result.numberOfScaleDowns += 1
+    return result
+
+
+def gridParameterSets(parameterGrid):
+    names = sorted(parameterGrid)
+    return [dict(zip(names, values)) for values in itertools.product(*[parameterGrid[name] for name in names])]
+
+
+def randomParameterSets(parameterGrid, numberOfSamples, seed=0):
+    # Every parameter is drawn uniformly between the lowest and the highest value of its grid
+    generator = random.Random(seed)
+    parameterSets = []
+    for _ in range(numberOfSamples):
+        parameterSets.append({name: generator.uniform(min(values), max(values))
+                              for name, values in parameterGrid.items()})
+    return parameterSets
+
+
+# The timeline is sent once to every worker process (not with every parameter set)
+workerTimeline = None
+
+
+def initWorker(timeline):
+    global workerTimeline
+    workerTimeline = timeline
+    # The ScoreForecaster logs every predictive scale up
+    logging.getLogger().setLevel(logging.WARNING)
+
+
+def replayInWorker(parameters):
+    return replay(workerTimeline, parameters)
+
+
+def search(timeline, parameterSets, maxWorkers=None):
+    with ProcessPoolExecutor(max_workers=maxWorkers, initializer=initWorker, initargs=(timeline,)) as executor:
+        results = list(executor.map(replayInWorker, parameterSets, chunksize=max(1, len(parameterSets) // 64)))
+    return sorted(results, key=lambda result: result.cost())
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        logging.error("Usage: Replay.py <history folder | history_<container> files ...>")
+        sys.exit(1)
+    samplesByContainer = {}
+    for path in sys.argv[1:]:
+        if os.path.isdir(path):
+            samplesByContainer.update(loadHistoryStore(path))
+        else:
+            samplesByContainer[os.path.basename(path)] = parseTextHistoryFile(path)
+    timeline = buildTimeline(samplesByContainer, StepSeconds)
+    logging.info("Replaying " + str(len(timeline)) + " steps of " + str(len(samplesByContainer)) + " containers")
+    if RandomSamples > 0:
+        parameterSets = randomParameterSets(ParameterGrid, RandomSamples)
+    else:
+        parameterSets = gridParameterSets(ParameterGrid)
+    startTime = time.monotonic()
+    results = search(timeline, parameterSets)
+    logging.info(str(len(parameterSets)) + " parameter sets replayed in " + str(round(time.monotonic() - startTime, 2)) +
+                 " seconds, best first:")
+    for result in results[:20]:
+        print(result)
@@ -0,0 +1,76 @@
+import logging
+import math
+
+
+class ScalingPlan:
+    def __init__(self):
+        self.numberToAdd = 0
+        self.numberToRemove = 0
+        # Why nothing is done although the vote asked for it ("cooldown", "hysteresis", "booting", "limit")
+        self.blockedBy = None
+
+
+# Turns the scale up / scale down vote of the cycle (FleetDecision) into a number of web servers.
+# The load is assumed to be spread evenly (weights), so with n web servers at an average score s the fleet carries
+# n * s and m web servers would be at n * s / m:
+#   scale up   -> m = ceil(n * s / targetScore), the web servers which are still booting are already part of m
+#   scale down -> the largest number of web servers whose load the others can take while staying "hysteresisBand"
+#                 under the scale up average threshold, so the next cycle does not scale up again
+# Cooldowns: no scale up within "scaleUpCooldown" seconds of the previous one (new web servers need time to take
+# load and their first scores are noisy), no scale down within "scaleDownCooldown" seconds of any scaling.
+class ScalingPolicy:
+    def __init__(self, targetScore, scaleUpAverageThr, hysteresisBand, maxStep, minWebServers, maxWebServers,
+                 scaleUpCooldown, scaleDownCooldown):
+        self.targetScore = targetScore
+        self.scaleUpAverageThr = scaleUpAverageThr
+        self.hysteresisBand = hysteresisBand
+        self.maxStep = maxStep
+        self.minWebServers = minWebServers
+        self.maxWebServers = maxWebServers
+        self.scaleUpCooldown = scaleUpCooldown
+        self.scaleDownCooldown = scaleDownCooldown
+        self.lastScaleUpTime = None
+        self.lastScaleDownTime = None
+
+    def plan(self, now, fleetDecision, averageScore, numberOfBooting):
+        scalingPlan = ScalingPlan()
+        numberOfActive = fleetDecision.numberOfCurrentAliveWebServers
+        if numberOfActive == 0:
+            return scalingPlan
+        if fleetDecision.scaleUp:
+            if self.inCooldown(now, self.lastScaleUpTime, self.scaleUpCooldown):
+                scalingPlan.blockedBy = "cooldown"
+            else:
+                required = int(math.ceil(numberOfActive * averageScore / self.targetScore))
+                required = min(required, self.maxWebServers)
+                # The vote asked for a scale up: at least one web server unless the booting ones cover it
+                numberToAdd = max(required - numberOfActive - numberOfBooting, 0 if numberOfBooting else 1)
+                numberToAdd = min(numberToAdd, self.maxStep,
+                                  self.maxWebServers - numberOfActive - numberOfBooting)
+                if numberToAdd > 0:
+                    scalingPlan.numberToAdd = numberToAdd
+                    self.lastScaleUpTime = now
+                else:
+                    scalingPlan.blockedBy = "booting" if numberOfBooting else "limit"
+        elif fleetDecision.scaleDown:
+            if self.inCooldown(now, self.lastScaleUpTime, self.scaleDownCooldown) or \
+                    self.inCooldown(now, self.lastScaleDownTime, self.scaleDownCooldown):
+                scalingPlan.blockedBy = "cooldown"
+            else:
+                upperScore = self.scaleUpAverageThr - self.hysteresisBand
+                numberToRemove = 0
+                while (numberToRemove < self.maxStep and
+                       numberOfActive - numberToRemove - 1 >= self.minWebServers and
+                       numberOfActive * averageScore / (numberOfActive - numberToRemove - 1) <= upperScore):
+                    numberToRemove += 1
+                if numberToRemove > 0:
+                    scalingPlan.numberToRemove = numberToRemove
+                    self.lastScaleDownTime = now
+                else:
+                    scalingPlan.blockedBy = "hysteresis"
+        if scalingPlan.blockedBy is not None:
+            logging.debug("Scaling vote not applied (" + scalingPlan.blockedBy + ")")
+        return scalingPlan
+
+    def inCooldown(self, now, lastTime, cooldown):
+        return lastTime is not None and now - lastTime < cooldown
@@ -0,0 +1,198 @@
+import http.client
+import logging
+import threading
+import time
+
+# Reads the httpd "mod_status" machine readable page ("/server-status?auto") of the web servers, instead of
+# rendering the HTML scoreboard with lynx and cutting columns with awk (LogCollector.sh)
+
+# Scoreboard keys (one character per worker slot)
+ScoreboardStates = {
+    '_': 'waiting', 'S': 'starting', 'R': 'reading', 'W': 'sending', 'K': 'keepalive', 'D': 'dns', 'C': 'closing',
+    'L': 'logging', 'G': 'finishing', 'I': 'idleCleanup', '.': 'openSlot',
+}
+
+
+class ServerStatus:
+    # The totals, ReqPerSec, BytesPerSec and DurationPerReq of the page are averages since the httpd start. The
+    # client which reads the page replaces them with the values between its last two reads (see deriveRates)
+    def __init__(self):
+        self.totalAccesses = 0
+        self.totalKBytes = 0
+        # Milliseconds spent serving the requests, None when the server does not report it (Apache < 2.4.35)
+        self.totalDuration = None
+        self.uptime = 0
+        self.reqPerSec = 0.0
+        self.bytesPerSec = 0.0
+        self.bytesPerReq = 0.0
+        self.durationPerReq = None
+        self.busyWorkers = 0
+        self.idleWorkers = 0
+        self.scoreboard = ''
+        # {'waiting': 74, 'sending': 1, ...}
+        self.scoreboardCounts = {}
+        # time.monotonic() of the read (set by ServerStatusClient)
+        self.sampleTime = None
+        # Average time (ms) of the requests served since the previous read, None -> not known
+        self.recentDurationPerReq = None
+
+    def deriveRates(self, previous):
+        # Rates of the requests served since the "previous" read of the same server. Without a previous read, or
+        # when the counters went back (httpd restarted), the averages since the httpd start are kept
+        if previous is None or self.sampleTime is None or previous.sampleTime is None:
+            return
+        dt = self.sampleTime - previous.sampleTime
+        accesses = self.totalAccesses - previous.totalAccesses
+        kBytes = self.totalKBytes - previous.totalKBytes
+        if dt <= 0 or accesses < 0 or kBytes < 0 or self.uptime < previous.uptime:
+            return
+        self.reqPerSec = accesses / dt
+        self.bytesPerSec = kBytes * 1024 / dt
+        self.bytesPerReq = kBytes * 1024 / accesses if accesses > 0 else 0.0
+        if self.totalDuration is not None and previous.totalDuration is not None:
+            # No request since the previous read -> nothing is being processed
+            self.recentDurationPerReq = (self.totalDuration - previous.totalDuration) / accesses if accesses > 0 \
+                else 0.0
+
+    def processingReqTime(self):
+        # Average time (ms) spent to process a request, since the previous read if it is known
+        if self.recentDurationPerReq is not None:
+            return int(round(self.recentDurationPerReq))
+        if self.durationPerReq is not None:
+            return int(round(self.durationPerReq))
+        if self.totalDuration is not None and self.totalAccesses > 0:
+            return int(round(self.totalDuration / self.totalAccesses))
+        return 0
+
+
+# Input: body of "/server-status?auto", like below
+#   Total Accesses: 120
+#   Total kBytes: 300
+#   Total Duration: 24000
+#   Uptime: 3000
+#   ReqPerSec: .04
+#   BytesPerSec: 102.4
+#   BytesPerReq: 2560
+#   DurationPerReq: 200
+#   BusyWorkers: 1
+#   IdleWorkers: 74
+#   Scoreboard: _W__...
+# Output: ServerStatus (missing fields keep their default)
+def parseServerStatus(body):
+    fields = {}
+    for line in body.splitlines():
+        key, sep, value = line.partition(":")
+        if sep:
+            fields[key.strip()] = value.strip()
+    serverStatus = ServerStatus()
+    for key, attribute, convert in (("Total Accesses", 'totalAccesses', int), ("Total kBytes", 'totalKBytes', int),
+                                    ("Total Duration", 'totalDuration', int), ("Uptime", 'uptime', int),
+                                    ("ReqPerSec", 'reqPerSec', float), ("BytesPerSec", 'bytesPerSec', float),
+                                    ("BytesPerReq", 'bytesPerReq', float), ("DurationPerReq", 'durationPerReq', float),
+                                    ("BusyWorkers", 'busyWorkers', int), ("IdleWorkers", 'idleWorkers', int)):
+        if key in fields:
+            try:
+                setattr(serverStatus, attribute, convert(fields[key]))
+            except ValueError:
+                logging.warning("Invalid server-status value " + key + ": " + fields[key])
+    serverStatus.scoreboard = fields.get("Scoreboard", '')
+    for character in serverStatus.scoreboard:
+        state = ScoreboardStates.get(character)
+        if state is not None:
+            serverStatus.scoreboardCounts[state] = serverStatus.scoreboardCounts.get(state, 0) + 1
+    return serverStatus
+
+
+class ServerStatusClient:
+    # Keep-alive HTTP connection to the httpd "server-status" page of one web server. The previous read is kept to
+    # give the rates between two reads (ServerStatus.deriveRates)
+    def __init__(self, host, timeout, port=80):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.connection = None
+        self.previous = None
+
+    def fetch(self, timeout=None, retry=True):
+        # "timeout" (default: the one of the client) bounds the whole read, not only every socket operation
+        stopTime = time.monotonic() + (timeout if timeout is not None else self.timeout)
+        for attempt in range(2 if retry else 1):
+            try:
+                if self.connection is None:
+                    self.connection = http.client.HTTPConnection(self.host, self.port)
+                self.connection.timeout = self.timeLeft(stopTime)
+                if self.connection.sock is None:
+                    self.connection.connect()
+                else:
+                    self.connection.sock.settimeout(self.connection.timeout)
+                self.connection.request("GET", "/server-status?auto")
+                response = self.connection.getresponse()
+                if self.connection.sock is not None:
+                    self.connection.sock.settimeout(self.timeLeft(stopTime))
+                body = response.read().decode("utf-8", "replace")
+                if response.status != 200:
+                    raise http.client.HTTPException("server-status returned " + str(response.status))
+                serverStatus = parseServerStatus(body)
+                serverStatus.sampleTime = time.monotonic()
+                serverStatus.deriveRates(self.previous)
+                self.previous = serverStatus
+                return serverStatus
+            except (http.client.HTTPException, OSError) as e:
+                # The server may close an idle keep-alive connection, reconnect once before giving up
+                self.close()
+                if not retry or attempt == 1:
+                    raise e
+
+    def timeLeft(self, stopTime):
+        timeLeft = stopTime - time.monotonic()
+        if timeLeft <= 0:
+            raise TimeoutError("server-status read timed out")
+        return timeLeft
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class ServerStatusScraper:
+    # One keep-alive client per web server (published host:port), read by the workers of the MetricIngestor
+    def __init__(self, timeout):
+        self.timeout = timeout
+        # {'app1': ServerStatusClient}
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    def getClient(self, name, host, port):
+        with self.lock:
+            client = self.clients.get(name)
+            if client is None or client.host != host or client.port != port:
+                if client is not None:
+                    client.close()
+                client = self.clients[name] = ServerStatusClient(host, self.timeout, port)
+            return client
+
+    def fetch(self, name, host, port, timeLeft=None):
+        # Output: ServerStatus or None if the page could not be read in min(timeout, timeLeft) seconds (no retry,
+        # the log file values are used instead)
+        timeout = self.timeout if timeLeft is None else min(self.timeout, timeLeft)
+        if timeout <= 0:
+            return None
+        try:
+            return self.getClient(name, host, port).fetch(timeout, retry=False)
+        except Exception as e:
+            logging.warning("Could not read server-status of " + name + ": " + str(e))
+            return None
+
+    def forget(self, name):
+        with self.lock:
+            client = self.clients.pop(name, None)
+        if client is not None:
+            client.close()
+
+    def shutdown(self):
+        with self.lock:
+            clients = list(self.clients.values())
+            self.clients = {}
+        for client in clients:
+            client.close()
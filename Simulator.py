@@ -0,0 +1,549 @@
+import itertools
+import math
+import os
+import queue
+import re
+import socketserver
+import threading
+import time
+
+# In-process simulation of everything around the control loop of Main.py, so it can run (and be benchmarked, see
+# Benchmark.py) without a Docker daemon, HaProxy or httperf:
+#   FakeDockerClient      -> stands in for docker.DockerClient (containers.run/list/get, events stream, info), every
+#                            container needs "bootSeconds" before serving requests. One per simulated Docker host
+#   FakeHaproxyAdminSocket -> the HaProxy admin socket, its weights/states decide the load split
+#   FakeOsCommandRunner   -> "service haproxy reload" reloads the fake HaProxy from the config file
+#   Simulator             -> offered load (traffic profile) -> weighted split -> queueing model of every httpd
+#                            -> writes the stats files read by MetricIngestor (same format as LogCollector.sh)
+# Simulated time runs "speedup" times faster than the wall clock.
+
+
+class SimClock:
+    def __init__(self, speedup):
+        self.speedup = speedup
+        self.startTime = time.monotonic()
+
+    def now(self):
+        # Simulated seconds since the start
+        return (time.monotonic() - self.startTime) * self.speedup
+
+    def toRealSeconds(self, simSeconds):
+        return simSeconds / self.speedup
+
+
+# Traffic profiles: rate(t) -> offered requests per second at simulated time t
+class RampProfile:
+    def __init__(self, startRate, endRate, rampStart, rampDuration):
+        self.startRate = startRate
+        self.endRate = endRate
+        self.rampStart = rampStart
+        self.rampDuration = rampDuration
+        self.changeTime = rampStart
+
+    def rate(self, t):
+        progress = min(1.0, max(0.0, (t - self.rampStart) / self.rampDuration))
+        return self.startRate + (self.endRate - self.startRate) * progress
+
+
+class SpikeProfile:
+    def __init__(self, baseRate, peakRate, spikeStart, spikeDuration):
+        self.baseRate = baseRate
+        self.peakRate = peakRate
+        self.spikeStart = spikeStart
+        self.spikeDuration = spikeDuration
+        self.changeTime = spikeStart
+
+    def rate(self, t):
+        if self.spikeStart <= t < self.spikeStart + self.spikeDuration:
+            return self.peakRate
+        return self.baseRate
+
+
+class DiurnalProfile:
+    def __init__(self, meanRate, amplitude, period):
+        self.meanRate = meanRate
+        self.amplitude = amplitude
+        self.period = period
+        # The rate starts going up at t = 0
+        self.changeTime = 0
+
+    def rate(self, t):
+        return max(0.0, self.meanRate - self.amplitude * math.cos(2 * math.pi * t / self.period))
+
+
+class FakeEventStream:
+    def __init__(self):
+        self.events = queue.Queue()
+
+    def __iter__(self):
+        while True:
+            event = self.events.get()
+            if event is None:
+                return
+            yield event
+
+    def close(self):
+        self.events.put(None)
+
+
+class FakeContainer:
+    idCounter = itertools.count(1)
+
+    def __init__(self, client, image, name, ports, readyAt, memory=None):
+        self.client = client
+        self.image = image
+        self.name = name
+        self.id = "%064x" % next(FakeContainer.idCounter)
+        # {'80': 8011} -> published host port
+        self.hostPort = int(list(ports.values())[0]) if ports else None
+        self.readyAt = readyAt
+        # running | exited (see FakeDockerClient.stopContainer)
+        self.status = "running"
+        self.attrs = {'NetworkSettings': {'Networks': {'bridge': {'IPAddress': "127.0.0.1"}}},
+                      'HostConfig': {'Memory': memory or 0, 'PortBindings': {
+                          '80/tcp': [{'HostIp': '', 'HostPort': str(self.hostPort)}]} if self.hostPort else {}}}
+
+    def isReady(self):
+        return self.client.clock.now() >= self.readyAt
+
+    def remove(self, force=False):
+        self.client.apiCall()
+        self.client.removeContainer(self)
+
+    def rename(self, newName):
+        self.client.apiCall()
+        self.client.renameContainer(self, newName)
+
+    def stats(self, stream=False, decode=False):
+        backend = None
+        if self.client.simulator:
+            backend = self.client.simulator.backends.get((self.client.hostAddress, self.hostPort))
+        cpu = backend.cpu if backend else 0.0
+        return {'cpu_stats': {'cpu_usage': {'total_usage': int(cpu * 10)}, 'system_cpu_usage': 1000,
+                              'online_cpus': 1},
+                'precpu_stats': {'cpu_usage': {'total_usage': 0}, 'system_cpu_usage': 0},
+                'memory_stats': {'usage': 15 * 1024 * 1024, 'limit': 1000000000}}
+
+
+class FakeContainerCollection:
+    def __init__(self, client):
+        self.client = client
+
+    def run(self, image, name, mem_limit=None, ports=None, command=None, detach=True):
+        self.client.apiCall()
+        with self.client.lock:
+            if name in self.client.containersByName:
+                raise Exception("Conflict. The container name \"/" + name + "\" is already in use")
+            container = FakeContainer(self.client, image, name, ports, self.client.clock.now() +
+                                      self.client.bootSeconds, mem_limit)
+            self.client.containersByName[name] = container
+            self.client.numberOfRuns += 1
+        self.client.emit('create', container.id, name)
+        self.client.emit('start', container.id, name)
+        return container
+
+    def list(self, all=False, filters=None):
+        # Only the "name" filter (a regex) is supported
+        self.client.apiCall()
+        with self.client.lock:
+            containers = [container for container in self.client.containersByName.values()
+                          if all or container.status == "running"]
+        if filters and 'name' in filters:
+            containers = [container for container in containers
+                          if re.search(filters['name'], "/" + container.name)]
+        return containers
+
+    def get(self, containerId):
+        self.client.apiCall()
+        with self.client.lock:
+            for container in self.client.containersByName.values():
+                if containerId in (container.id, container.name):
+                    return container
+        raise Exception("No such container: " + containerId)
+
+
+class FakeDockerClient:
+    def __init__(self, clock, bootSeconds, apiLatency=0.0, hostAddress="127.0.0.1", numberOfCpus=8,
+                 memoryTotal=16 * 1024 ** 3):
+        self.clock = clock
+        self.hostAddress = hostAddress
+        self.numberOfCpus = numberOfCpus
+        self.memoryTotal = memoryTotal
+        self.bootSeconds = bootSeconds
+        # Real seconds spent in every API call (round trip to a remote daemon)
+        self.apiLatency = apiLatency
+        self.containers = FakeContainerCollection(self)
+        self.containersByName = {}
+        self.streams = []
+        self.lock = threading.Lock()
+        self.numberOfRuns = 0
+        self.numberOfApiCalls = 0
+        self.simulator = None
+
+    def apiCall(self):
+        self.numberOfApiCalls += 1
+        if self.apiLatency > 0:
+            time.sleep(self.apiLatency)
+
+    def info(self):
+        self.apiCall()
+        return {'Name': self.hostAddress, 'NCPU': self.numberOfCpus, 'MemTotal': self.memoryTotal}
+
+    def events(self, decode=True, filters=None):
+        stream = FakeEventStream()
+        self.streams.append(stream)
+        return stream
+
+    def emit(self, action, containerId, name, attributes=None):
+        event = {'Type': 'container', 'Action': action, 'status': action, 'id': containerId,
+                 'Actor': {'ID': containerId, 'Attributes': dict(attributes or {}, name=name)}}
+        for stream in self.streams:
+            stream.events.put(event)
+
+    def removeContainer(self, container):
+        with self.lock:
+            self.containersByName.pop(container.name, None)
+        self.emit('die', container.id, container.name)
+        self.emit('destroy', container.id, container.name)
+
+    def stopContainer(self, container):
+        # The container exits (e.g. crashes) but keeps its name until it is removed
+        container.status = "exited"
+        self.emit('die', container.id, container.name)
+
+    def renameContainer(self, container, newName):
+        with self.lock:
+            if newName in self.containersByName:
+                raise Exception("Conflict. The container name \"/" + newName + "\" is already in use")
+            oldName = container.name
+            self.containersByName.pop(oldName, None)
+            container.name = newName
+            self.containersByName[newName] = container
+        self.emit('rename', container.id, newName, {'oldName': '/' + oldName})
+
+    def containerOnPort(self, hostPort):
+        with self.lock:
+            for container in self.containersByName.values():
+                if container.hostPort == hostPort:
+                    return container
+        return None
+
+    def close(self):
+        for stream in self.streams:
+            stream.close()
+
+
+class FakeHaproxyAdminSocket:
+    # Local stand-in for the HaProxy admin socket, it speaks the subset of the runtime API used by HaproxyRuntime.py
+    # so the runtime backend can be exercised without HaProxy, e.g.
+    #   fake = FakeHaproxyAdminSocket("/tmp/admin.sock", "My_Web_Servers")
+    #   fake.loadConfig(open("/etc/haproxy/haproxy.cfg").read())
+    #   fake.start()
+    def __init__(self, socketPath, backendName):
+        self.socketPath = socketPath
+        self.backendName = backendName
+        # {'slot1': {'addr': '127.0.0.1', 'port': 1, 'weight': 1, 'state': 'maint', 'scur': 0}}
+        self.servers = {}
+        self.commandsLog = []
+        self.lock = threading.Lock()
+        self.server = None
+
+    def loadConfig(self, configText):
+        with self.lock:
+            self.servers = {}
+            for line in configText.splitlines():
+                fields = line.split()
+                if len(fields) >= 3 and fields[0] == "server":
+                    ip, _, port = fields[2].rpartition(":")
+                    weight = int(fields[fields.index("weight") + 1]) if "weight" in fields else 1
+                    state = "maint" if "disabled" in fields else "ready"
+                    self.servers[fields[1]] = {'addr': ip, 'port': int(port), 'weight': weight, 'state': state,
+                                               'scur': 0}
+
+    def start(self):
+        if os.path.exists(self.socketPath):
+            os.remove(self.socketPath)
+        fake = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                line = self.rfile.readline().decode().strip()
+                responses = [fake.handleCommand(command.strip()) for command in line.split(";") if command.strip()]
+                self.wfile.write(("\n".join(responses) + "\n").encode())
+
+        self.server = socketserver.ThreadingUnixStreamServer(self.socketPath, Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        if os.path.exists(self.socketPath):
+            os.remove(self.socketPath)
+
+    def setSessions(self, serverName, sessions):
+        with self.lock:
+            self.servers[serverName]['scur'] = sessions
+
+    def findServer(self, target):
+        backend, _, serverName = target.partition("/")
+        if backend != self.backendName or serverName == '':
+            return None, "Require 'backend/server'."
+        if serverName not in self.servers:
+            return None, "No such server."
+        return serverName, None
+
+    def handleCommand(self, command):
+        with self.lock:
+            self.commandsLog.append(command)
+            words = command.split()
+            if words[:2] == ["set", "server"] and len(words) >= 5:
+                serverName, error = self.findServer(words[2])
+                if error:
+                    return error
+                server = self.servers[serverName]
+                if words[3] == "addr":
+                    oldAddr = server['addr']
+                    server['addr'] = words[4]
+                    if len(words) >= 7 and words[5] == "port":
+                        server['port'] = int(words[6])
+                    return "IP changed from '" + oldAddr + "' to '" + server['addr'] + "'"
+                if words[3] == "weight":
+                    server['weight'] = int(words[4])
+                    return ""
+                if words[3] == "state" and words[4] in ("ready", "drain", "maint"):
+                    server['state'] = words[4]
+                    return ""
+                return "Invalid 'set server' arguments."
+            if words[:2] == ["add", "server"] and len(words) >= 4:
+                backend, _, serverName = words[2].partition("/")
+                if backend != self.backendName:
+                    return "No such backend."
+                if serverName in self.servers:
+                    return "Already exists a server with the same name in backend."
+                ip, _, port = words[3].rpartition(":")
+                weight = int(words[words.index("weight") + 1]) if "weight" in words else 1
+                self.servers[serverName] = {'addr': ip, 'port': int(port), 'weight': weight, 'state': 'maint',
+                                            'scur': 0}
+                return "New server registered."
+            if words[:2] in (["enable", "server"], ["disable", "server"]) and len(words) == 3:
+                serverName, error = self.findServer(words[2])
+                if error:
+                    return error
+                self.servers[serverName]['state'] = "ready" if words[0] == "enable" else "maint"
+                return ""
+            if words[:2] == ["del", "server"] and len(words) == 3:
+                serverName, error = self.findServer(words[2])
+                if error:
+                    return error
+                if self.servers[serverName]['state'] != "maint":
+                    return "Only servers in maintenance mode can be deleted."
+                del self.servers[serverName]
+                return "Server deleted."
+            if words[:3] == ["show", "servers", "state"]:
+                return self.renderServersState()
+            if words[:2] == ["show", "stat"]:
+                return self.renderStat()
+            return "Unknown command. Please enter one of the following commands only :"
+
+    def renderServersState(self):
+        adminStates = {'ready': 0, 'maint': 1, 'drain': 8}
+        lines = ["1", "# be_id be_name srv_id srv_name srv_addr srv_op_state srv_admin_state srv_uweight "
+                      "srv_iweight srv_time_since_last_change srv_check_status srv_check_result srv_check_health "
+                      "srv_check_state srv_agent_state bk_f_forced_id srv_f_forced_id srv_fqdn srv_port"]
+        for i, (serverName, server) in enumerate(self.servers.items()):
+            lines.append(" ".join([
+                "1", self.backendName, str(i + 1), serverName, server['addr'],
+                "2" if server['state'] != "maint" else "0", str(adminStates[server['state']]),
+                str(server['weight']), str(server['weight']), "0", "1", "0", "0", "0", "0", "0", "0", "-",
+                str(server['port'])]))
+        return "\n".join(lines)
+
+    def renderStat(self):
+        statuses = {'ready': 'UP', 'maint': 'MAINT', 'drain': 'DRAIN'}
+        lines = ["# pxname,svname,qcur,qmax,scur,smax,slim,stot,weight,status,"]
+        for serverName, server in self.servers.items():
+            lines.append(",".join([self.backendName, serverName, "0", "0", str(server['scur']), "0", "", "0",
+                                   str(server['weight']), statuses[server['state']], ""]))
+        return "\n".join(lines)
+
+
+class FakeOsCommandRunner:
+    def __init__(self, fakeHaproxy, haproxyConfigFilePath):
+        self.fakeHaproxy = fakeHaproxy
+        self.haproxyConfigFilePath = haproxyConfigFilePath
+        self.numberOfRestarts = 0
+
+    def executeCommand(self, command):
+        # Output: None (success) like OsCommandRunner, the config check ("haproxy -c") always passes
+        if "haproxy restart" in command or "haproxy reload" in command:
+            self.numberOfRestarts += 1
+            with open(self.haproxyConfigFilePath) as file:
+                self.fakeHaproxy.loadConfig(file.read())
+        return None
+
+
+class SimulatedBackend:
+    # Queueing model of one httpd container: "threads" workers, each request needs "serviceTime" seconds of a
+    # worker. Requests above the capacity wait in a backlog (it drives the processing time up)
+    def __init__(self, threads, serviceTime, baseMemoryUsage):
+        self.threads = threads
+        self.serviceTime = serviceTime
+        self.baseMemoryUsage = baseMemoryUsage
+        self.backlog = 0.0
+        self.cpu = 0.0
+        self.memoryUsage = baseMemoryUsage
+        self.busyThreadsCount = 0
+        self.processingReqTime = int(serviceTime * 1000)
+
+    def capacity(self):
+        # Requests per second
+        return self.threads / self.serviceTime
+
+    def step(self, offeredRate, dt):
+        capacity = self.capacity()
+        self.backlog = max(0.0, self.backlog + (offeredRate - capacity) * dt)
+        utilization = min(1.0, offeredRate / capacity)
+        self.cpu = utilization * 100
+        if self.backlog > 0:
+            self.busyThreadsCount = self.threads
+        else:
+            self.busyThreadsCount = int(round(offeredRate * self.serviceTime))
+        self.memoryUsage = self.baseMemoryUsage + 0.02 * self.busyThreadsCount
+        waitTime = self.serviceTime / max(0.05, 1 - min(utilization, 0.95)) + self.backlog / capacity
+        self.processingReqTime = int(round(waitTime * 1000))
+
+
+class Simulator:
+    # "dockerClients": one FakeDockerClient per simulated Docker host, a container is identified by
+    # (host address, published port), the same pair as in the HaProxy server lines
+    def __init__(self, clock, dockerClients, fakeHaproxy, profile, logsFolderPath, tickSeconds=0.5, threads=25,
+                 serviceTime=0.02, baseMemoryUsage=0.2, targetUtilization=0.7):
+        self.clock = clock
+        self.dockerClients = dockerClients
+        self.fakeHaproxy = fakeHaproxy
+        self.profile = profile
+        self.logsFolderPath = logsFolderPath
+        self.tickSeconds = tickSeconds
+        self.threads = threads
+        self.serviceTime = serviceTime
+        self.baseMemoryUsage = baseMemoryUsage
+        self.targetUtilization = targetUtilization
+        # {(hostAddress, hostPort): SimulatedBackend}
+        self.backends = {}
+        self.stopped = threading.Event()
+        self.thread = None
+        # Provisioning report (simulated container-seconds)
+        self.overProvisionedSeconds = 0.0
+        self.underProvisionedSeconds = 0.0
+        self.droppedRequests = 0.0
+        self.offeredRequests = 0.0
+        # [(t, servingWebServers)] to find when new capacity arrives
+        self.servingHistory = []
+        for dockerClient in dockerClients:
+            dockerClient.simulator = self
+
+    def requiredWebServers(self, rate):
+        capacity = self.threads / self.serviceTime
+        return max(1, int(math.ceil(rate / (capacity * self.targetUtilization))))
+
+    def findContainer(self, hostAddress, hostPort):
+        for dockerClient in self.dockerClients:
+            if dockerClient.hostAddress == hostAddress:
+                return dockerClient.containerOnPort(hostPort)
+        return None
+
+    def isReady(self, hostAddress, hostPort):
+        # Health check of the warm pool (WarmPoolManager "healthCheck")
+        container = self.findContainer(hostAddress, hostPort)
+        return container is not None and container.isReady()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.runLoop, name="simulator", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def runLoop(self):
+        lastTime = self.clock.now()
+        while not self.stopped.is_set():
+            time.sleep(self.clock.toRealSeconds(self.tickSeconds))
+            now = self.clock.now()
+            self.tick(now, now - lastTime)
+            lastTime = now
+
+    def tick(self, now, dt):
+        rate = self.profile.rate(now)
+        self.offeredRequests += rate * dt
+        # Weighted split between the servers HaProxy sends traffic to
+        with self.fakeHaproxy.lock:
+            targets = [((server['addr'], server['port']), server['weight'])
+                       for server in self.fakeHaproxy.servers.values()
+                       if server['state'] == "ready" and server['weight'] > 0]
+        totalWeight = sum(weight for address, weight in targets)
+        targetAddresses = set(address for address, weight in targets)
+        offeredByAddress = {}
+        for address, weight in targets:
+            offeredByAddress[address] = offeredByAddress.get(address, 0.0) + rate * weight / totalWeight
+        if not targets:
+            self.droppedRequests += rate * dt
+
+        servingWebServers = 0
+        containers = []
+        for dockerClient in self.dockerClients:
+            with dockerClient.lock:
+                containers.extend(dockerClient.containersByName.values())
+        for container in containers:
+            if not container.name.startswith("app"):
+                continue
+            address = (container.client.hostAddress, container.hostPort)
+            offeredRate = offeredByAddress.pop(address, 0.0)
+            if not container.isReady():
+                # HaProxy sends requests to a container which is still booting
+                self.droppedRequests += offeredRate * dt
+                continue
+            backend = self.backends.get(address)
+            if backend is None:
+                backend = self.backends[address] = SimulatedBackend(self.threads, self.serviceTime,
+                                                                    self.baseMemoryUsage)
+            backend.step(offeredRate, dt)
+            self.setSessions(address, backend.busyThreadsCount + int(math.ceil(backend.backlog)))
+            if address in targetAddresses:
+                servingWebServers += 1
+            self.writeStats(container.name, backend)
+        # Servers in HaProxy without any container behind them
+        for address, offeredRate in offeredByAddress.items():
+            self.droppedRequests += offeredRate * dt
+        for address in list(self.backends):
+            if self.findContainer(*address) is None:
+                del self.backends[address]
+
+        required = self.requiredWebServers(rate)
+        self.overProvisionedSeconds += max(0, servingWebServers - required) * dt
+        self.underProvisionedSeconds += max(0, required - servingWebServers) * dt
+        self.servingHistory.append((now, servingWebServers, required))
+
+    def setSessions(self, address, sessions):
+        # Current sessions reported by "show stat" (scur) for the HaProxy server(s) pointing to this container
+        with self.fakeHaproxy.lock:
+            for server in self.fakeHaproxy.servers.values():
+                if (server['addr'], server['port']) == address:
+                    server['scur'] = sessions
+
+    def writeStats(self, name, backend):
+        text = ("Cpu " + "%.2f" % backend.cpu + "%\n" +
+                "Memory 15MiB\n" +
+                "MemoryUsage " + "%.2f" % backend.memoryUsage + "%\n" +
+                "InputTraffic 0B\n" +
+                "OutPutTraffic 0B\n" +
+                "BusyThreadsCount " + str(backend.busyThreadsCount) + "\n" +
+                "ProcessingReqTime " + str(backend.processingReqTime) + "\n")
+        tempPath = os.path.join(self.logsFolderPath, "." + name + ".tmp")
+        with open(tempPath, "w") as fh:
+            fh.write(text)
+        os.replace(tempPath, os.path.join(self.logsFolderPath, name))
@@ -0,0 +1,229 @@
+import logging
+import os
+import threading
+import time
+
+import docker
+
+from HistoryStore import HistoryStore
+from ServerStatusScraper import ServerStatusClient
+from Main import DockerUtil
+
+logging.basicConfig(format='%(asctime)s - %(message)s', datefmt='%d-%b-%y %H:%M:%S')
+logging.getLogger().setLevel(logging.INFO)
+
+#  CONST VARIABLES (make sure to Modify them before using this script)
+# In-process replacement of LogCollector.sh: it writes the same current log files (one per container) which are
+# read by Main.py, without forking docker/lynx/awk for every sample. The history goes to a HistoryStore
+# With several Docker hosts (Main.DockerHosts) one collector runs on every host (the container IPs are only reachable
+# from their host), all of them writing to the logs folder read by Main.py (shared folder)
+DockerApiUrlPort = "unix://var/run/docker.sock"
+LogsFolderPath = "/home/amir/containerAutoScalingScripts/logs/"
+ContainerNamePrefix = "app"
+# Metric history (binary ring buffers, see HistoryStore.py): every sample is kept for "HistoryRawCapacity" samples
+# and one average per "HistoryDownsampleSeconds" for "HistoryDownsampleCapacity" records
+HistoryFolderPath = LogsFolderPath + "history/"
+HistoryRawCapacity = 172800
+HistoryDownsampleSeconds = 60
+HistoryDownsampleCapacity = 43200
+# Seconds between two published samples (can be sub-second, docker stats stream itself ticks every second)
+PublishInterval = 0.5
+# Every container has its own server-status reader (keep-alive connection), which reads the page every
+# "PublishInterval" seconds and gives up after "ServerStatusTimeout" seconds. A container is only published with a
+# server-status read in the last "ServerStatusMaxAge" seconds, so one hung httpd does not delay the others
+ServerStatusTimeout = 0.4
+ServerStatusMaxAge = 1
+
+
+# Input: one sample of "container.stats(stream=True, decode=True)" (see DockerUtil.containerAllStats for a sample)
+# Output: {'Cpu': 0.01, 'Memory': 1544192, 'MemoryUsage': 0.15, 'InputTraffic': 828, 'OutPutTraffic': 0}
+# The formulas are the ones used by "docker stats"
+def parseDockerStats(jsonData):
+    cpuStats = jsonData.get("cpu_stats", {})
+    preCpuStats = jsonData.get("precpu_stats", {})
+    cpu = 0.0
+    cpuDelta = cpuStats.get("cpu_usage", {}).get("total_usage", 0) - preCpuStats.get("cpu_usage", {}).get(
+        "total_usage", 0)
+    systemDelta = cpuStats.get("system_cpu_usage", 0) - preCpuStats.get("system_cpu_usage", 0)
+    if cpuDelta > 0 and systemDelta > 0:
+        onlineCpus = cpuStats.get("online_cpus") or len(cpuStats.get("cpu_usage", {}).get("percpu_usage") or [1])
+        cpu = cpuDelta / systemDelta * onlineCpus * 100
+
+    memoryStats = jsonData.get("memory_stats", {})
+    memory = memoryStats.get("usage", 0)
+    # Page cache is not counted by "docker stats" (cgroup v1 -> cache, cgroup v2 -> inactive_file)
+    if "total_inactive_file" in memoryStats.get("stats", {}):
+        memory -= memoryStats["stats"]["total_inactive_file"]
+    elif "inactive_file" in memoryStats.get("stats", {}):
+        memory -= memoryStats["stats"]["inactive_file"]
+    elif "cache" in memoryStats.get("stats", {}):
+        memory -= memoryStats["stats"]["cache"]
+    memoryUsage = 0.0
+    if memoryStats.get("limit"):
+        memoryUsage = memory / memoryStats["limit"] * 100
+
+    inputTraffic = 0
+    outPutTraffic = 0
+    for network in (jsonData.get("networks") or {}).values():
+        inputTraffic += network.get("rx_bytes", 0)
+        outPutTraffic += network.get("tx_bytes", 0)
+
+    return {'Cpu': cpu, 'Memory': memory, 'MemoryUsage': memoryUsage, 'InputTraffic': inputTraffic,
+            'OutPutTraffic': outPutTraffic}
+
+
+class ContainerStatsWorker:
+    # Follows "container.stats(stream=True)" of one container and reads its server-status page, each in its own
+    # thread, and keeps the latest sample of both in memory
+    def __init__(self, container, serverStatusInterval):
+        self.container = container
+        self.name = container.name
+        self.serverStatusInterval = serverStatusInterval
+        self.latestDockerStats = None
+        # (ServerStatus, time.monotonic() of the read)
+        self.latestServerStatus = None
+        self.stopped = False
+        self.stopEvent = threading.Event()
+        self.stream = None
+        networks = container.attrs.get("NetworkSettings", {}).get("Networks", {})
+        containerIP = ''
+        for network in networks.values():
+            if network.get("IPAddress"):
+                containerIP = network["IPAddress"]
+                break
+        self.serverStatusClient = ServerStatusClient(containerIP, ServerStatusTimeout)
+        self.thread = threading.Thread(target=self.followStats, name="stats-" + self.name, daemon=True)
+        self.thread.start()
+        self.serverStatusThread = threading.Thread(target=self.followServerStatus, name="status-" + self.name,
+                                                   daemon=True)
+        self.serverStatusThread.start()
+
+    def followStats(self):
+        try:
+            self.stream = self.container.stats(stream=True, decode=True)
+            for jsonData in self.stream:
+                if self.stopped:
+                    break
+                self.latestDockerStats = parseDockerStats(jsonData)
+        except Exception as e:
+            if not self.stopped:
+                logging.error("Stats stream of " + self.name + " failed: " + str(e))
+        self.stopped = True
+
+    def followServerStatus(self):
+        while not self.stopEvent.is_set():
+            startTime = time.monotonic()
+            try:
+                self.latestServerStatus = (self.serverStatusClient.fetch(), time.monotonic())
+            except Exception as e:
+                logging.error("Could not read server-status of " + self.name + ": " + str(e))
+            self.stopEvent.wait(max(0, self.serverStatusInterval - (time.monotonic() - startTime)))
+        self.serverStatusClient.close()
+
+    def snapshot(self):
+        # Output: {'Cpu': ..., 'Memory': ..., 'MemoryUsage': ..., 'InputTraffic': ..., 'OutPutTraffic': ...,
+        #          'BusyThreadsCount': ..., 'ProcessingReqTime': ...} or None if docker did not send any sample yet
+        # or the server-status page was not read in the last "ServerStatusMaxAge" seconds. Never blocks
+        latestServerStatus = self.latestServerStatus
+        if self.latestDockerStats is None or latestServerStatus is None:
+            return None
+        serverStatus, readTime = latestServerStatus
+        if time.monotonic() - readTime > ServerStatusMaxAge:
+            return None
+        snapshot = dict(self.latestDockerStats)
+        snapshot['BusyThreadsCount'] = serverStatus.busyWorkers
+        snapshot['ProcessingReqTime'] = serverStatus.processingReqTime()
+        return snapshot
+
+    def stop(self):
+        self.stopped = True
+        self.stopEvent.set()
+        if self.stream is not None and hasattr(self.stream, "close"):
+            self.stream.close()
+
+
+def formatSnapshot(snapshot):
+    # Same lines as LogCollector.sh writes (and Main.py reads), the sizes are exact byte counts ("1544192B") instead
+    # of the rounded docker CLI units so Main.py can derive the network rates from the traffic counters
+    return ("Cpu " + "%.2f" % snapshot['Cpu'] + "%\n" +
+            "Memory " + "%d" % snapshot['Memory'] + "B\n" +
+            "MemoryUsage " + "%.2f" % snapshot['MemoryUsage'] + "%\n" +
+            "InputTraffic " + "%d" % snapshot['InputTraffic'] + "B\n" +
+            "OutPutTraffic " + "%d" % snapshot['OutPutTraffic'] + "B\n" +
+            "BusyThreadsCount " + str(snapshot['BusyThreadsCount']) + "\n" +
+            "ProcessingReqTime " + str(snapshot['ProcessingReqTime']) + "\n")
+
+
+class StatsCollector:
+    def __init__(self, dockerUtil, logsFolderPath, containerNamePrefix, publishInterval, historyStore):
+        self.dockerUtil = dockerUtil
+        self.historyStore = historyStore
+        self.logsFolderPath = logsFolderPath
+        self.containerNamePrefix = containerNamePrefix
+        self.publishInterval = publishInterval
+        self.workers = {}
+        # {'app1': {'Cpu': ..., ...}} latest published snapshot of every container
+        self.latestSnapshots = {}
+
+    def syncWorkers(self):
+        # Start a stats stream for every new container and stop the ones whose container is gone
+        aliveNames = set()
+        for container in self.dockerUtil.allContainersList():
+            if container.name.startswith(self.containerNamePrefix):
+                aliveNames.add(container.name)
+                worker = self.workers.get(container.name)
+                # A stopped stream, or the name taken by a new container since the last sync
+                if worker is None or worker.stopped or worker.container.id != container.id:
+                    if worker is not None:
+                        worker.stop()
+                    self.historyStore.register(container.name, container.id)
+                    self.workers[container.name] = ContainerStatsWorker(container, self.publishInterval)
+        for name in list(self.workers):
+            if name not in aliveNames:
+                self.workers.pop(name).stop()
+                self.latestSnapshots.pop(name, None)
+                # The current log file is removed, the history file is kept (same as LogCollector.sh)
+                if os.path.exists(self.logsFolderPath + name):
+                    os.remove(self.logsFolderPath + name)
+
+    def publish(self, name, snapshot):
+        # Written to a temp file and renamed so Main.py never reads a half written file
+        text = formatSnapshot(snapshot)
+        tempPath = self.logsFolderPath + "." + name + ".tmp"
+        with open(tempPath, "w") as fh:
+            fh.write(text)
+        os.replace(tempPath, self.logsFolderPath + name)
+        self.historyStore.append(name, time.time(), snapshot)
+
+    def collectOnce(self):
+        self.syncWorkers()
+        for name, worker in self.workers.items():
+            snapshot = worker.snapshot()
+            if snapshot is not None:
+                self.latestSnapshots[name] = snapshot
+                self.publish(name, snapshot)
+
+    def run(self):
+        while True:
+            startTime = time.monotonic()
+            self.collectOnce()
+            time.sleep(max(0, self.publishInterval - (time.monotonic() - startTime)))
+
+    def stop(self):
+        for worker in self.workers.values():
+            worker.stop()
+        self.workers = {}
+        self.historyStore.close()
+
+
+if __name__ == "__main__":
+    client = docker.DockerClient(base_url=DockerApiUrlPort)
+    historyStore = HistoryStore(HistoryFolderPath, HistoryRawCapacity, HistoryDownsampleSeconds,
+                                HistoryDownsampleCapacity)
+    statsCollector = StatsCollector(DockerUtil(client), LogsFolderPath, ContainerNamePrefix, PublishInterval,
+                                    historyStore)
+    logging.info("**** STARTING THE STATS COLLECTOR ****")
+    try:
+        statsCollector.run()
+    finally:
+        statsCollector.stop()
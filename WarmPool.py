@@ -0,0 +1,194 @@
+import heapq
+import http.client
+import logging
+import threading
+import time
+
+
+# Pool of pre-started web server containers which are kept out of the load balancer. Scaling up promotes one of
+# them (rename to the web server name + add to HaProxy) instead of creating a container and waiting for httpd to
+# boot, and the pool is refilled in the background.
+# Standby containers are named "<standbyNamePrefix><n>" so they are not picked up by the stats collectors (which
+# only look at the "app" containers) and are published on "standbyPortBase + n". A promoted container keeps its
+# port, so n stays in use until the web server is removed (releasePort), then it goes back to a free-list (lowest
+# first) like the numbers of the BackendRegistry.
+class WarmPoolManager:
+    def __init__(self, dockerUtil, image, memory, hostIp, standbyNamePrefix, standbyPortBase, poolSize,
+                 maxPoolSize=None, adaptiveWindow=None, healthCheckTimeout=1, bootTimeout=30, healthCheck=None,
+                 failureBackoff=10):
+        self.dockerUtil = dockerUtil
+        self.image = image
+        self.memory = memory
+        self.hostIp = hostIp
+        self.standbyNamePrefix = standbyNamePrefix
+        self.standbyPortBase = standbyPortBase
+        self.poolSize = poolSize
+        self.maxPoolSize = maxPoolSize if maxPoolSize is not None else poolSize
+        # Adaptive size: the pool grows by one for every promotion done in the last "adaptiveWindow" seconds
+        # (up to "maxPoolSize"), None keeps the size fixed
+        self.adaptiveWindow = adaptiveWindow
+        self.healthCheckTimeout = healthCheckTimeout
+        self.bootTimeout = bootTimeout
+        # healthCheck(hostIp, port) -> bool, an HTTP "HEAD /" on the published port by default
+        self.healthCheck = healthCheck if healthCheck is not None else self.isHealthy
+        # [(name, port)] healthy standby containers, the oldest first
+        self.readyContainers = []
+        self.numberOfStarting = 0
+        # Indexes of the starting / ready standby containers and of the promoted web servers
+        self.usedIndexes = set()
+        self.freeIndexes = []
+        self.nextIndex = 1
+        self.promotionTimes = []
+        # No standby container is started for "failureBackoff" seconds after a failed creation (e.g. every Docker
+        # host is full)
+        self.failureBackoff = failureBackoff
+        self.lastFailureTime = None
+        self.lock = threading.Lock()
+        self.refillEvent = threading.Event()
+        self.stopped = threading.Event()
+        self.refillThread = None
+
+    def start(self):
+        # Standby containers left by a previous run are removed, their port and health are unknown
+        for container in self.dockerUtil.allContainersList():
+            if container.name.startswith(self.standbyNamePrefix):
+                self.dockerUtil.removeCountainer(container.name)
+        self.refillThread = threading.Thread(target=self.refillLoop, name="warm-pool", daemon=True)
+        self.refillThread.start()
+        self.refillEvent.set()
+
+    def targetSize(self):
+        if self.adaptiveWindow is None:
+            return self.poolSize
+        now = time.monotonic()
+        with self.lock:
+            self.promotionTimes = [t for t in self.promotionTimes if now - t < self.adaptiveWindow]
+            return min(self.maxPoolSize, self.poolSize + len(self.promotionTimes))
+
+    def refillLoop(self):
+        while not self.stopped.is_set():
+            self.refillEvent.wait(timeout=5)
+            self.refillEvent.clear()
+            while not self.stopped.is_set():
+                targetSize = self.targetSize()
+                with self.lock:
+                    missing = targetSize - len(self.readyContainers) - self.numberOfStarting
+                    if missing <= 0:
+                        break
+                    if self.lastFailureTime is not None and \
+                            time.monotonic() - self.lastFailureTime < self.failureBackoff:
+                        break
+                    self.numberOfStarting += 1
+                    index = self.allocateIndex()
+                    name = self.standbyNamePrefix + str(index)
+                    port = self.standbyPortBase + index
+                # Every standby container boots in its own thread
+                threading.Thread(target=self.startStandby, args=(name, port), daemon=True).start()
+
+    def allocateIndex(self):
+        # Called with the lock held
+        if self.freeIndexes:
+            index = heapq.heappop(self.freeIndexes)
+        else:
+            index = self.nextIndex
+            self.nextIndex += 1
+        self.usedIndexes.add(index)
+        return index
+
+    def releasePort(self, port):
+        # The container published on "port" (standby or promoted) has been removed, other ports are ignored
+        index = port - self.standbyPortBase
+        with self.lock:
+            if index in self.usedIndexes:
+                self.usedIndexes.remove(index)
+                heapq.heappush(self.freeIndexes, index)
+
+    def reservePort(self, port):
+        # A web server of a previous run (AutoScaler.reconcileWebServers) still uses "port"
+        index = port - self.standbyPortBase
+        if index < 1:
+            return
+        with self.lock:
+            if index >= self.nextIndex:
+                for freeIndex in range(self.nextIndex, index):
+                    heapq.heappush(self.freeIndexes, freeIndex)
+                self.nextIndex = index + 1
+            elif index in self.freeIndexes:
+                self.freeIndexes.remove(index)
+                heapq.heapify(self.freeIndexes)
+            self.usedIndexes.add(index)
+
+    def startStandby(self, name, port):
+        try:
+            container = self.dockerUtil.createContainer(self.image, name, self.memory, command='', ports={
+                # Container Port : Host Port
+                '80': port
+            })
+            if container is None:
+                with self.lock:
+                    self.lastFailureTime = time.monotonic()
+                self.releasePort(port)
+                return
+            # With several Docker hosts the container is on the host chosen by the placement
+            hostIp = self.dockerUtil.getHostAddress(name) or self.hostIp
+            if self.waitUntilHealthy(hostIp, port):
+                with self.lock:
+                    self.readyContainers.append((name, port))
+                logging.info("Standby container " + name + " is ready")
+            else:
+                logging.error("Standby container " + name + " did not become healthy, removing it")
+                self.dockerUtil.removeCountainer(name)
+                self.releasePort(port)
+        finally:
+            with self.lock:
+                self.numberOfStarting -= 1
+
+    def waitUntilHealthy(self, hostIp, port):
+        stopTime = time.monotonic() + self.bootTimeout
+        while time.monotonic() < stopTime and not self.stopped.is_set():
+            if self.healthCheck(hostIp, port):
+                return True
+            time.sleep(0.2)
+        return False
+
+    def isHealthy(self, hostIp, port):
+        connection = http.client.HTTPConnection(hostIp, port, timeout=self.healthCheckTimeout)
+        try:
+            connection.request("HEAD", "/")
+            return connection.getresponse().status < 500
+        except (http.client.HTTPException, OSError):
+            return False
+        finally:
+            connection.close()
+
+    def promote(self, webServerName):
+        # Output: host port of the promoted container (renamed to "webServerName"), None if the pool is empty
+        while True:
+            with self.lock:
+                if not self.readyContainers:
+                    self.refillEvent.set()
+                    return None
+                name, port = self.readyContainers.pop(0)
+                self.promotionTimes.append(time.monotonic())
+            self.refillEvent.set()
+            if self.dockerUtil.renameContainer(name, webServerName):
+                logging.info("Standby container " + name + " has been promoted to " + webServerName)
+                return port
+            # The standby container is gone (crashed or removed), try the next one
+            self.dockerUtil.removeCountainer(name)
+            self.releasePort(port)
+
+    def size(self):
+        with self.lock:
+            return len(self.readyContainers)
+
+    def shutdown(self, removeStandby=True):
+        self.stopped.set()
+        self.refillEvent.set()
+        if removeStandby:
+            with self.lock:
+                readyContainers = self.readyContainers
+                self.readyContainers = []
+            for name, port in readyContainers:
+                self.dockerUtil.removeCountainer(name)
+                self.releasePort(port)
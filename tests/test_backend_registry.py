@@ -0,0 +1,94 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from BackendRegistry import BackendRegistry
+from Main import WebServer
+from WarmPool import WarmPoolManager
+
+# Numbers of BackendRegistry (names and ports of the web servers) and WarmPoolManager (ports of the standby and
+# promoted containers): the numbers given back are reused lowest first, a number taken by a previous run is not
+# handed out again
+
+
+class BackendRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.registry = BackendRegistry("app", 8010)
+
+    def addNext(self, isNameTaken=None):
+        name, port = self.registry.allocate(isNameTaken)
+        webServer = WebServer(name, port, 1)
+        self.registry.add(webServer)
+        return webServer
+
+    def testNumbersAreReusedLowestFirst(self):
+        webServers = [self.addNext() for i in range(5)]
+        self.assertEqual([(webServer.name, webServer.mappedPort) for webServer in webServers[:2]],
+                         [("app1", 8011), ("app2", 8012)])
+        for webServer in (webServers[3], webServers[1]):
+            self.registry.markDead(webServer)
+        self.assertEqual([webServer.name for webServer in self.registry.compact()], ["app4", "app2"])
+        self.assertEqual(self.registry.allocate(), ("app2", 8012))
+        self.registry.add(WebServer("app2", 8012, 1))
+        self.assertEqual(self.registry.allocate(), ("app4", 8014))
+        self.registry.add(WebServer("app4", 8014, 1))
+        self.assertEqual(self.registry.allocate(), ("app6", 8016))
+
+    def testDrainingWebServerKeepsItsNumber(self):
+        webServers = [self.addNext() for i in range(2)]
+        self.registry.markDraining(webServers[0])
+        self.registry.compact()
+        self.assertEqual(self.registry.allocate(), ("app3", 8013))
+        # Removed by the DrainManager (flag set outside of the registry), freed by the next compact
+        webServers[0].setIsDead(True)
+        self.assertEqual(self.registry.compact(), [webServers[0]])
+        self.assertEqual(self.registry.allocate(), ("app1", 8011))
+
+    def testTakenNameIsSkipped(self):
+        webServers = [self.addNext() for i in range(3)]
+        self.registry.markDead(webServers[0])
+        self.registry.markDead(webServers[1])
+        self.registry.compact()
+        # The container of the previous app1 still exists, app1 stays free for a later allocation
+        self.assertEqual(self.registry.allocate(lambda name: name == "app1"), ("app2", 8012))
+        self.assertEqual(self.registry.allocate(), ("app1", 8011))
+
+    def testWebServerOfAPreviousRun(self):
+        self.registry.add(WebServer("app3", 8013, 1))
+        self.assertEqual([self.registry.allocate()[0] for i in range(3)], ["app1", "app2", "app4"])
+        self.assertEqual(len(self.registry), 1)
+
+
+class WarmPoolPortTest(unittest.TestCase):
+    def setUp(self):
+        self.warmPoolManager = WarmPoolManager(None, "httpd_final", 1000000000, "127.0.0.1", "standby", 9000, 2)
+
+    def allocatePort(self):
+        with self.warmPoolManager.lock:
+            return self.warmPoolManager.standbyPortBase + self.warmPoolManager.allocateIndex()
+
+    def testReleasedPortsAreReusedLowestFirst(self):
+        self.assertEqual([self.allocatePort() for i in range(4)], [9001, 9002, 9003, 9004])
+        self.warmPoolManager.releasePort(9003)
+        self.warmPoolManager.releasePort(9001)
+        # Not a port of the pool, or already released
+        self.warmPoolManager.releasePort(8011)
+        self.warmPoolManager.releasePort(9001)
+        self.assertEqual([self.allocatePort() for i in range(3)], [9001, 9003, 9005])
+
+    def testReservedPortIsNotAllocated(self):
+        self.warmPoolManager.reservePort(9003)
+        self.assertEqual([self.allocatePort() for i in range(3)], [9001, 9002, 9004])
+        # Released then taken back by a web server of a previous run
+        self.warmPoolManager.releasePort(9002)
+        self.warmPoolManager.reservePort(9002)
+        self.assertEqual(self.allocatePort(), 9005)
+        # Below the port base
+        self.warmPoolManager.reservePort(8011)
+        self.assertEqual(self.allocatePort(), 9006)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Main
+from Simulator import FakeDockerClient, SimClock
+
+# DockerUtil / DockerHostPool against FakeDockerClient: a crashed container still holds its name, the name checks
+# and the removal are answered from the indexes kept up to date by the events stream, without listing the containers
+
+
+def waitFor(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class DockerUtilTest(unittest.TestCase):
+    def setUp(self):
+        self.client = FakeDockerClient(SimClock(1.0), 0)
+        self.dockerUtil = Main.DockerUtil(self.client, hostAddress="10.0.0.1")
+        self.dockerHostPool = Main.DockerHostPool([self.dockerUtil], Main.PlacementScheduler(0.9, 0.9))
+
+    def tearDown(self):
+        self.dockerUtil.stopEventWatcher()
+
+    def testStoppedContainerHoldsItsName(self):
+        container = self.dockerHostPool.createContainer("httpd", "app1", 128 * 1024 ** 2, None, {'80': 8011})
+        self.client.stopContainer(container)
+        # The events are handled in order, "start" (one API call) is done once "die" is
+        self.assertTrue(waitFor(lambda: self.dockerUtil.hasStoppedContainer("app1")))
+        numberOfApiCalls = self.client.numberOfApiCalls
+        self.assertFalse(self.dockerHostPool.ifContainerExist("app1"))
+        self.assertTrue(self.dockerHostPool.isNameTaken("app1"))
+        self.assertFalse(self.dockerHostPool.isNameTaken("app2"))
+        self.assertEqual(self.client.numberOfApiCalls, numberOfApiCalls)
+
+        self.assertTrue(self.dockerHostPool.removeCountainer("app1"))
+        self.assertNotIn("app1", self.client.containersByName)
+        self.assertFalse(self.dockerHostPool.isNameTaken("app1"))
+
+    def testInventoryKeepsStoppedContainers(self):
+        container = self.client.containers.run("httpd", "app1", ports={'80': 8011})
+        self.client.containers.run("httpd", "app2", ports={'80': 8012})
+        self.client.stopContainer(container)
+        dockerUtil = Main.DockerUtil(self.client, watchEvents=False)
+        self.assertEqual([container.name for container in dockerUtil.allContainersList()], ["app2"])
+        self.assertTrue(dockerUtil.isNameTaken("app1"))
+
+
+if __name__ == '__main__':
+    unittest.main()
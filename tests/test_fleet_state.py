@@ -0,0 +1,170 @@
+import math
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from FleetState import FleetState
+from Main import WebServer
+from MetricSnapshot import MetricSnapshot
+
+# FleetState.evaluate against the scalar calculation it replaces: WebServer.calcucateScoreAndFlags for every web
+# server with stats, then the SECTION 2 loop (weights, sums, flag counts, drain candidate, physical removals).
+# Random fleets, the scores, flags and choices have to be exactly the same, the sums and weights up to the rounding
+
+X, Y, Z = 0.4, 0.3, 0.3
+MaxProcessingTime = 500
+ScaleUpThr, ScaleDownThr, ScaleUpAverageThr = 60, 20, 50
+
+
+def randomFleet(rand, size):
+    webServers = []
+    for i in range(size):
+        webServer = WebServer("app" + str(i + 1), 8011 + i, 100)
+        if rand.random() < 0.9:
+            snapshot = MetricSnapshot(rand.uniform(0, 100), 0, rand.uniform(0, 100), 0, 0, rand.randint(0, 30),
+                                      rand.choice([rand.uniform(1, 1000), 200.0]))
+            snapshot.inputRate = rand.uniform(0, 1e6)
+            snapshot.outPutRate = rand.uniform(0, 1e6)
+            webServer.setStatus(snapshot)
+            webServer.setStale(False, 1.0)
+        webServer.setDeathFlag(rand.random() < 0.2)
+        webServer.setIsDead(webServer.getDeathFlag() and rand.random() < 0.5)
+        webServers.append(webServer)
+    return webServers
+
+
+def scalarDecision(webServers, N, M, maxNetworkRate):
+    sumOfAllInvertedScore = 0
+    for webServer in webServers:
+        if not webServer.getIsDead() and webServer.hasStats():
+            webServer.calcucateScoreAndFlags(X, Y, Z, MaxProcessingTime, ScaleUpThr, ScaleDownThr, N, M,
+                                             maxNetworkRate)
+            sumOfAllInvertedScore += 1 / webServer.score
+    result = {'sumOfAllInvertedScore': sumOfAllInvertedScore, 'sumOfAllScores': 0, 'alive': 0, 'up': 0, 'down': 0,
+              'highestWeight': -1, 'lowestScore': 9999, 'lowestScoreWebServerName': '', 'removable': [],
+              'scores': {}, 'weights': {}}
+    for webServer in webServers:
+        if webServer.getIsDead() or not webServer.hasStats():
+            continue
+        result['scores'][webServer.name] = (webServer.score, webServer.scaleUpFlag, webServer.scaleDownFlag)
+        if not webServer.getDeathFlag():
+            webServer.setWeight(((1 / webServer.score) / sumOfAllInvertedScore) * 100)
+            result['weights'][webServer.name] = webServer.weight
+            result['alive'] += 1
+            result['sumOfAllScores'] += webServer.score
+            if result['lowestScore'] >= webServer.score:
+                result['lowestScore'] = webServer.score
+                result['lowestScoreWebServerName'] = webServer.name
+            if webServer.getWeight() >= result['highestWeight']:
+                result['highestWeight'] = webServer.weight
+            if webServer.scaleUpFlag:
+                result['up'] += 1
+            elif webServer.scaleDownFlag:
+                result['down'] += 1
+    for index, webServer in enumerate(webServers):
+        if not webServer.getIsDead() and webServer.getDeathFlag() and webServer.busyThreadsCount < 4:
+            result['removable'].append(index)
+    return result
+
+
+class FleetStateTest(unittest.TestCase):
+    def assertSameAsScalar(self, seed, size, N=0, M=0, maxNetworkRate=1):
+        webServers = randomFleet(random.Random(seed), size)
+        fleetState = FleetState(capacity=4)
+        for webServer in webServers:
+            fleetState.addRow(webServer)
+        decision = fleetState.evaluate(X, Y, Z, MaxProcessingTime, ScaleUpThr, ScaleDownThr, ScaleUpAverageThr, N,
+                                       M, maxNetworkRate)
+        batched = {'scores': {}, 'weights': {}}
+        for webServer in webServers:
+            if not webServer.getIsDead() and webServer.hasStats():
+                batched['scores'][webServer.name] = (webServer.score, webServer.scaleUpFlag,
+                                                     webServer.scaleDownFlag)
+                if not webServer.getDeathFlag():
+                    batched['weights'][webServer.name] = webServer.weight
+
+        expected = scalarDecision(randomFleet(random.Random(seed), size), N, M, maxNetworkRate)
+        self.assertEqual(batched['scores'], expected['scores'])
+        self.assertEqual(batched['weights'].keys(), expected['weights'].keys())
+        for name, weight in expected['weights'].items():
+            self.assertAlmostEqual(batched['weights'][name], weight, places=9)
+        self.assertAlmostEqual(decision.sumOfAllInvertedScore, expected['sumOfAllInvertedScore'], places=9)
+        self.assertAlmostEqual(decision.sumOfAllScores, expected['sumOfAllScores'], places=6)
+        self.assertEqual(decision.numberOfCurrentAliveWebServers, expected['alive'])
+        self.assertEqual(decision.numberOfScaleUpFlag, expected['up'])
+        self.assertEqual(decision.numberOfScaleDownFlag, expected['down'])
+        self.assertAlmostEqual(decision.highestWeight, expected['highestWeight'], places=9)
+        self.assertEqual(decision.lowestScore, expected['lowestScore'])
+        self.assertEqual(decision.lowestScoreWebServerName, expected['lowestScoreWebServerName'])
+        self.assertEqual(decision.removableIndexes, expected['removable'])
+
+    def testOriginalScore(self):
+        for seed in range(50):
+            self.assertSameAsScalar(seed, random.Random(seed).randint(1, 200))
+
+    def testNetworkAndMemoryTerms(self):
+        for seed in range(50):
+            self.assertSameAsScalar(seed, random.Random(seed).randint(1, 200), N=0.2, M=0.1, maxNetworkRate=2e6)
+
+    def testTiesKeepTheLastLowestScore(self):
+        # Same stats for every web server, the scalar loop keeps the last one as drain candidate
+        webServers = []
+        for i in range(5):
+            webServer = WebServer("app" + str(i + 1), 8011 + i, 100)
+            webServer.setStatus(MetricSnapshot(10.0, 0, 10.0, 0, 0, 1, 200.0))
+            webServer.setStale(False, 1.0)
+            webServers.append(webServer)
+        fleetState = FleetState()
+        for webServer in webServers:
+            fleetState.addRow(webServer)
+        decision = fleetState.evaluate(X, Y, Z, MaxProcessingTime, ScaleUpThr, ScaleDownThr, ScaleUpAverageThr)
+        self.assertEqual(decision.lowestScoreWebServerName, "app5")
+        self.assertEqual(fleetState.lowestScoreIndexes(2), [4, 3])
+
+    def testIdleWebServerGetsAFiniteWeight(self):
+        webServers = []
+        for i, cpu in enumerate((0.0, 0.0, 40.0)):
+            webServer = WebServer("app" + str(i + 1), 8011 + i, 100)
+            webServer.setStatus(MetricSnapshot(cpu, 0, cpu, 0, 0, 0, 0))
+            webServer.setStale(False, 1.0)
+            webServers.append(webServer)
+        fleetState = FleetState()
+        for webServer in webServers:
+            fleetState.addRow(webServer)
+        decision = fleetState.evaluate(X, Y, Z, MaxProcessingTime, ScaleUpThr, ScaleDownThr, ScaleUpAverageThr)
+        weights = [webServer.weight for webServer in webServers]
+        self.assertTrue(all(math.isfinite(weight) for weight in weights))
+        self.assertAlmostEqual(sum(weights), 100)
+        self.assertEqual(weights[0], weights[1])
+        self.assertEqual(decision.lowestScore, 0)
+
+    def testRowsAreTheStorage(self):
+        fleetState = FleetState(capacity=2)
+        webServers = [WebServer("app" + str(i + 1), 8011 + i, 100) for i in range(3)]
+        for webServer in webServers:
+            fleetState.addRow(webServer)
+        # The stats of a registered web server are written to its row
+        webServers[1].setStatus(MetricSnapshot(30.0, 0, 10.0, 0, 0, 5, 100.0))
+        webServers[1].setStale(False, 1.0)
+        self.assertEqual((fleetState.cpu[1], fleetState.busyThreadsCount[1], fleetState.hasStats[1]), (30.0, 5, True))
+        fleetState.evaluate(X, Y, Z, MaxProcessingTime, ScaleUpThr, ScaleDownThr, ScaleUpAverageThr)
+        self.assertEqual(webServers[1].score, fleetState.score[1])
+        self.assertEqual(webServers[1].weight, 100.0)
+
+        # A removed web server keeps its last values, its row is left out and given to the next one
+        score = webServers[1].score
+        fleetState.removeRow(webServers[1])
+        self.assertEqual(webServers[1].score, score)
+        self.assertEqual(fleetState.evaluate(X, Y, Z, MaxProcessingTime, ScaleUpThr, ScaleDownThr,
+                                             ScaleUpAverageThr).numberOfCurrentAliveWebServers, 0)
+        newWebServer = WebServer("app4", 8014, 1)
+        self.assertEqual(fleetState.addRow(newWebServer), 1)
+        self.assertIs(fleetState.webServers[1], newWebServer)
+        self.assertEqual(fleetState.cpu[1], -1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Forecaster import HoltForecaster
+
+# HoltForecaster on known series: the trend of a linear series is extrapolated (regular and irregular intervals), a
+# flat series has no trend
+
+
+class HoltForecasterTest(unittest.TestCase):
+    def testLinearSeriesIsExtrapolated(self):
+        # score = 10 + 2 t, one sample per second
+        forecaster = HoltForecaster(0.5, 0.3)
+        for t in range(60):
+            forecaster.update(t, 10 + 2 * t)
+        self.assertAlmostEqual(forecaster.trend, 2, places=3)
+        self.assertAlmostEqual(forecaster.forecast(0), 10 + 2 * 59, places=2)
+        self.assertAlmostEqual(forecaster.forecast(30), 10 + 2 * 89, places=2)
+
+    def testExactWithoutSmoothing(self):
+        forecaster = HoltForecaster(1, 1)
+        self.assertIsNone(forecaster.forecast(10))
+        forecaster.update(0, 5)
+        forecaster.update(2, 9)
+        self.assertEqual(forecaster.forecast(10), 29)
+
+    def testIrregularIntervals(self):
+        forecaster = HoltForecaster(0.5, 0.3)
+        t = 0.0
+        for dt in [0.5, 1.5, 1.0, 2.5, 0.7] * 20:
+            t += dt
+            forecaster.update(t, 10 + 2 * t)
+        self.assertAlmostEqual(forecaster.trend, 2, places=3)
+        self.assertAlmostEqual(forecaster.forecast(5), 10 + 2 * (t + 5), places=2)
+        # Same timestamp again (stale stats): the trend is not changed
+        trend = forecaster.trend
+        forecaster.update(t, 10 + 2 * t)
+        self.assertEqual(forecaster.trend, trend)
+
+    def testFlatSeries(self):
+        forecaster = HoltForecaster(0.5, 0.3)
+        for t in range(20):
+            forecaster.update(t, 42)
+        self.assertEqual(forecaster.trend, 0)
+        self.assertEqual(forecaster.forecast(100), 42)
+        self.assertEqual(forecaster.numberOfSamples, 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Main
+from HaproxyConfig import HaproxyConfigError, HaproxyReloader
+from HaproxyRuntime import HaproxyRuntimeModifier
+
+# HaproxyReloader with a stubbed command runner: the reload is skipped when the config did not change, a config
+# rejected by the check ("haproxy -c") leaves the config file as it is and is not reloaded, the config persisted by
+# HaproxyRuntimeModifier goes through the same check
+
+ValidateCommand = "haproxy -c -q -f "
+ReloadCommand = "service haproxy reload"
+
+
+class StubCommandRunner:
+    def __init__(self):
+        self.commands = []
+        # Exit status of the check (None -> accepted)
+        self.validateExitStatus = None
+        self.checkedConfig = None
+
+    def executeCommand(self, command):
+        self.commands.append(command)
+        if command.startswith(ValidateCommand):
+            # The file to check is written completely before the check
+            with open(command[len(ValidateCommand):]) as file:
+                self.checkedConfig = file.read()
+            return self.validateExitStatus
+        return None
+
+    def numberOfReloads(self):
+        return self.commands.count(ReloadCommand)
+
+
+class HaproxyReloaderTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.configFilePath = os.path.join(self.directory, "haproxy.cfg")
+        self.configModifier = Main.HaproxyConfigModifier(self.configFilePath)
+        self.commandRunner = StubCommandRunner()
+        self.reloader = HaproxyReloader(self.configModifier, self.commandRunner, ValidateCommand, ReloadCommand)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def readConfigFile(self):
+        with open(self.configFilePath) as file:
+            return file.read()
+
+    def testUnchangedConfigIsNotReloaded(self):
+        self.assertTrue(self.reloader.apply("config 1\n"))
+        self.assertEqual(self.commandRunner.checkedConfig, "config 1\n")
+        self.assertFalse(self.reloader.apply("config 1\n"))
+        self.assertEqual(self.commandRunner.numberOfReloads(), 1)
+        self.assertEqual(len(self.commandRunner.commands), 2)
+        self.assertTrue(self.reloader.apply("config 2\n"))
+        self.assertEqual(self.commandRunner.numberOfReloads(), 2)
+        self.assertEqual(self.readConfigFile(), "config 2\n")
+
+    def testRejectedConfigKeepsTheOldFile(self):
+        self.reloader.apply("config 1\n")
+        self.commandRunner.validateExitStatus = 256
+        with self.assertRaises(HaproxyConfigError):
+            self.reloader.apply("config 2\n")
+        self.assertEqual(self.readConfigFile(), "config 1\n")
+        self.assertEqual(self.commandRunner.numberOfReloads(), 1)
+        # No temporary file left next to the config file
+        self.assertEqual(os.listdir(self.directory), ["haproxy.cfg"])
+        # Accepted again, the config is applied
+        self.commandRunner.validateExitStatus = None
+        self.assertTrue(self.reloader.apply("config 2\n"))
+        self.assertEqual(self.readConfigFile(), "config 2\n")
+
+    def testPersistedConfigIsChecked(self):
+        runtimeModifier = HaproxyRuntimeModifier(None, self.configModifier, Main.HaProxyInitConfigFile,
+                                                 Main.HaProxyBackendName, 2, self.reloader)
+        runtimeModifier.persist()
+        configStr = self.readConfigFile()
+        self.assertEqual(self.commandRunner.checkedConfig, configStr)
+
+        runtimeModifier.assignSlot("app1", "10.0.0.1", 8011, 10, "ready")
+        self.commandRunner.validateExitStatus = 256
+        with self.assertRaises(HaproxyConfigError):
+            runtimeModifier.persist()
+        self.assertEqual(self.readConfigFile(), configStr)
+        self.assertEqual(self.commandRunner.numberOfReloads(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
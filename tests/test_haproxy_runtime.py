@@ -0,0 +1,97 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Main
+from HaproxyRuntime import HaproxyRuntimeApi, HaproxyRuntimeError, HaproxyRuntimeModifier, MaxWeight, \
+    WeightSynchronizer
+from Simulator import FakeHaproxyAdminSocket
+
+# HaproxyRuntimeModifier.applyChanges against FakeHaproxyAdminSocket (2 pre-provisioned slots):
+#   the slots of the removed web servers are reused, dynamic servers are added/deleted once the slots are taken,
+#   a rejected batch raises HaproxyRuntimeError but the local slots (desired state) are still persisted.
+# WeightSynchronizer against the same fake
+
+
+class HaproxyRuntimeModifierTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.configFilePath = os.path.join(self.directory, "haproxy.cfg")
+        self.fake = FakeHaproxyAdminSocket(os.path.join(self.directory, "admin.sock"), Main.HaProxyBackendName)
+        self.modifier = HaproxyRuntimeModifier(HaproxyRuntimeApi(self.fake.socketPath),
+                                               Main.HaproxyConfigModifier(self.configFilePath),
+                                               Main.HaProxyInitConfigFile, Main.HaProxyBackendName, 2)
+        self.modifier.persist()
+        self.fake.loadConfig(self.modifier.renderConfig())
+        self.fake.start()
+
+    def tearDown(self):
+        self.fake.stop()
+        shutil.rmtree(self.directory)
+
+    def readConfigFile(self):
+        with open(self.configFilePath) as file:
+            return file.read()
+
+    def testRemovedSlotIsReused(self):
+        self.modifier.applyChanges(added=[("app1", "10.0.0.1", 8001, 10), ("app2", "10.0.0.2", 8002, 10)])
+        self.assertEqual(self.modifier.getSlotName("app1"), "slot1")
+        self.assertEqual(self.modifier.getSlotName("app2"), "slot2")
+        self.assertEqual(self.fake.servers["slot1"]['state'], "ready")
+
+        self.modifier.applyChanges(added=[("app3", "10.0.0.3", 8003, 20)], removed=["app1"])
+        self.assertIsNone(self.modifier.getSlotName("app1"))
+        self.assertEqual(self.modifier.getSlotName("app3"), "slot1")
+        self.assertEqual(len(self.modifier.slots), 2)
+        slot1 = self.fake.servers["slot1"]
+        self.assertEqual((slot1['addr'], slot1['port'], slot1['weight'], slot1['state']),
+                         ("10.0.0.3", 8003, 20, "ready"))
+        self.assertIn("    server slot1  10.0.0.3:8003 weight 20\n", self.readConfigFile())
+
+    def testDynamicServerIsAddedAndDeleted(self):
+        self.modifier.applyChanges(added=[("app1", "10.0.0.1", 8001, 10), ("app2", "10.0.0.2", 8002, 10),
+                                          ("app3", "10.0.0.3", 8003, 10)])
+        self.assertEqual(self.modifier.getSlotName("app3"), "app3")
+        self.assertEqual(self.fake.servers["app3"]['state'], "ready")
+        self.assertIn("add server " + Main.HaProxyBackendName + "/app3 10.0.0.3:8003 weight 10",
+                      self.fake.commandsLog)
+
+        self.modifier.applyChanges(removed=["app3"])
+        self.assertNotIn("app3", self.fake.servers)
+        self.assertEqual([slot.slotName for slot in self.modifier.slots], ["slot1", "slot2"])
+        self.assertNotIn("app3", self.readConfigFile())
+
+    def testRejectedBatchIsPersisted(self):
+        self.modifier.applyChanges(added=[("app1", "10.0.0.1", 8001, 10), ("app2", "10.0.0.2", 8002, 10)])
+        # HaProxy already has a server named like the next dynamic one, "add server" is rejected
+        self.fake.handleCommand("add server " + Main.HaProxyBackendName + "/app3 10.0.0.9:9000 weight 1")
+
+        with self.assertRaises(HaproxyRuntimeError):
+            self.modifier.applyChanges(added=[("app3", "10.0.0.3", 8003, 10)], drained=["app1"])
+        self.assertEqual(self.modifier.getSlotName("app3"), "app3")
+        self.assertEqual(self.modifier.slotsByWebServer["app1"].state, "drain")
+        configStr = self.readConfigFile()
+        self.assertIn("    server app3  10.0.0.3:8003 weight 10\n", configStr)
+        self.assertIn("    server slot1  10.0.0.1:8001 weight 10 disabled\n", configStr)
+
+    def testWeightsOfManyWebServersArePushed(self):
+        # 20 web servers: a few % each, the weights are scaled so a 20% change is still sent
+        self.modifier.applyChanges(added=[("app" + str(i + 1), "10.0.0." + str(i + 1), 8001 + i, MaxWeight)
+                                          for i in range(20)])
+        weightSynchronizer = WeightSynchronizer(self.modifier, 0.1, 0)
+        weights = {"app" + str(i + 1): 5.0 for i in range(20)}
+        self.assertEqual(weightSynchronizer.sync(weights), 0)
+        weights["app1"] = 4.0
+        self.assertEqual(weightSynchronizer.sync(weights), 1)
+        self.assertEqual(self.fake.servers["slot1"]['weight'], 205)
+        # Below the dead band (5% of the current weight)
+        weights["app1"] = 4.2
+        self.assertEqual(weightSynchronizer.sync(weights), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from HistoryStore import CounterStruct, HeaderStruct, HistoryFields, HistoryStore, RecordStruct, \
+    StartedOffset
+
+# HistoryStore on a temporary folder: the ring wraps around, a reader never gets the slot of an append in progress,
+# a name registered by another container starts a new history
+
+
+def snapshot(value):
+    return {field: value for field in HistoryFields[1:]}
+
+
+class HistoryStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.folderPath = tempfile.mkdtemp()
+        self.historyStore = HistoryStore(self.folderPath, rawCapacity=4, downsampleSeconds=10, downsampleCapacity=4)
+
+    def tearDown(self):
+        self.historyStore.close()
+        shutil.rmtree(self.folderPath)
+
+    def testRingWrapsAround(self):
+        for i in range(6):
+            self.historyStore.append("app1", 100.0 + i, snapshot(i))
+        self.assertEqual([record[0] for record in self.historyStore.latest("app1", 10)],
+                         [102.0, 103.0, 104.0, 105.0])
+        self.assertEqual([record[1] for record in self.historyStore.query("app1", 103.0, 105.0)], [3.0, 4.0])
+
+    def testAppendInProgressIsNotRead(self):
+        for i in range(6):
+            self.historyStore.append("app1", 100.0 + i, snapshot(i))
+        # Append number 7 has started and half overwritten the oldest record (102.0)
+        ring = self.historyStore.getRing("app1", "raw")
+        CounterStruct.pack_into(ring.map, StartedOffset, 7)
+        RecordStruct.pack_into(ring.map, HeaderStruct.size + 2 * RecordStruct.size, 106.0, *([0.0] * 7))
+        self.assertEqual([record[0] for record in self.historyStore.latest("app1", 10)], [103.0, 104.0, 105.0])
+        self.assertEqual([record[0] for record in self.historyStore.query("app1", 0)], [103.0, 104.0, 105.0])
+
+    def testReusedNameStartsANewHistory(self):
+        self.historyStore.register("app1", "aaa")
+        for i in range(3):
+            self.historyStore.append("app1", 100.0 + i * 10, snapshot(i))
+        # Same container again (e.g. collector restart), the history is kept
+        self.historyStore.register("app1", "aaa")
+        self.assertEqual(len(self.historyStore.latest("app1", 10)), 3)
+
+        self.historyStore.register("app1", "bbb")
+        self.assertEqual(self.historyStore.latest("app1", 10), [])
+        self.assertEqual(self.historyStore.latest("app1", 10, resolution="ds"), [])
+        self.historyStore.append("app1", 200.0, snapshot(7))
+        self.assertEqual([record[0] for record in self.historyStore.latest("app1", 10)], [200.0])
+        self.assertEqual(self.historyStore.containers(), ["app1"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Main
+
+# MetricIngestor on log files in a temporary folder: one deadline for all the reads of a cycle, and the age of the
+# stats taken from the mtime of the log file (stale after "staleStatsAge", expired after "maxStatsAge")
+
+StatsText = ("Cpu 10.00%\nMemory 15MiB\nMemoryUsage 20.00%\nInputTraffic 0B\nOutPutTraffic 0B\n"
+             "BusyThreadsCount 2\nProcessingReqTime 200\n")
+
+
+class MetricIngestorTest(unittest.TestCase):
+    def setUp(self):
+        self.logsFolderPath = tempfile.mkdtemp() + os.sep
+        self.ingestor = Main.MetricIngestor(self.logsFolderPath, 0.2, 0.02, 4, maxStatsAge=60, staleStatsAge=3)
+
+    def tearDown(self):
+        self.ingestor.shutdown()
+        shutil.rmtree(self.logsFolderPath)
+
+    def writeLogFile(self, name, text=StatsText, age=0):
+        path = self.logsFolderPath + name
+        with open(path, "w") as file:
+            file.write(text)
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+
+    def testStalledLogFilesShareOneDeadline(self):
+        webServers = [Main.WebServer("app" + str(i + 1), 8011 + i, 1) for i in range(40)]
+        for webServer in webServers:
+            self.writeLogFile(webServer.name, "Cpu 10.00%\n")
+        for cycle in range(3):
+            startTime = time.monotonic()
+            results = self.ingestor.read(webServers)
+            self.assertLess(time.monotonic() - startTime, 0.4)
+            self.assertTrue(all(result is None or result[0] is None for result in results.values()))
+            # Nothing left queued behind the workers for the next cycle
+            self.assertEqual(self.ingestor.executor._work_queue.qsize(), 0)
+
+    def testAgeComesFromTheLogFile(self):
+        fresh, old, dead = (Main.WebServer(name, 8011, 1) for name in ("app1", "app2", "app3"))
+        self.writeLogFile("app1")
+        self.writeLogFile("app2", age=10)
+        self.writeLogFile("app3", age=3600)
+        self.ingestor.collect([fresh, old, dead])
+
+        self.assertFalse(fresh.getIsStale())
+        self.assertTrue(fresh.hasStats())
+        self.assertTrue(old.getIsStale())
+        self.assertTrue(old.hasStats())
+        self.assertTrue(dead.getIsExpired())
+        self.assertFalse(dead.hasStats())
+        self.assertAlmostEqual(time.time() - dead.statsTimestamp, 3600, delta=5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from MetricSnapshot import parseSize, parseStatsLines
+
+# parseSize on the docker CLI units (decimal and binary) and parseStatsLines on the log files of LogCollector.sh /
+# StatsCollector.py: a malformed or half written file gives None
+
+StatsLines = ['Cpu 0.01%', 'Memory 12.58MiB', 'MemoryUsage 0.21%', 'InputTraffic 1.82kB', 'OutPutTraffic 9.1kB',
+              'BusyThreadsCount 1', 'ProcessingReqTime 200']
+
+
+class MetricSnapshotTest(unittest.TestCase):
+    def testParseSize(self):
+        self.assertEqual(parseSize("0B"), 0.0)
+        self.assertEqual(parseSize("1544192B"), 1544192.0)
+        self.assertEqual(parseSize("1820"), 1820.0)
+        self.assertEqual(parseSize("1.82kB"), 1820.0)
+        self.assertEqual(parseSize("12.58MiB"), 12.58 * 1024 ** 2)
+        self.assertEqual(parseSize("1.5GiB"), 1.5 * 1024 ** 3)
+        self.assertEqual(parseSize("2MB"), 2e6)
+
+    def testParseSizeErrors(self):
+        for text in ("12.58XiB", "MiB", "", "1.2.3kB", "kB12"):
+            with self.assertRaises(ValueError):
+                parseSize(text)
+
+    def testParseStatsLines(self):
+        snapshot = parseStatsLines(StatsLines, 10.0)
+        self.assertEqual((snapshot.cpu, snapshot.memory, snapshot.memoryUsage), (0.01, 12.58 * 1024 ** 2, 0.21))
+        self.assertEqual((snapshot.inputTraffic, snapshot.outPutTraffic), (1820.0, 9100.0))
+        self.assertEqual((snapshot.busyThreadsCount, snapshot.processingReqTime, snapshot.sampleTime), (1, 200, 10.0))
+
+    def testMalformedLines(self):
+        # Half written file
+        self.assertIsNone(parseStatsLines(StatsLines[:4]))
+        self.assertIsNone(parseStatsLines(StatsLines + ['Cpu 1%']))
+        # Missing value, unknown unit, not a number
+        for i, line in ((1, 'Memory'), (1, 'Memory 12.58XB'), (0, 'Cpu abc%'), (5, 'BusyThreadsCount 1.5')):
+            lines = list(StatsLines)
+            lines[i] = line
+            self.assertIsNone(parseStatsLines(lines), line)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from FleetState import FleetDecision
+from ScalingPolicy import ScalingPolicy
+
+# ScalingPolicy.plan: the cooldowns block a vote (scale up after a scale up, scale down after any scaling) and the
+# scale down stops at the number of web servers the others can take while staying "hysteresisBand" under the scale
+# up average threshold (40 - 10 -> 30)
+
+
+def fleetDecision(numberOfActive, scaleUp=False, scaleDown=False):
+    decision = FleetDecision()
+    decision.numberOfCurrentAliveWebServers = numberOfActive
+    decision.scaleUp = scaleUp
+    decision.scaleDown = scaleDown
+    return decision
+
+
+class ScalingPolicyTest(unittest.TestCase):
+    def setUp(self):
+        # targetScore 30, scaleUpAverageThr 40, hysteresisBand 10, maxStep 3, 1..20 web servers, cooldowns 10 / 30 s
+        self.policy = ScalingPolicy(30, 40, 10, 3, 1, 20, 10, 30)
+
+    def testScaleUpCooldown(self):
+        scalingPlan = self.policy.plan(0, fleetDecision(4, scaleUp=True), 45, 0)
+        self.assertEqual((scalingPlan.numberToAdd, scalingPlan.blockedBy), (2, None))
+        scalingPlan = self.policy.plan(5, fleetDecision(6, scaleUp=True), 45, 0)
+        self.assertEqual((scalingPlan.numberToAdd, scalingPlan.blockedBy), (0, "cooldown"))
+        scalingPlan = self.policy.plan(10, fleetDecision(6, scaleUp=True), 45, 0)
+        self.assertEqual((scalingPlan.numberToAdd, scalingPlan.blockedBy), (3, None))
+
+    def testScaleDownCooldown(self):
+        self.policy.plan(0, fleetDecision(4, scaleUp=True), 45, 0)
+        # Within the scale down cooldown of the scale up
+        scalingPlan = self.policy.plan(20, fleetDecision(6, scaleDown=True), 5, 0)
+        self.assertEqual((scalingPlan.numberToRemove, scalingPlan.blockedBy), (0, "cooldown"))
+        scalingPlan = self.policy.plan(30, fleetDecision(6, scaleDown=True), 5, 0)
+        self.assertEqual((scalingPlan.numberToRemove, scalingPlan.blockedBy), (3, None))
+        # Within the scale down cooldown of the scale down
+        scalingPlan = self.policy.plan(50, fleetDecision(3, scaleDown=True), 5, 0)
+        self.assertEqual((scalingPlan.numberToRemove, scalingPlan.blockedBy), (0, "cooldown"))
+        # A scale up is not blocked by a scale down
+        scalingPlan = self.policy.plan(50, fleetDecision(3, scaleUp=True), 45, 0)
+        self.assertEqual((scalingPlan.numberToAdd, scalingPlan.blockedBy), (2, None))
+
+    def testHysteresisBand(self):
+        # 4 * 25 / 3 = 33.3 is above 30, the vote is not applied
+        scalingPlan = self.policy.plan(0, fleetDecision(4, scaleDown=True), 25, 0)
+        self.assertEqual((scalingPlan.numberToRemove, scalingPlan.blockedBy), (0, "hysteresis"))
+        # 4 * 20 / 3 = 26.7 but 4 * 20 / 2 = 40
+        scalingPlan = self.policy.plan(0, fleetDecision(4, scaleDown=True), 20, 0)
+        self.assertEqual((scalingPlan.numberToRemove, scalingPlan.blockedBy), (1, None))
+
+    def testScaleDownLimits(self):
+        # "maxStep" web servers at most, and never under "minWebServers"
+        self.assertEqual(self.policy.plan(0, fleetDecision(10, scaleDown=True), 5, 0).numberToRemove, 3)
+        self.assertEqual(self.policy.plan(100, fleetDecision(2, scaleDown=True), 1, 0).numberToRemove, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
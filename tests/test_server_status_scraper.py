@@ -0,0 +1,84 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ServerStatusScraper import parseServerStatus
+
+# parseServerStatus on "/server-status?auto" bodies and ServerStatus.deriveRates between two reads: the rates and
+# the processing time come from the counter deltas, the averages since the httpd start are kept after a counter
+# reset (httpd restarted)
+
+StatusBody = ("localhost\n"
+              "ServerVersion: Apache/2.4.46 (Unix)\n"
+              "Total Accesses: 120\n"
+              "Total kBytes: 300\n"
+              "Total Duration: 24000\n"
+              "Uptime: 3000\n"
+              "ReqPerSec: .04\n"
+              "BytesPerSec: 102.4\n"
+              "BytesPerReq: 2560\n"
+              "DurationPerReq: 200\n"
+              "BusyWorkers: 2\n"
+              "IdleWorkers: 73\n"
+              "Scoreboard: _W_K....\n")
+
+
+def statusBody(totalAccesses, totalKBytes, totalDuration, uptime):
+    return ("Total Accesses: " + str(totalAccesses) + "\nTotal kBytes: " + str(totalKBytes) + "\nTotal Duration: " +
+            str(totalDuration) + "\nUptime: " + str(uptime) + "\nReqPerSec: .04\nDurationPerReq: 200\n")
+
+
+def readAt(body, sampleTime, previous=None):
+    serverStatus = parseServerStatus(body)
+    serverStatus.sampleTime = sampleTime
+    serverStatus.deriveRates(previous)
+    return serverStatus
+
+
+class ServerStatusScraperTest(unittest.TestCase):
+    def testParse(self):
+        serverStatus = parseServerStatus(StatusBody)
+        self.assertEqual((serverStatus.totalAccesses, serverStatus.totalKBytes, serverStatus.totalDuration,
+                          serverStatus.uptime), (120, 300, 24000, 3000))
+        self.assertEqual((serverStatus.reqPerSec, serverStatus.bytesPerSec, serverStatus.durationPerReq),
+                         (0.04, 102.4, 200.0))
+        self.assertEqual((serverStatus.busyWorkers, serverStatus.idleWorkers), (2, 73))
+        self.assertEqual(serverStatus.scoreboardCounts, {'waiting': 2, 'sending': 1, 'keepalive': 1, 'openSlot': 4})
+        self.assertEqual(serverStatus.processingReqTime(), 200)
+
+    def testMissingAndInvalidFields(self):
+        # Apache < 2.4.35: no duration, the processing time is not known
+        serverStatus = parseServerStatus("Total Accesses: 10\nBusyWorkers: x\nScoreboard: __\n")
+        self.assertEqual(serverStatus.totalAccesses, 10)
+        self.assertIsNone(serverStatus.totalDuration)
+        self.assertEqual(serverStatus.busyWorkers, 0)
+        self.assertEqual(serverStatus.processingReqTime(), 0)
+
+    def testRatesBetweenTwoReads(self):
+        previous = readAt(statusBody(120, 300, 24000, 3000), 10.0)
+        serverStatus = readAt(statusBody(170, 400, 34000, 3002), 12.0, previous)
+        self.assertEqual(serverStatus.reqPerSec, 25.0)
+        self.assertEqual(serverStatus.bytesPerSec, 100 * 1024 / 2)
+        self.assertEqual(serverStatus.bytesPerReq, 100 * 1024 / 50)
+        self.assertEqual(serverStatus.processingReqTime(), 200)
+        # No request since the previous read
+        idle = readAt(statusBody(170, 400, 34000, 3003), 13.0, serverStatus)
+        self.assertEqual((idle.reqPerSec, idle.processingReqTime()), (0.0, 0))
+
+    def testCounterReset(self):
+        previous = readAt(statusBody(5000, 9000, 1000000, 3000), 10.0)
+        # httpd restarted between the reads, the counters start again from 0
+        serverStatus = readAt(statusBody(20, 40, 3000, 2), 12.0, previous)
+        self.assertEqual(serverStatus.reqPerSec, 0.04)
+        self.assertIsNone(serverStatus.recentDurationPerReq)
+        self.assertEqual(serverStatus.processingReqTime(), 200)
+        # The next read derives from the restarted counters
+        nextStatus = readAt(statusBody(40, 60, 7000, 4), 14.0, serverStatus)
+        self.assertEqual(nextStatus.reqPerSec, 10.0)
+        self.assertEqual(nextStatus.processingReqTime(), 200)
+
+
+if __name__ == '__main__':
+    unittest.main()